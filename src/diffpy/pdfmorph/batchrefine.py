@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""batchrefine -- Refine one morph chain against many datasets in lock-step
+"""
+
+import time
+
+import numpy
+
+from diffpy.pdfmorph.refine import RefinementResult
+
+# Termination messages by status, following the MINPACK codes of leastsq
+_messages = {
+    0: "The residual is not finite.",
+    1: "The relative reduction of the cost is at most ftol.",
+    2: "The relative change of the parameters is at most xtol.",
+    4: "The gradient is at most gtol.",
+    5: "The maximum number of iterations was reached.",
+    7: "No further reduction of the cost is possible at machine precision.",
+}
+
+
+class BatchRefiner(object):
+    """Refine one morph chain against many independent datasets.
+
+    Each dataset is a separate least squares problem with the same few
+    parameters. Instead of one optimizer call per dataset, all problems
+    take their Levenberg-Marquardt steps together: the p x p normal
+    equations of the active problems are stacked and solved in one call of
+    numpy.linalg.solve, the finite difference jacobians take one batched
+    evaluation per parameter and converged problems are retired from the
+    active set. This removes the per-call overhead of the optimizer that
+    dominates sweeps over thousands of files with 2 to 6 parameters.
+
+    All datasets must give residuals of the same length, e.g. by resampling
+    them on one grid with MorphRGrid.
+
+    Attributes
+    ----------
+    chain
+        The Morph or MorphChain to refine.
+    x_morph, y_morph
+        Morphed arrays. y_morph is one profile shared by all problems or a
+        stacked array of shape (nproblems, len(x_morph)).
+    x_target, y_target
+        Target arrays. y_target is a stacked array of shape
+        (nproblems, len(x_target)).
+    pars
+        List of names of parameters to be refined.
+    vectorized: bool or None
+        Evaluate the chain once for all active problems, with stacked
+        profiles of shape (nactive, npts) and parameters of shape
+        (nactive, 1). This requires morphs that broadcast over stacked
+        profiles. When False the chain is run for each problem in turn.
+        When None (default) the problems are stacked if the vectorized
+        attribute of the chain is True, as for chains of the built-in
+        morphs.
+    bounds: dict
+        Bounds (lower, upper) of parameters, where None is unbounded. These
+        override the parbounds declared by the morphs. The steps are
+        clipped to the bounds.
+    chunksize: int
+        Number of problems solved together, which bounds the memory taken
+        by the stacked residuals and jacobians. Default 256.
+    maxiter: int
+        Maximum number of iterations. Default 100.
+    ftol, xtol, gtol: float
+        Tolerances on the relative reduction of the cost, the relative
+        change of the parameters and the largest gradient component, as in
+        scipy.optimize.leastsq.
+    values: list
+        Dictionaries with the refined parameters of each problem.
+    results: list
+        RefinementResult of each problem. nfev counts the evaluations of
+        the problem, including those for its jacobian.
+    """
+
+    def __init__(self, chain, x_morph, y_morph, x_target, y_target):
+        self.chain = chain
+        self.x_morph = x_morph
+        self.y_morph = numpy.asarray(y_morph, dtype=float)
+        self.x_target = x_target
+        self.y_target = numpy.atleast_2d(numpy.asarray(y_target, dtype=float))
+        self.pars = []
+        self.vectorized = None
+        self.bounds = {}
+        self.chunksize = 256
+        self.maxiter = 100
+        self.ftol = 1.49012e-8
+        self.xtol = 1.49012e-8
+        self.gtol = 0.0
+        self.values = []
+        self.results = []
+        return
+
+    @property
+    def nproblems(self):
+        """Number of independent problems."""
+        return len(self.y_target)
+
+    def _parameter_bounds(self):
+        """Return the arrays of lower and upper bounds of the parameters."""
+        bounds = dict(getattr(self.chain, "parbounds", {}))
+        bounds.update(self.bounds)
+        lower = []
+        upper = []
+        for p in self.pars:
+            lo, hi = bounds.get(p, (None, None))
+            lower.append(-numpy.inf if lo is None else lo)
+            upper.append(numpy.inf if hi is None else hi)
+        return numpy.array(lower, dtype=float), numpy.array(upper, dtype=float)
+
+    def _morph_profiles(self, index):
+        """Return the morph profiles of the problems."""
+        if self.y_morph.ndim == 1:
+            return numpy.broadcast_to(
+                self.y_morph, (len(index), len(self.y_morph))
+            )
+        return self.y_morph[index]
+
+    def _residuals(self, pvals, index):
+        """Return the residuals of the problems at their parameter values.
+
+        Parameters
+        ----------
+        pvals
+            Array of shape (len(index), len(pars)) of parameter values.
+        index
+            Array of the indices of the problems.
+
+        Returns
+        -------
+        numpy.ndarray
+            Residuals of shape (len(index), npts).
+        """
+        config = self.chain.config
+        y_morph = self._morph_profiles(index)
+        y_target = self.y_target[index]
+        vectorized = self.vectorized
+        if vectorized is None:
+            vectorized = getattr(self.chain, "vectorized", False)
+        if vectorized:
+            config.update(zip(self.pars, pvals.T[:, :, None]))
+            xyallout = self.chain(
+                self.x_morph, y_morph, self.x_target, y_target
+            )
+            return xyallout[3] - xyallout[1]
+        rvecs = []
+        for i in range(len(index)):
+            config.update(zip(self.pars, pvals[i]))
+            xyallout = self.chain(
+                self.x_morph, y_morph[i], self.x_target, y_target[i]
+            )
+            rvecs.append(xyallout[3] - xyallout[1])
+        try:
+            return numpy.array(rvecs, dtype=float)
+        except ValueError:
+            emsg = "The residuals of the problems differ in length."
+            raise ValueError(emsg)
+
+    def _jacobians(self, pvals, rvecs, index, upper):
+        """Return forward difference jacobians of the residuals.
+
+        Each parameter is stepped for all problems at once, so this takes
+        one batched evaluation per parameter. The step is reversed where it
+        would cross the upper bound.
+
+        Returns
+        -------
+        numpy.ndarray
+            Jacobians of shape (len(index), npts, len(pars)).
+        """
+        eps = numpy.finfo(float).eps ** 0.5
+        jac = numpy.empty(rvecs.shape + (len(self.pars),))
+        for j in range(len(self.pars)):
+            h = eps * numpy.maximum(numpy.abs(pvals[:, j]), 1.0)
+            h[pvals[:, j] + h > upper[j]] *= -1
+            stepped = pvals.copy()
+            stepped[:, j] += h
+            rstep = self._residuals(stepped, index)
+            jac[:, :, j] = (rstep - rvecs) / h[:, None]
+        return jac
+
+    def _solve(self, pvals, index):
+        """Refine a chunk of problems in lock-step.
+
+        Parameters
+        ----------
+        pvals
+            Array of shape (len(index), len(pars)) of initial values, which
+            is updated with the solutions.
+        index
+            Array of the indices of the problems.
+
+        Returns
+        -------
+        tuple
+            Arrays of the final costs, the numbers of evaluations and the
+            termination statuses of the problems.
+        """
+        lower, upper = self._parameter_bounds()
+        nprob = len(index)
+        npars = len(self.pars)
+        diagonal = numpy.arange(npars)
+        rvecs = self._residuals(pvals, index)
+        costs = numpy.einsum("km,km->k", rvecs, rvecs)
+        nfev = numpy.ones(nprob, dtype=int)
+        status = numpy.full(nprob, 5)
+        status[~numpy.isfinite(costs)] = 0
+        active = numpy.isfinite(costs)
+        jac = numpy.empty(rvecs.shape + (npars,))
+        stale = active.copy()
+        lam = numpy.full(nprob, 1e-3)
+        nu = numpy.full(nprob, 2.0)
+        for iteration in range(self.maxiter):
+            # Jacobians are recomputed after accepted steps only
+            sel = numpy.flatnonzero(stale & active)
+            if len(sel):
+                jac[sel] = self._jacobians(
+                    pvals[sel], rvecs[sel], index[sel], upper
+                )
+                nfev[sel] += npars
+            stale[:] = False
+            sel = numpy.flatnonzero(active)
+            if len(sel) == 0:
+                break
+            J = jac[sel]
+            Jt = J.transpose(0, 2, 1)
+            A = numpy.matmul(Jt, J)
+            g = numpy.matmul(Jt, rvecs[sel, :, None])[:, :, 0]
+            # Solve the damped normal equations (A + lam diag(A)) d = -g
+            damped = A.copy()
+            damped[:, diagonal, diagonal] += lam[sel, None] * numpy.maximum(
+                A[:, diagonal, diagonal], 1e-12
+            )
+            try:
+                delta = -numpy.linalg.solve(damped, g[:, :, None])[:, :, 0]
+            except numpy.linalg.LinAlgError:
+                delta = -numpy.array(
+                    [
+                        numpy.linalg.lstsq(a, b, rcond=None)[0]
+                        for a, b in zip(damped, g)
+                    ]
+                )
+            trial = numpy.clip(pvals[sel] + delta, lower, upper)
+            delta = trial - pvals[sel]
+            rtrial = self._residuals(trial, index[sel])
+            nfev[sel] += 1
+            ctrial = numpy.einsum("km,km->k", rtrial, rtrial)
+            actual = costs[sel] - ctrial
+            predicted = -2 * numpy.einsum("ki,ki->k", delta, g)
+            predicted -= numpy.einsum("ki,kij,kj->k", delta, A, delta)
+            accept = numpy.isfinite(ctrial) & (actual > 0)
+
+            # Nielsen's update of the damping
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                rho = actual / predicted
+            acc = sel[accept]
+            rej = sel[~accept]
+            lam[acc] *= numpy.maximum(1 / 3, 1 - (2 * rho[accept] - 1) ** 3)
+            nu[acc] = 2.0
+            lam[rej] *= nu[rej]
+            nu[rej] *= 2
+
+            # Convergence tests, as in MINPACK. Rejected steps shrink as the
+            # damping grows and only end the refinement once they vanish.
+            dnorm = numpy.linalg.norm(delta, axis=1)
+            pnorm = numpy.linalg.norm(pvals[sel], axis=1)
+            small_step = accept & (dnorm <= self.xtol * (pnorm + self.xtol))
+            stuck = ~accept & (dnorm <= numpy.finfo(float).eps * pnorm)
+            small_cost = accept & (actual <= self.ftol * costs[sel])
+            small_cost |= costs[sel] == 0
+            small_grad = numpy.abs(g).max(axis=1) <= self.gtol
+            pvals[acc] = trial[accept]
+            rvecs[acc] = rtrial[accept]
+            costs[acc] = ctrial[accept]
+            stale[acc] = True
+            status[sel[stuck]] = 7
+            status[sel[small_step]] = 2
+            status[sel[small_cost]] = 1
+            status[sel[small_grad]] = 4
+            active[sel[stuck | small_step | small_cost | small_grad]] = False
+        return costs, nfev, status
+
+    def refine(self, *args, **kw):
+        """Refine the chain against all datasets.
+
+        Additional arguments are used to specify which parameters are to be
+        refined. If no arguments are passed, then all parameters will be
+        refined. Keywords pass initial values to the parameters, whether or
+        not they are refined. Refined parameters can start from an array
+        with one value per problem.
+
+        Returns
+        -------
+        numpy.ndarray
+            The final scalar residual value of each problem. The refined
+            parameters are placed in the values attribute and the results
+            attribute tells how each refinement ended. The config dictionary
+            keeps the initial values.
+        """
+        config = self.chain.config
+        self.pars = list(args or config.keys())
+        nprob = self.nproblems
+        pvals = numpy.empty((nprob, len(self.pars)))
+        for j, p in enumerate(self.pars):
+            pvals[:, j] = kw.pop(p, config[p])
+        config.update(kw)
+        saved = dict(config)
+        lower, upper = self._parameter_bounds()
+        pvals = numpy.clip(pvals, lower, upper)
+
+        start = time.perf_counter()
+        costs = numpy.empty(nprob)
+        nfev = numpy.empty(nprob, dtype=int)
+        status = numpy.empty(nprob, dtype=int)
+        chunksize = max(1, self.chunksize)
+        try:
+            for first in range(0, nprob, chunksize):
+                chunk = slice(first, first + chunksize)
+                index = numpy.arange(nprob)[chunk]
+                values = pvals[chunk]
+                costs[chunk], nfev[chunk], status[chunk] = self._solve(
+                    values, index
+                )
+                pvals[chunk] = values
+        finally:
+            config.update(saved)
+        elapsed = time.perf_counter() - start
+
+        self.values = []
+        self.results = []
+        for i in range(nprob):
+            self.values.append(dict(zip(self.pars, pvals[i])))
+            self.results.append(
+                RefinementResult(
+                    x=pvals[i].copy(),
+                    cost=costs[i],
+                    nfev=nfev[i],
+                    time=elapsed,
+                    status=int(status[i]),
+                    message=_messages[status[i]],
+                    success=bool(status[i] in (1, 2, 4)),
+                    backend="batch",
+                )
+            )
+        return costs
+
+
+# End class BatchRefiner
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""jointrefine -- Refine the morphs of several datasets together
+"""
+
+import time
+
+import numpy
+from numpy import dot
+from scipy.optimize import least_squares
+from scipy.sparse import lil_matrix
+
+from diffpy.pdfmorph.refine import RefinementResult
+
+
+class JointRefiner(object):
+    """Refine the morph chains of several datasets together.
+
+    Some parameters are shared by all datasets, e.g. a particle radius or
+    qdamp of a temperature series, and the others are refined for each
+    dataset, e.g. scale and stretch. The residuals of all datasets are
+    stacked and refined with scipy.optimize.least_squares. Each residual
+    only depends on the shared parameters and those of its own dataset,
+    which is passed as jac_sparsity. The finite difference jacobian then
+    takes one evaluation per shared parameter and one per parameter of a
+    dataset, however many datasets there are.
+
+    Attributes
+    ----------
+    refiners: list
+        Refiner of each dataset. Their residual functions and parameter
+        bounds are used.
+    shared
+        List of names of the shared parameters.
+    pars
+        List of names of the parameters refined for each dataset.
+    backend_options: dict
+        Keyword arguments passed to least_squares. The method must be
+        "trf" (default) or "dogbox", as "lm" does not support jac_sparsity.
+        x_scale defaults to "jac".
+    values: list
+        Dictionaries with the refined shared and per-dataset parameters of
+        each dataset.
+    result: RefinementResult
+        Summary of the last refinement. Its x holds the shared parameters
+        followed by the parameters of each dataset in turn.
+    """
+
+    def __init__(self, refiners):
+        self.refiners = list(refiners)
+        self.shared = []
+        self.pars = []
+        self.backend_options = {}
+        self.values = []
+        self.result = None
+        return
+
+    def _split(self, pvals):
+        """Return the parameter values of each dataset."""
+        nshared = len(self.shared)
+        npars = len(self.pars)
+        shared = pvals[:nshared]
+        for i in range(len(self.refiners)):
+            start = nshared + i * npars
+            yield numpy.concatenate([shared, pvals[start : start + npars]])
+
+    def _residual(self, pvals):
+        """Stacked residual of all datasets."""
+        return numpy.concatenate(
+            [
+                refiner.residual(p)
+                for refiner, p in zip(self.refiners, self._split(pvals))
+            ]
+        )
+
+    def _sparsity(self, pvals):
+        """Return the pattern of nonzero derivatives of the residual."""
+        sizes = [
+            len(refiner.residual(p))
+            for refiner, p in zip(self.refiners, self._split(pvals))
+        ]
+        nshared = len(self.shared)
+        npars = len(self.pars)
+        sparsity = lil_matrix((sum(sizes), len(pvals)), dtype=int)
+        row = 0
+        for i, size in enumerate(sizes):
+            sparsity[row : row + size, :nshared] = 1
+            col = nshared + i * npars
+            sparsity[row : row + size, col : col + npars] = 1
+            row += size
+        return sparsity
+
+    def refine(self, *args, shared=(), **kw):
+        """Refine the chains of all datasets.
+
+        Parameters
+        ----------
+        args
+            Names of the parameters refined for each dataset.
+        shared
+            Names of the parameters shared by all datasets. These start
+            from their values in the chain of the first dataset, unless
+            given in kw.
+        kw
+            Initial values of parameters, set in the chains of all datasets.
+
+        Returns
+        -------
+        float
+            The final scalar residual value, summed over all datasets.
+            The parameters from the fit are placed in the config
+            dictionaries of the chains and in the values attribute.
+
+        Raises
+        ------
+        ValueError
+            Exception raised if a minimum cannot be found.
+        """
+        self.pars = list(args)
+        self.shared = list(shared)
+        if not self.refiners:
+            return 0.0
+        for refiner in self.refiners:
+            refiner.chain.config.update(kw)
+        config = self.refiners[0].chain.config
+        initial = [config[p] for p in self.shared]
+        lower = []
+        upper = []
+        for i, refiner in enumerate(self.refiners):
+            refiner.pars = self.shared + self.pars
+            bounds = refiner.parameter_bounds()
+            if i == 0:
+                lower.extend(bounds[0][: len(self.shared)])
+                upper.extend(bounds[1][: len(self.shared)])
+            lower.extend(bounds[0][len(self.shared) :])
+            upper.extend(bounds[1][len(self.shared) :])
+            initial.extend(refiner.chain.config[p] for p in self.pars)
+            refiner.clear_cache()
+        lower = numpy.array(lower, dtype=float)
+        upper = numpy.array(upper, dtype=float)
+        initial = numpy.clip(numpy.array(initial, dtype=float), lower, upper)
+
+        options = dict(self.backend_options)
+        options.setdefault("x_scale", "jac")
+        options.setdefault("bounds", (lower, upper))
+        start = time.perf_counter()
+        try:
+            options.setdefault("jac_sparsity", self._sparsity(initial))
+            sol = least_squares(self._residual, initial, **options)
+        finally:
+            for refiner in self.refiners:
+                refiner.clear_cache()
+        result = RefinementResult(
+            x=sol.x,
+            cost=dot(sol.fun, sol.fun),
+            nfev=sol.nfev,
+            njev=sol.njev or 0,
+            time=time.perf_counter() - start,
+            status=sol.status,
+            message=sol.message,
+            success=sol.success,
+            backend="least_squares",
+        )
+        self.result = result
+        if not result.success:
+            raise ValueError(result.message)
+
+        # Place the fit parameters in the configs and evaluate the chains
+        self.values = []
+        for refiner, p in zip(self.refiners, self._split(sol.x)):
+            values = dict(zip(refiner.pars, p))
+            refiner.chain.config.update(values)
+            refiner.chain(
+                refiner.x_morph,
+                refiner.y_morph,
+                refiner.x_target,
+                refiner.y_target,
+            )
+            self.values.append(values)
+        return result.cost
+
+
+# End class JointRefiner
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+
+"""class RGridTerms -- cached r-grid terms for the PDF <--> RDF transforms.
+"""
+
+
+import numpy
+
+
+class RGridTerms(object):
+    """Terms of an r-grid shared by every PDF <--> RDF conversion on it.
+
+    The conversions are written for stacked inputs, where the profiles are
+    arrays of shape (..., len(r)) that share the r-grid.
+
+    Attributes
+    ----------
+    r
+        Copy of the r-grid.
+    rsq
+        r**2, the shape of the PDF baseline in the RDF.
+    rinv
+        1/r, set to zero where r is zero.
+    """
+
+    def __init__(self, r):
+        self.r = numpy.array(r, dtype=float)
+        self.rsq = self.r * self.r
+        self.rinv = numpy.zeros_like(self.r)
+        numpy.divide(1.0, self.r, out=self.rinv, where=self.r != 0)
+        self._buffer = numpy.empty_like(self.r)
+        return
+
+    @classmethod
+    def cached(cls, terms, r):
+        """Return terms if they were computed for r, new terms otherwise.
+
+        The r-grid is compared by value against the stored copy, so terms
+        are recomputed when r is changed in place.
+
+        Parameters
+        ----------
+        terms: RGridTerms or None
+            Previously computed terms.
+        r
+            The r-grid of the profiles to convert.
+
+        Returns
+        -------
+        RGridTerms
+        """
+        if terms is not None and numpy.array_equal(r, terms.r):
+            return terms
+        return cls(r)
+
+    def pdftordf(self, gr, baselineslope, out=None):
+        """Return R(r) = r * (G(r) - r * baselineslope).
+
+        Parameters
+        ----------
+        gr
+            PDFs over the r-grid, of shape (..., len(r)).
+        baselineslope
+            The slope of the PDF baseline, a number or an array of shape
+            (n, 1) for stacked slopes.
+        out
+            Array to store the result in. This may be gr itself. It is not
+            used when the slopes broadcast to a larger shape.
+
+        Returns
+        -------
+        numpy.ndarray
+            The RDFs.
+        """
+        if numpy.ndim(baselineslope):
+            return gr * self.r - self.rsq * baselineslope
+        out = numpy.multiply(gr, self.r, out=out)
+        out -= numpy.multiply(self.rsq, baselineslope, out=self._buffer)
+        return out
+
+    def rdftopdf(self, rr, baselineslope, out=None):
+        """Return G(r) = R(r) / r + r * baselineslope.
+
+        The PDF is set to zero where r is zero.
+
+        Parameters
+        ----------
+        rr
+            RDFs over the r-grid, of shape (..., len(r)).
+        baselineslope
+            The slope of the PDF baseline, a number or an array of shape
+            (n, 1) for stacked slopes.
+        out
+            Array to store the result in. This may be rr itself. It is not
+            used when the slopes broadcast to a larger shape.
+
+        Returns
+        -------
+        numpy.ndarray
+            The PDFs.
+        """
+        if numpy.ndim(baselineslope):
+            return rr * self.rinv + self.r * baselineslope
+        out = numpy.multiply(rr, self.rinv, out=out)
+        out += numpy.multiply(self.r, baselineslope, out=self._buffer)
+        # rinv and the baseline both vanish where r is zero
+        return out
+
+
+# End of class RGridTerms
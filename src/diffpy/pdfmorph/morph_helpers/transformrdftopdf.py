@@ -18,8 +18,7 @@
 """
 
 
-import numpy
-
+from diffpy.pdfmorph.morph_helpers.rgridterms import RGridTerms
 from diffpy.pdfmorph.morphs.morph import LABEL_GR, LABEL_RA, LABEL_RR, Morph
 
 
@@ -37,6 +36,12 @@ class TransformXtalRDFtoPDF(Morph):
     With s = baselineslope,
     G(r) = R(r) / r + r * s
 
+    The PDF is set to zero where r is zero. The r-grid terms are cached per
+    grid, so repeated calls on the same grids, as in a refinement, do not
+    recompute them. The y arrays may hold stacked profiles of shape
+    (..., len(x)) that share the r-grid, and baselineslope may be an array
+    of shape (n, 1) of stacked slopes.
+
     """
 
     # Define input output types
@@ -46,22 +51,27 @@ class TransformXtalRDFtoPDF(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["baselineslope"]
+    vectorized = True
+
+    # Cached RGridTerms of the morph and target grids
+    _morph_terms = None
+    _target_terms = None
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Return corresponding PDF given RDF."""
         Morph.morph(self, x_morph, y_morph, x_target, y_target)
-        morph_baseline = self.baselineslope * self.x_morph_in
-        target_baseline = self.baselineslope * self.x_target_in
-        with numpy.errstate(divide="ignore", invalid="ignore"):
-            self.y_target_out = (
-                self.y_target_in / self.x_target_in + target_baseline
-            )
-        self.y_target_out[self.x_target_in == 0] = 0
-        with numpy.errstate(divide="ignore", invalid="ignore"):
-            self.y_morph_out = (
-                self.y_morph_in / self.x_morph_in + morph_baseline
-            )
-        self.y_morph_out[self.x_target_in == 0] = 0
+        self._morph_terms = RGridTerms.cached(
+            self._morph_terms, self.x_morph_in
+        )
+        self._target_terms = RGridTerms.cached(
+            self._target_terms, self.x_target_in
+        )
+        self.y_morph_out = self._morph_terms.rdftopdf(
+            self.y_morph_out, self.baselineslope, out=self.y_morph_out
+        )
+        self.y_target_out = self._target_terms.rdftopdf(
+            self.y_target_out, self.baselineslope, out=self.y_target_out
+        )
         return self.xyallout
 
 
@@ -14,32 +14,70 @@
 ##############################################################################
 
 """Definition of morphs.
+
+The morph classes are imported from their modules on first access.
 """
 
+from importlib import import_module
 
 from diffpy.pdfmorph.morphs.morph import Morph  # noqa: F401
 from diffpy.pdfmorph.morphs.morphchain import MorphChain  # noqa: F401
-from diffpy.pdfmorph.morphs.morphishape import MorphISphere, MorphISpheroid
-from diffpy.pdfmorph.morphs.morphresolution import MorphResolutionDamping
-from diffpy.pdfmorph.morphs.morphrgrid import MorphRGrid
-from diffpy.pdfmorph.morphs.morphscale import MorphScale
-from diffpy.pdfmorph.morphs.morphshape import MorphSphere, MorphSpheroid
-from diffpy.pdfmorph.morphs.morphshift import MorphShift
-from diffpy.pdfmorph.morphs.morphsmear import MorphSmear
-from diffpy.pdfmorph.morphs.morphstretch import MorphStretch
-
-# List of morphs
-morphs = [
-    MorphRGrid,
-    MorphScale,
-    MorphStretch,
-    MorphSmear,
-    MorphSphere,
-    MorphSpheroid,
-    MorphISphere,
-    MorphISpheroid,
-    MorphResolutionDamping,
-    MorphShift,
+
+# Map of morph class names to the modules that define them
+_morph_modules = dict(
+    MorphFunction="morphfunction",
+    MorphISphere="morphishape",
+    MorphISpheroid="morphishape",
+    MorphQmax="morphqspace",
+    MorphQmin="morphqspace",
+    MorphQSmear="morphqspace",
+    MorphResolutionDamping="morphresolution",
+    MorphRGrid="morphrgrid",
+    MorphRSmear="morphrsmear",
+    MorphScale="morphscale",
+    MorphShift="morphshift",
+    MorphSmear="morphsmear",
+    MorphSphere="morphshape",
+    MorphSpheroid="morphshape",
+    MorphStretch="morphstretch",
+)
+
+# Names in the list of morphs
+_morph_names = [
+    "MorphRGrid",
+    "MorphScale",
+    "MorphStretch",
+    "MorphSmear",
+    "MorphRSmear",
+    "MorphSphere",
+    "MorphSpheroid",
+    "MorphISphere",
+    "MorphISpheroid",
+    "MorphResolutionDamping",
+    "MorphShift",
+    "MorphQSmear",
+    "MorphQmax",
+    "MorphQmin",
 ]
 
+
+def __getattr__(name):
+    """Import morph classes and the list of morphs on first access."""
+    if name in _morph_modules:
+        module = import_module(__name__ + "." + _morph_modules[name])
+        return getattr(module, name)
+    if name == "morphs":
+        # List of morphs
+        return [__getattr__(n) for n in _morph_names]
+    emsg = "module %r has no attribute %r" % (__name__, name)
+    raise AttributeError(emsg)
+
+
+__all__ = ["Morph", "MorphChain", "morphs"] + sorted(_morph_modules)
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_morph_modules) + ["morphs"])
+
+
 # End of file
@@ -18,11 +18,50 @@
 """
 
 
+import numpy
+
 LABEL_RA = "r (A)"  # r-grid
 LABEL_GR = "G (1/A^2)"  # PDF G(r)
 LABEL_RR = "R (1/A)"  # RDF R(r)
 
 
+def stacked_interp(x, xp, fp):
+    """Interpolate stacked profiles like numpy.interp.
+
+    Parameters
+    ----------
+    x
+        The points to evaluate at, of shape (..., m).
+    xp
+        The increasing grid of the profiles.
+    fp
+        The profiles over xp, of shape (..., len(xp)). The leading shapes
+        of x and fp broadcast together.
+
+    Returns
+    -------
+    numpy.ndarray
+        The interpolated profiles, with the values at the ends of xp
+        outside of it.
+    """
+    x = numpy.asarray(x, dtype=float)
+    fp = numpy.asarray(fp, dtype=float)
+    if x.ndim == 1 and fp.ndim == 1:
+        return numpy.interp(x, xp, fp)
+    xp = numpy.asarray(xp, dtype=float)
+    idx = numpy.clip(
+        numpy.searchsorted(xp, x, side="right") - 1, 0, len(xp) - 2
+    )
+    x0 = xp[idx]
+    t = numpy.clip((x - x0) / (xp[idx + 1] - x0), 0.0, 1.0)
+    stack = numpy.broadcast_shapes(x.shape[:-1], fp.shape[:-1])
+    idx = numpy.broadcast_to(idx, stack + idx.shape[-1:])
+    fp = numpy.broadcast_to(fp, stack + fp.shape[-1:])
+    f0 = numpy.take_along_axis(fp, idx, axis=-1)
+    f1 = numpy.take_along_axis(fp, idx + 1, axis=-1)
+    return f0 + t * (f1 - f0)
+
+
 class Morph(object):
     """Base class for implementing a morph given a target.
 
@@ -47,6 +86,15 @@ class Morph(object):
         Descriptive label for the y output array.
     parnames: list
         Names of configuration variables.
+    parbounds: dict
+        Bounds (lower, upper) of the configuration variables that are
+        refined within a range, where None is unbounded. The Refiner keeps
+        the parameters within these bounds.
+    vectorized: bool
+        True if the morph broadcasts over stacked profiles of shape
+        (n, len(x)) and configuration variables of shape (n, 1), so that
+        one call morphs n profiles or parameter values. The stacked outputs
+        are then of shape (n, len(x)).
 
     Instance Attributes
     -------------------
@@ -91,6 +139,8 @@ class Morph(object):
     xoutlabel = "x"
     youtlabel = "y"
     parnames = []
+    parbounds = {}
+    vectorized = False
 
     # Properties
 
@@ -265,8 +315,11 @@ class Morph(object):
         AttributeError
             Name is not available from self.config.
         """
-        if name in self.config:
-            return self.config[name]
+        # config is looked up in __dict__, which avoids recursion when the
+        # object is unpickled before config is set
+        config = self.__dict__.get("config", {})
+        if name in config:
+            return config[name]
         else:
             emsg = "Object has no attribute %r" % name
             raise AttributeError(emsg)
@@ -62,6 +62,11 @@ class MorphChain(list):
         from last morph.
     parnames
         Names of parameters collected from morphs (Read only).
+    parbounds
+        Bounds of parameters collected from morphs (Read only).
+    vectorized
+        True if all morphs broadcast over stacked profiles and parameters
+        (Read only).
 
     Notes
     -----
@@ -110,6 +115,12 @@ class MorphChain(list):
         )
     )
     parnames = property(lambda self: set(p for m in self for p in m.parnames))
+    parbounds = property(
+        lambda self: {p: b for m in self for p, b in m.parbounds.items()}
+    )
+    vectorized = property(
+        lambda self: len(self) > 0 and all(m.vectorized for m in self)
+    )
 
     def __init__(self, config, *args):
         """Initialize the configuration.
@@ -173,8 +184,11 @@ class MorphChain(list):
         AttributeError
             Name is not available from self.config.
         """
-        if name in self.config:
-            return self.config[name]
+        # config is looked up in __dict__, which avoids recursion when the
+        # object is unpickled before config is set
+        config = self.__dict__.get("config", {})
+        if name in config:
+            return config[name]
         else:
             emsg = "Object has no attribute %r" % name
             raise AttributeError(emsg)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+
+"""class MorphFunction -- apply a user-defined function to the morph.
+"""
+
+
+import numpy
+
+from diffpy.pdfmorph.morphs.morph import LABEL_GR, LABEL_RA, Morph
+
+
+class MorphFunction(Morph):
+    """Apply a user-defined function to the morph.
+
+    The function is called as function(r, y, **pars) with the r-grid and
+    profile of the morph and the configuration values of its parameters,
+    and must return the morphed profile. It should be vectorized, so that
+    stacked profiles of shape (..., len(r)) and parameters of shape (n, 1)
+    are morphed in one call, as the vectorized attribute declares.
+
+    Unlike other morphs, the input arrays are not copied. The target arrays
+    and the morph r-grid are passed through as they are, and the morphed
+    profile is whatever the function returns, so the function must not
+    modify its inputs.
+
+    An analytic jacobian can be supplied as jacobian(r, y, **pars). It must
+    return the derivatives of the morphed profile with respect to the
+    parameters, as an array of shape (len(parnames), len(r)) in the order of
+    parnames. The Refiner uses it in place of finite differences when this
+    morph is the last one in the chain and owns all refined parameters.
+
+    Configuration Variables
+    -----------------------
+    The names given in parnames.
+    """
+
+    # Define input output types
+    summary = "Apply a user-defined function to the morph"
+    xinlabel = LABEL_RA
+    yinlabel = LABEL_GR
+    xoutlabel = LABEL_RA
+    youtlabel = LABEL_GR
+    vectorized = True
+
+    # Properties
+
+    pars = property(
+        lambda self: {p: self.config[p] for p in self.parnames},
+        doc="Return a dictionary of the current parameter values",
+    )
+
+    def __init__(
+        self, function, parnames, jacobian=None, config=None, parbounds=None
+    ):
+        """Create a MorphFunction.
+
+        Parameters
+        ----------
+        function
+            Callable function(r, y, **pars) returning the morphed profile.
+        parnames: list
+            Names of the configuration variables passed to function.
+        jacobian
+            Optional callable jacobian(r, y, **pars) returning the
+            derivatives of the morphed profile with respect to parnames.
+        config: dict
+            All configuration variables.
+        parbounds: dict
+            Optional bounds (lower, upper) of the parameters, where None is
+            unbounded.
+        """
+        self.parnames = list(parnames)
+        self.parbounds = dict(parbounds or {})
+        self.function = function
+        self.jacobian = jacobian
+        Morph.__init__(self, config)
+        return
+
+    def morph(self, x_morph, y_morph, x_target, y_target):
+        """Apply the function to the morph."""
+        self.x_morph_in = x_morph
+        self.y_morph_in = y_morph
+        self.x_target_in = x_target
+        self.y_target_in = y_target
+        self.checkConfig()
+        self.x_morph_out = x_morph
+        self.y_morph_out = numpy.asarray(
+            self.function(x_morph, y_morph, **self.pars), dtype=float
+        )
+        self.x_target_out = x_target
+        self.y_target_out = y_target
+        return self.xyallout
+
+    def derivatives(self):
+        """Return the analytic derivatives at the last morph input.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Array of shape (len(parnames), len(r)) with the derivatives of
+            y_morph_out with respect to each parameter, or None if no
+            jacobian was supplied.
+        """
+        if self.jacobian is None:
+            return None
+        jac = self.jacobian(self.x_morph_in, self.y_morph_in, **self.pars)
+        return numpy.asarray(jac, dtype=float)
+
+
+# End of class MorphFunction
@@ -41,6 +41,7 @@ class MorphISphere(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["iradius"]
+    parbounds = {"iradius": (0, None)}
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Apply a scale factor."""
@@ -73,6 +74,7 @@ class MorphISpheroid(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["iradius", "ipradius"]
+    parbounds = {"iradius": (0, None), "ipradius": (0, None)}
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Apply a scale factor."""
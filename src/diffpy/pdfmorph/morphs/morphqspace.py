@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+
+"""class MorphQSpace -- base class for morphs applied in reciprocal space
+class MorphQSmear -- broaden the morph through a Gaussian envelope on F(Q)
+class MorphQmax -- terminate the morph at a lower Qmax
+class MorphQmin -- remove the morph signal below a Qmin
+"""
+
+
+import numpy
+from scipy.fft import dst, idst
+
+from diffpy.pdfmorph.morphs.morph import LABEL_GR, LABEL_RA, Morph
+
+
+class MorphQSpace(Morph):
+    """Apply an envelope to the reduced structure function of the morph.
+
+    The morph G(r) is transformed to F(Q) with a discrete sine transform,
+    multiplied pointwise by the envelope returned by the envelope method and
+    transformed back. This base class applies a unit envelope and should be
+    subclassed.
+
+    The morph must be on a uniform r-grid. It is sampled on a grid anchored
+    at r = 0 with the same spacing, where points below the first r-value are
+    taken to be zero, and zero padded to twice its length to suppress
+    wrap-around at the upper end of the r-range.
+
+    The forward transform is cached and reused for as long as the morph input
+    does not change. During a refinement in which no morph before this one
+    changes the morph data, each evaluation then only costs one
+    multiplication and one inverse transform.
+    """
+
+    # Define input output types
+    summary = "Apply an envelope to the morph in reciprocal space"
+    xinlabel = LABEL_RA
+    yinlabel = LABEL_GR
+    xoutlabel = LABEL_RA
+    youtlabel = LABEL_GR
+    parnames = []
+
+    # Cached (x_morph_in, y_morph_in, r, q, fq) of the last forward transform
+    _qcache = None
+
+    def morph(self, x_morph, y_morph, x_target, y_target):
+        """Apply the envelope to the morph in Q-space."""
+        Morph.morph(self, x_morph, y_morph, x_target, y_target)
+        r, q, fq = self.transform(self.x_morph_in, self.y_morph_in)
+        gr = numpy.zeros_like(r)
+        gr[1:] = idst(fq * self.envelope(q), type=1)
+        self.y_morph_out = numpy.interp(self.x_morph_in, r, gr)
+        return self.xyallout
+
+    def transform(self, x, y):
+        """Return the sine transform of the morph, cached between calls.
+
+        Parameters
+        ----------
+        x
+            Uniformly spaced r-grid.
+        y
+            The PDF over the r-grid.
+
+        Returns
+        -------
+        tuple
+            The anchored r-grid starting at zero, the Q-grid and the
+            unnormalized F(Q), as numpy arrays (r, q, fq).
+        """
+        cache = self._qcache
+        if (
+            cache is not None
+            and numpy.array_equal(cache[0], x)
+            and numpy.array_equal(cache[1], y)
+        ):
+            return cache[2:]
+        dr = x[1] - x[0]
+        npts = int(round(x[-1] / dr))
+        r = dr * numpy.arange(2 * npts + 1)
+        gr = numpy.interp(r, x, y, left=0.0, right=0.0)
+        # G(0) = 0 is implied by the sine basis and left out of the transform
+        q = numpy.pi / (r[-1] + dr) * numpy.arange(1, len(r))
+        fq = dst(gr[1:], type=1)
+        self._qcache = (x.copy(), y.copy(), r, q, fq)
+        return r, q, fq
+
+    def envelope(self, q):
+        """Return the envelope to multiply F(Q) with.
+
+        To be overridden in a derived class.
+        """
+        return numpy.ones_like(q)
+
+
+# End of class MorphQSpace
+
+
+class MorphQSmear(MorphQSpace):
+    """Smear the morph through a Gaussian envelope in Q-space.
+
+    This convolves the PDF with a Gaussian, which is a multiplication of F(Q)
+    by exp(-0.5 * (qsmear * Q)**2). Unlike MorphSmear, this operates directly
+    on the PDF.
+
+    Configuration Variables
+    -----------------------
+    qsmear
+        The standard deviation of the Gaussian, in Angstroms.
+    """
+
+    # Define input output types
+    summary = "Smear morph by desired amount in Q-space"
+    parnames = ["qsmear"]
+
+    def envelope(self, q):
+        """Gaussian damping of F(Q)."""
+        return numpy.exp(-0.5 * (self.qsmear * q) ** 2)
+
+
+# End of class MorphQSmear
+
+
+class MorphQmax(MorphQSpace):
+    """Terminate the morph at a lower Qmax.
+
+    This reproduces the termination ripples of a measurement with a smaller
+    Qmax than that of the morph.
+
+    Configuration Variables
+    -----------------------
+    qmaxcut
+        The Qmax at which F(Q) is truncated.
+
+    Notes
+    -----
+        The cutoff is linearly ramped over one Q-step, so that the morph
+        changes continuously with qmaxcut and the parameter can be refined.
+    """
+
+    # Define input output types
+    summary = "Terminate morph at a lower Qmax"
+    parnames = ["qmaxcut"]
+    parbounds = {"qmaxcut": (0, None)}
+
+    def envelope(self, q):
+        """Step function down at qmaxcut."""
+        dq = q[0]
+        return numpy.clip((self.qmaxcut - q) / dq + 0.5, 0, 1)
+
+
+# End of class MorphQmax
+
+
+class MorphQmin(MorphQSpace):
+    """Remove the signal of the morph below Qmin.
+
+    Configuration Variables
+    -----------------------
+    qmincut
+        The Qmin below which F(Q) is set to zero.
+
+    Notes
+    -----
+        The cutoff is linearly ramped over one Q-step, so that the morph
+        changes continuously with qmincut and the parameter can be refined.
+    """
+
+    # Define input output types
+    summary = "Remove morph signal below a Qmin"
+    parnames = ["qmincut"]
+    parbounds = {"qmincut": (0, None)}
+
+    def envelope(self, q):
+        """Step function up at qmincut."""
+        dq = q[0]
+        return numpy.clip((q - self.qmincut) / dq + 0.5, 0, 1)
+
+
+# End of class MorphQmin
@@ -43,12 +43,13 @@ class MorphResolutionDamping(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_RR
     parnames = ["qdamp"]
+    vectorized = True
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Apply a resolution damping."""
         Morph.morph(self, x_morph, y_morph, x_target, y_target)
         b = numpy.exp(-0.5 * (self.x_morph_in * self.qdamp) ** 2)
-        self.y_morph_out *= b
+        self.y_morph_out = self.y_morph_in * b
         return self.xyallout
 
 
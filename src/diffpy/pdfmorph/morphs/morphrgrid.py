@@ -18,13 +18,78 @@
 """
 
 
+from functools import lru_cache
+
 import numpy
+from numpy.lib.stride_tricks import sliding_window_view
 
-from diffpy.pdfmorph.morphs.morph import LABEL_GR, LABEL_RA, Morph
+from diffpy.pdfmorph.morphs.morph import (
+    LABEL_GR,
+    LABEL_RA,
+    Morph,
+    stacked_interp,
+)
 
 # roundoff tolerance for selecting bounds on arrays.
 epsilon = 1e-8
 
+# supported low-pass filters for decimation
+rfilters = (None, "box", "sinc")
+
+
+@lru_cache(maxsize=32)
+def decimation_kernel(rfilter, ratio):
+    """Return the low-pass kernel for decimating by a step ratio.
+
+    Parameters
+    ----------
+    rfilter: str
+        "box" averages over one output step. "sinc" is a Blackman-windowed
+        sinc with its cutoff at the Nyquist frequency of the output grid.
+    ratio: float
+        Output step over input step, larger than one.
+
+    Returns
+    -------
+    numpy.ndarray
+        The normalized, symmetric kernel over input points. It is shared
+        between calls and must not be modified.
+    """
+    if rfilter == "box":
+        # fractional weights at the ends keep the window one output step wide
+        half = 0.5 * ratio
+        k = numpy.arange(-numpy.ceil(half), numpy.ceil(half) + 1)
+        kernel = numpy.clip(half + 0.5 - numpy.abs(k), 0, 1)
+    elif rfilter == "sinc":
+        # four lobes of the sinc on either side
+        half = numpy.ceil(4 * ratio)
+        k = numpy.arange(-half, half + 1)
+        kernel = numpy.sinc(k / ratio) * numpy.blackman(len(k))
+    else:
+        emsg = "rfilter must be one of %s" % (rfilters,)
+        raise ValueError(emsg)
+    kernel /= kernel.sum()
+    kernel.flags.writeable = False
+    return kernel
+
+
+def nyquistStep(qmax, nyquist=1.0):
+    """Return the r-spacing of a multiple of the Nyquist sampling for Qmax.
+
+    Parameters
+    ----------
+    qmax
+        The Qmax of the PDF.
+    nyquist
+        Multiple of the Nyquist spacing pi/qmax (default 1.0).
+
+    Returns
+    -------
+    float
+        The r-spacing nyquist * pi / qmax.
+    """
+    return nyquist * numpy.pi / qmax
+
 
 class MorphRGrid(Morph):
     """Resample to specified r-grid.
@@ -40,13 +105,26 @@ class MorphRGrid(Morph):
         The upper-bound on the r-range (exclusive within tolerance of 1e-8).
     rstep
         The r-spacing.
+    qmax
+        Optional Qmax of the data. When rstep is not defined, it is set to
+        nyquist times the Nyquist spacing pi/qmax.
+    nyquist
+        Optional multiple of the Nyquist spacing, 1 by default.
+    rfilter
+        Optional low-pass filter, "box" or "sinc", that is applied to an
+        array before it is resampled onto a coarser grid. With the default
+        None the arrays are point-sampled, which aliases noise and features
+        narrower than rstep into the result.
 
     Notes
     -----
-        If any of these is not defined or outside the bounds of the input
-        arrays, then it will be taken to be the most inclusive value from the
-        input arrays. These modified values will be stored as the above
-        attributes.
+        If any of rmin, rmax and rstep is not defined or outside the bounds
+        of the input arrays, then it will be taken to be the most inclusive
+        value from the input arrays. These modified values will be stored as
+        the above attributes.
+
+        The filter assumes uniform input grids. Its kernel depends only on
+        the ratio of the output and input steps and is cached.
     """
 
     # Define input output types
@@ -56,6 +134,7 @@ class MorphRGrid(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["rmin", "rmax", "rstep"]
+    vectorized = True
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Resample arrays onto specified grid."""
@@ -72,20 +151,60 @@ class MorphRGrid(Morph):
             self.rmin = rmininc
         if self.rmax is None or self.rmax > rmaxinc:
             self.rmax = rmaxinc
+        qmax = self.config.get("qmax")
+        if self.rstep is None and qmax:
+            nyquist = self.config.get("nyquist")
+            self.rstep = nyquistStep(qmax, 1.0 if nyquist is None else nyquist)
         if self.rstep is None or self.rstep < rstepinc:
             self.rstep = rstepinc
         # Make sure that rmax is exclusive
         self.x_morph_out = numpy.arange(
             self.rmin, self.rmax - epsilon, self.rstep
         )
-        self.y_morph_out = numpy.interp(
-            self.x_morph_out, self.x_morph_in, self.y_morph_in
+        self.y_morph_out = stacked_interp(
+            self.x_morph_out,
+            self.x_morph_in,
+            self.lowpass(self.y_morph_in, r_step_morph),
         )
         self.x_target_out = self.x_morph_out.copy()
-        self.y_target_out = numpy.interp(
-            self.x_target_out, self.x_target_in, self.y_target_in
+        self.y_target_out = stacked_interp(
+            self.x_target_out,
+            self.x_target_in,
+            self.lowpass(self.y_target_in, r_step_target),
         )
         return self.xyallout
 
+    def lowpass(self, y, step):
+        """Filter an array for resampling at rstep.
+
+        Parameters
+        ----------
+        y
+            The array over a uniform grid, or stacked arrays of shape
+            (..., len(grid)).
+        step
+            The spacing of its grid.
+
+        Returns
+        -------
+        numpy.ndarray
+            The filtered array, or y itself when no filter is set or rstep
+            is not coarser than step.
+        """
+        rfilter = self.config.get("rfilter")
+        ratio = self.rstep / step
+        if rfilter is None or ratio <= 1 + epsilon:
+            return y
+        kernel = decimation_kernel(rfilter, round(ratio, 6))
+        npad = len(kernel) // 2
+        if numpy.ndim(y) > 1:
+            pads = [(0, 0)] * (numpy.ndim(y) - 1) + [(npad, npad)]
+            ypad = numpy.pad(y, pads, mode="edge")
+            # the kernel is symmetric
+            windows = sliding_window_view(ypad, len(kernel), axis=-1)
+            return numpy.dot(windows, kernel)
+        ypad = numpy.pad(y, npad, mode="edge")
+        return numpy.convolve(ypad, kernel, mode="valid")
+
 
 # End of class MorphRGrid
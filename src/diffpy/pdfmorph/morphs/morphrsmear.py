@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""class MorphRSmear -- smear the morph with an r-dependent width.
+"""
+
+
+import numpy
+from scipy.sparse import dia_matrix
+
+from diffpy.pdfmorph.morphs.morph import LABEL_RA, LABEL_RR, Morph
+
+
+class MorphRSmear(Morph):
+    """Smear the morph function with a Gaussian whose width varies with r.
+
+    The width of the Gaussian is
+
+        sigma(r) = sqrt(rsmear**2 + rsmear1 * r + rsmear2 * r**2),
+
+    which follows the growth of the thermal broadening with r in the style
+    of the delta1 and delta2 correlated-motion terms. Each point of the RDF
+    is spread over a Gaussian of the width at its own r and normalized, so
+    that the integrated magnitude of the RDF does not change. Note that this
+    operates on the RDF. Inputs are not automatically converted to the RDF.
+
+    The convolution is a sparse banded operator truncated at truncate times
+    the largest width, so its cost is proportional to the number of points
+    times the band width. The band structure depends only on the r-grid and
+    the band width and is kept between evaluations.
+
+    Configuration Variables
+    -----------------------
+    rsmear
+        The width of the Gaussian at r = 0, in Angstroms.
+    rsmear1
+        The linear coefficient of the variance, in Angstroms. Zero when not
+        set.
+    rsmear2
+        The quadratic coefficient of the variance. Zero when not set.
+
+    Notes
+    -----
+        The morph must be on a uniform r-grid. Negative variances are taken
+        to be zero.
+    """
+
+    # Define input output types
+    summary = "Smear morph by an r-dependent amount"
+    xinlabel = LABEL_RA
+    yinlabel = LABEL_RR
+    xoutlabel = LABEL_RA
+    youtlabel = LABEL_RR
+    parnames = ["rsmear", "rsmear1", "rsmear2"]
+
+    # Number of widths at which the Gaussian is truncated
+    truncate = 5.0
+
+    # Cached (r, offsets, exponents) of the band structure
+    _band = None
+
+    def morph(self, x_morph, y_morph, x_target, y_target):
+        """Smear the morph with the r-dependent Gaussian."""
+        Morph.morph(self, x_morph, y_morph, x_target, y_target)
+        self.config.setdefault("rsmear1", 0.0)
+        self.config.setdefault("rsmear2", 0.0)
+        sigma = self.width(self.x_morph_in)
+        if not sigma.any():
+            return self.xyallout
+        self.y_morph_out = self.operator(self.x_morph_in, sigma).dot(
+            self.y_morph_in
+        )
+        return self.xyallout
+
+    def width(self, r):
+        """Return the width of the Gaussian over the r-grid."""
+        var = self.rsmear**2 + self.rsmear1 * r + self.rsmear2 * r * r
+        return numpy.sqrt(numpy.maximum(var, 0.0))
+
+    def operator(self, r, sigma):
+        """Return the banded smearing operator.
+
+        Parameters
+        ----------
+        r
+            Uniformly spaced r-grid.
+        sigma
+            The width of the Gaussian at each point of r.
+
+        Returns
+        -------
+        scipy.sparse.dia_matrix
+            The operator of shape (len(r), len(r)), whose column j is the
+            normalized Gaussian spread of the point at r[j].
+        """
+        dr = r[1] - r[0]
+        nband = int(numpy.ceil(self.truncate * sigma.max() / dr))
+        nband = min(nband, len(r) - 1)
+        offsets, exponents = self.band(r, nband)
+        # points of zero width are left in place
+        sigma = numpy.maximum(sigma, 1e-3 * dr)
+        data = numpy.exp(exponents / (sigma * sigma))
+        data /= data.sum(axis=0)
+        return dia_matrix((data, offsets), shape=(len(r), len(r)))
+
+    def band(self, r, nband):
+        """Return the band structure, cached between calls.
+
+        Parameters
+        ----------
+        r
+            Uniformly spaced r-grid.
+        nband
+            Number of diagonals on either side of the main diagonal.
+
+        Returns
+        -------
+        tuple
+            The diagonal offsets and -0.5 times the squared r-distance of
+            each diagonal to the main one, as a column vector.
+        """
+        band = self._band
+        if (
+            band is not None
+            and len(band[1]) == 2 * nband + 1
+            and numpy.array_equal(band[0], r)
+        ):
+            return band[1:]
+        offsets = numpy.arange(-nband, nband + 1)
+        exponents = -0.5 * (offsets * (r[1] - r[0]))[:, numpy.newaxis] ** 2
+        self._band = (r.copy(), offsets, exponents)
+        return offsets, exponents
+
+
+# End of class MorphRSmear
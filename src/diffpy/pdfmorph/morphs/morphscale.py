@@ -43,11 +43,12 @@ class MorphScale(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["scale"]
+    vectorized = True
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Apply a scale factor."""
         Morph.morph(self, x_morph, y_morph, x_target, y_target)
-        self.y_morph_out *= self.scale
+        self.y_morph_out = self.y_morph_in * self.scale
         return self.xyallout
 
 
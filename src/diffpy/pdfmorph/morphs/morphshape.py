@@ -43,12 +43,14 @@ class MorphSphere(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["radius"]
+    parbounds = {"radius": (0, None)}
+    vectorized = True
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Apply a scale factor."""
         Morph.morph(self, x_morph, y_morph, x_target, y_target)
         f = _sphericalCF(x_morph, 2 * self.radius)
-        self.y_morph_out *= f
+        self.y_morph_out = self.y_morph_in * f
         return self.xyallout
 
 
@@ -74,6 +76,7 @@ class MorphSpheroid(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["radius", "pradius"]
+    parbounds = {"radius": (0, None), "pradius": (0, None)}
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Apply a scale factor."""
@@ -97,15 +100,24 @@ def _sphericalCF(r, psize):
     r
         Distance of interaction.
     psize
-        The particle diameter.
+        The particle diameter, a number or an array of shape (n, 1) for
+        stacked functions of shape (n, len(r)).
     """
-    f = numpy.zeros_like(r)
-    if psize > 0:
+    if numpy.ndim(psize) == 0:
+        f = numpy.zeros_like(r)
+        if psize > 0:
+            x = r / psize
+            g = 1.0 - 1.5 * x + 0.5 * x * x * x
+            g[x > 1] = 0  # Assume zero atomic density outside particle
+            f += g
+        return f
+    psize = numpy.asarray(psize, dtype=float)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
         x = r / psize
-        g = 1.0 - 1.5 * x + 0.5 * x * x * x
-        g[x > 1] = 0  # Assume zero atomic density outside particle
-        f += g
-    return f
+    # Assume zero atomic density outside particle
+    inside = (psize > 0) & (x <= 1)
+    x = numpy.where(inside, x, 1.0)
+    return numpy.where(inside, 1.0 - 1.5 * x + 0.5 * x * x * x, 0.0)
 
 
 def _spheroidalCF(r, erad, prad):
@@ -18,9 +18,12 @@
 """
 
 
-import numpy
-
-from diffpy.pdfmorph.morphs.morph import LABEL_GR, LABEL_RA, Morph
+from diffpy.pdfmorph.morphs.morph import (
+    LABEL_GR,
+    LABEL_RA,
+    Morph,
+    stacked_interp,
+)
 
 
 class MorphShift(Morph):
@@ -44,6 +47,7 @@ class MorphShift(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["hshift", "vshift"]
+    vectorized = True
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Apply the shifts."""
@@ -58,8 +62,8 @@ class MorphShift(Morph):
 
         Morph.morph(self, x_morph, y_morph, x_target, y_target)
         r = self.x_morph_in - hshift
-        self.y_morph_out = numpy.interp(r, self.x_morph_in, self.y_morph_in)
-        self.y_morph_out += vshift
+        self.y_morph_out = stacked_interp(r, self.x_morph_in, self.y_morph_in)
+        self.y_morph_out = self.y_morph_out + vshift
         return self.xyallout
 
 
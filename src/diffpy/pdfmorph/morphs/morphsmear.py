@@ -20,7 +20,56 @@
 
 import numpy
 
-from diffpy.pdfmorph.morphs.morph import LABEL_RA, LABEL_RR, Morph
+from diffpy.pdfmorph.morphs.morph import (
+    LABEL_RA,
+    LABEL_RR,
+    Morph,
+    stacked_interp,
+)
+
+
+def _stacked_smear(r, rr, smear):
+    """Smear stacked RDFs as MorphSmear does a single one.
+
+    The full convolutions are taken with FFTs. Rows with zero smear are
+    returned unchanged.
+
+    Parameters
+    ----------
+    r
+        The r-grid.
+    rr
+        RDFs of shape (..., len(r)).
+    smear
+        The smear, a number or an array of shape (n, 1).
+
+    Returns
+    -------
+    numpy.ndarray
+        The smeared RDFs, of the broadcast shape of rr and smear.
+    """
+    smear = numpy.asarray(smear, dtype=float)
+    r0 = r[len(r) // 2]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        gaussian = numpy.exp(-0.5 * ((r - r0) / smear) ** 2)
+    # zero smear is a convolution with a delta function
+    gaussian = numpy.where(smear == 0, r == r0, gaussian)
+    n = len(r)
+    nfull = 2 * n - 1
+    nfft = 1 << (nfull - 1).bit_length()
+    c = numpy.fft.irfft(
+        numpy.fft.rfft(rr, nfft) * numpy.fft.rfft(gaussian, nfft), nfft
+    )[..., :nfull]
+    # line up the centroids of the convolutions with those of the RDFs
+    x1 = numpy.arange(n, dtype=float)
+    xc = numpy.arange(nfull, dtype=float)
+    c1idx = numpy.sum(rr * x1, axis=-1) / numpy.sum(rr, axis=-1)
+    ccidx = numpy.sum(c * xc, axis=-1) / numpy.sum(c, axis=-1)
+    shift = (ccidx - c1idx)[..., None]
+    rrbroad = stacked_interp(x1 + shift, xc, c)
+    # Normalize so that the integrated magnitude of the RDF doesn't change.
+    rrbroad /= numpy.sum(gaussian, axis=-1, keepdims=True)
+    return rrbroad
 
 
 class MorphSmear(Morph):
@@ -42,18 +91,23 @@ class MorphSmear(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_RR
     parnames = ["smear"]
+    vectorized = True
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Resample arrays onto specified grid."""
         Morph.morph(self, x_morph, y_morph, x_target, y_target)
 
-        if self.smear == 0:
+        if numpy.all(self.smear == 0):
             return self.xyallout
 
-        # The Gaussian to convolute with. No need to normalize, we'll do that
-        # later.
         r = self.x_morph_in
         rr = self.y_morph_in
+        if numpy.ndim(self.smear) or numpy.ndim(rr) > 1:
+            self.y_morph_out = _stacked_smear(r, rr, self.smear)
+            return self.xyallout
+
+        # The Gaussian to convolute with. No need to normalize, we'll do that
+        # later.
         r0 = r[len(r) // 2]
         gaussian = numpy.exp(-0.5 * ((r - r0) / self.smear) ** 2)
 
@@ -20,7 +20,12 @@
 
 import numpy
 
-from diffpy.pdfmorph.morphs.morph import LABEL_GR, LABEL_RA, Morph
+from diffpy.pdfmorph.morphs.morph import (
+    LABEL_GR,
+    LABEL_RA,
+    Morph,
+    stacked_interp,
+)
 
 
 class MorphStretch(Morph):
@@ -42,15 +47,17 @@ class MorphStretch(Morph):
     xoutlabel = LABEL_RA
     youtlabel = LABEL_GR
     parnames = ["stretch"]
+    parbounds = {"stretch": (-1, None)}
+    vectorized = True
 
     def morph(self, x_morph, y_morph, x_target, y_target):
         """Resample arrays onto specified grid."""
         Morph.morph(self, x_morph, y_morph, x_target, y_target)
-        if self.stretch == 0:
+        if numpy.all(self.stretch == 0):
             return self.xyallout
 
         r = self.x_morph_in / (1.0 + self.stretch)
-        self.y_morph_out = numpy.interp(r, self.x_morph_in, self.y_morph_in)
+        self.y_morph_out = stacked_interp(r, self.x_morph_in, self.y_morph_in)
         return self.xyallout
 
 
@@ -24,27 +24,27 @@ else:
 
 import matplotlib.pyplot as plt
 
-from diffpy.pdfmorph import morph_helpers, morphs
+from diffpy.pdfmorph import morphs
 from diffpy.pdfmorph import refine as ref
-from diffpy.pdfmorph import tools
+from diffpy.pdfmorph import registry, tools
 
-# map of operation dict
+# map of operations to the registered morphs they apply, operations that are
+# not listed here apply the morph registered under their own name
 # TODO: include morphing on psize
 _morph_step_dict = dict(
-    scale=morphs.MorphScale,
-    stretch=morphs.MorphStretch,
-    smear=[
-        morph_helpers.TransformXtalPDFtoRDF,
-        morphs.MorphSmear,
-        morph_helpers.TransformXtalRDFtoPDF,
-    ],
-    qdamp=morphs.MorphResolutionDamping,
+    smear=["pdftordf", "smear", "rdftopdf"],
+    rsmear=["pdftordf", "rsmear", "rdftopdf"],
 )
 _default_config = dict(
     scale=None, stretch=None, smear=None, baselineslope=None, qdamp=None
 )
 
 
+def _morph_steps(operation):
+    """Return the registered morph names applied by an operation."""
+    return _morph_step_dict.get(operation, [operation])
+
+
 def morph_default_config(**kwargs):
     """function to generate default morph configuration
 
@@ -64,8 +64,9 @@ def morph_default_config(**kwargs):
     """
     rv = dict(_default_config)
     # protect against foreign keys
+    operations = registry.available_morphs()
     for k in kwargs.keys():
-        if k not in rv:
+        if k not in rv and k not in operations:
             e = "operation: %s is not currently supported!" % k
             raise ValueError(e)
     rv.update(**kwargs)
@@ -81,10 +82,26 @@ def pdfmorph(
     rmin=None,
     rmax=None,
     rstep=None,
+    rfilter=None,
+    qmax=None,
+    nyquist=None,
     pearson=False,
     add_pearson=False,
     fixed_operations=None,
     refine=True,
+    backend="leastsq",
+    backend_options=None,
+    multistart=None,
+    multistart_options=None,
+    pyramid=None,
+    varpro=False,
+    max_nfev=None,
+    time_limit=None,
+    rw_target=None,
+    schedule=None,
+    auto_init=False,
+    scan=None,
+    callback=None,
     verbose=False,
     **kwargs,
 ):
@@ -110,6 +127,14 @@ def pdfmorph(
         A value to specify upper r-limit of morph operations.
     rstep: float, optional
         A value to specify rstep of morph operations.
+    rfilter: str, optional
+        Low-pass filter, 'box' or 'sinc', applied before resampling onto
+        a coarser rstep. Default to None, which point-samples the data.
+    qmax: float, optional
+        Qmax of the data. When rstep is None, the morph operations use
+        the Nyquist spacing pi/qmax as rstep. Default to None.
+    nyquist: float, optional
+        Multiple of the Nyquist spacing used with qmax. Default to 1.
     pearson: Bool, optional
         Option to include Pearson coefficient as a minimizing target
          during morphing. Default to False.
@@ -123,6 +148,60 @@ def pdfmorph(
         Option to execute the minimization step in morphing. If False,
         the morphing will be applied with parameter values specified in
         `morph_config`. Default to True.
+    backend: str, optional
+        Optimizer used in the refinement, see
+        ``diffpy.pdfmorph.refine.Refiner.backend``. Default to 'leastsq'.
+    backend_options: dict, optional
+        Keyword arguments passed to the optimizer. Default to None.
+    multistart: int, optional
+        Number of additional starting points to refine all parameters
+        from, in parallel, keeping the best solution. See
+        ``diffpy.pdfmorph.refine.Refiner.multistart``. Default to None,
+        which refines from the given values only.
+    multistart_options: dict, optional
+        Keyword arguments 'ranges', 'processes' and 'seed' passed to
+        ``Refiner.multistart``. Default to None.
+    pyramid: list, optional
+        Multiples of rstep to refine on before the full resolution, e.g.
+        ``[8, 2]``. See ``diffpy.pdfmorph.refine.Refiner.pyramid``.
+        Default to None.
+    varpro: bool, optional
+        Option to solve the linear parameters scale and vshift in closed
+        form during the refinement of the other parameters. See
+        ``diffpy.pdfmorph.refine.Refiner.varpro``. Default to False.
+    max_nfev: int, optional
+        Maximum number of residual evaluations of the whole call, over all
+        stages of the schedule and the multi-start refinement. Default to
+        None.
+    time_limit: float, optional
+        Maximum wall time of the refinements of the whole call in seconds.
+        Default to None.
+    rw_target: float, optional
+        Rw at which the refinement stops early. Default to None.
+        A refinement that reaches one of these budgets keeps the best
+        parameters found without raising and skips the remaining stages,
+        and ``result.stopped`` tells which budget was reached.
+    schedule: str or list, optional
+        Stages of the refinement, as the name of a schedule in
+        ``diffpy.pdfmorph.refine.schedules`` or a list of stages. See
+        ``diffpy.pdfmorph.refine.Refiner.refine_schedule``. By default all
+        parameters are refined at once, after smear and scale when smear is
+        refined. With multistart, the multi-start refinement replaces the
+        last stage.
+    auto_init: bool, optional
+        Option to estimate the initial values of the refined scale, stretch,
+        smear, qdamp and radius from the morph and target before the
+        refinement. See ``diffpy.pdfmorph.tools.estimateInitial``. Default
+        to False.
+    scan: dict, optional
+        Values of refined parameters to evaluate Rw over before the
+        refinement, e.g. ``{"stretch": numpy.linspace(-0.01, 0.01, 200)}``.
+        The refinement starts from the grid point with the lowest Rw. See
+        ``diffpy.pdfmorph.refine.Refiner.scan``. Default to None.
+    callback: callable, optional
+        Function called after each evaluation of the residual. See
+        ``diffpy.pdfmorph.refine.Refiner.callback`` and
+        ``diffpy.pdfmorph.trace.TraceRecorder``. Default to None.
     verbose: bool, optional
         Option to print full result after morph. Default to False.
     kwargs: dict, optional
@@ -135,6 +214,11 @@ def pdfmorph(
             - 'smear'
             - 'baselineslope'
             - 'qdamp'
+            - 'rsmear', with the optional 'rsmear1' and 'rsmear2'
+
+        Any other operation in ``diffpy.pdfmorph.registry`` is applied
+        when its name is given with a value that is not None, and its
+        parameters are refined from the values given here.
 
     Returns
     -------
@@ -154,6 +238,21 @@ def pdfmorph(
         - pcc: float
               The pearson correlation coefficient between morphed
                data and referenced data
+        - result: diffpy.pdfmorph.refine.RefinementResult
+              Summary of the last refinement, None when there was no
+              refinement
+        - multistart: diffpy.pdfmorph.refine.MultistartResult
+              Summary of all starts when multistart is used, None
+              otherwise
+        - stderr: dict
+              Standard errors of the refined parameters, empty when the
+              refinement gave no covariance
+        - correlation: dict
+              Correlation coefficients ``correlation[p][q]`` of the
+              refined parameters
+        - scan: diffpy.pdfmorph.refine.ScanResult
+              The Rw and Pearson landscapes when scan is used, None
+              otherwise
 
     Examples
     --------
@@ -173,33 +272,44 @@ def pdfmorph(
     print(morph_rv_dict['rw'])
     """
     refpars = []
+    multistart_result = None
+    scan_result = None
     # input config
     rv_cfg = dict(kwargs)
     # configure morph operations
+    operations = registry.available_morphs()
     active_morphs = [
         k
         for k, v in rv_cfg.items()
-        if (v is not None) and k in _morph_step_dict
+        if (v is not None) and k in operations and k != "rgrid"
     ]
     rv_cfg["rmin"] = rmin
     rv_cfg["rmax"] = rmax
     rv_cfg["rstep"] = rstep
-    # configure smear, guess baselineslope when it is not provided
-    if rv_cfg.get("smear") is not None and rv_cfg.get("baselineslope") is None:
+    if rfilter is not None:
+        rv_cfg["rfilter"] = rfilter
+    if qmax is not None:
+        rv_cfg["qmax"] = qmax
+        rv_cfg["nyquist"] = nyquist
+    # operations through the RDF need a baselineslope, guess it when it is
+    # not provided
+    rdf_morphs = [k for k in active_morphs if "pdftordf" in _morph_steps(k)]
+    if rdf_morphs and rv_cfg.get("baselineslope") is None:
         rv_cfg["baselineslope"] = -0.5
     # config dict defines initial guess of parameters
     chain = morphs.MorphChain(rv_cfg)
     # rgrid
-    chain.append(morphs.MorphRGrid())
+    chain.append(registry.get_morph("rgrid")())
     # configure morph chain
     for k in active_morphs:
-        morph_cls = _morph_step_dict[k]
-        if k == "smear":
-            [chain.append(el()) for el in morph_cls]
-            refpars.append("baselineslope")
-        else:
-            chain.append(morph_cls())
-        refpars.append(k)
+        for step in _morph_steps(k):
+            morph = registry.get_morph(step)()
+            chain.append(morph)
+            refpars.extend(
+                p
+                for p in morph.parnames
+                if p not in refpars and rv_cfg.get(p) is not None
+            )
     # exclude fixed options
     if fixed_operations:
         if not isinstance(fixed_operations, Iterable):
@@ -212,16 +322,46 @@ def pdfmorph(
         refiner.residual = refiner._pearson
     if add_pearson:
         refiner.residual = refiner._add_pearson
+    refiner.backend = backend
+    refiner.pyramid = pyramid
+    refiner.varpro = varpro
+    refiner.max_nfev = max_nfev
+    refiner.time_limit = time_limit
+    refiner.rw_target = rw_target
+    refiner.callback = callback
+    if backend_options:
+        refiner.backend_options = dict(backend_options)
+    # estimate the initial parameters
+    if auto_init:
+        rv_cfg.update(
+            tools.estimateInitial(
+                x_morph, y_morph, x_target, y_target, refpars
+            )
+        )
+    # scan the grid and start from its best point
+    if scan:
+        unknown = set(scan) - set(refpars)
+        if unknown:
+            e = "scan: %s are not refined parameters!" % ", ".join(unknown)
+            raise ValueError(e)
+        scan_result = refiner.scan(scan)
+        rv_cfg.update(scan_result.best)
     # execute morphing
     if refpars and refine:
-        # This works better when we adjust scale and smear first.
-        if "smear" in refpars:
-            rptemp = ["smear"]
-            if "scale" in refpars:
-                rptemp.append("scale")
-            refiner.refine(*rptemp)
-        # Refine all params
-        refiner.refine(*refpars)
+        if schedule is None:
+            schedule = ref.default_schedule(refpars)
+        if multistart:
+            # the multi-start refinement replaces the last stage, within
+            # the same budgets
+            stages = ref.get_schedule(schedule)[:-1]
+            with refiner.budget():
+                refiner.refine_schedule(stages, *refpars)
+                if refiner.result is None or not refiner.result.stopped:
+                    multistart_result = refiner.multistart(
+                        multistart, *refpars, **(multistart_options or {})
+                    )
+        else:
+            refiner.refine_schedule(schedule, *refpars)
     else:
         # no operation if refine=False or refpars is empty list
         chain(x_morph, y_morph, x_target, y_target)
@@ -229,6 +369,7 @@ def pdfmorph(
     # summary
     rw = tools.getRw(chain)
     pcc = tools.get_pearson(chain)
+    stderr, correlation = refiner.uncertainties()
     # restore rgrid
     chain[0] = morphs.Morph()
     chain(x_morph, y_morph, x_target, y_target)
@@ -239,13 +380,30 @@ def pdfmorph(
             print("\n".join(fixed_operations))
         print("== INFO: Refined morph parameters ==:\n")
         output = "\n".join(
-            ["# %s = %f" % (k, v) for k, v in rv_cfg.items() if v is not None]
+            [
+                "# %s = %f" % (k, v)
+                for k, v in rv_cfg.items()
+                if v is not None and k != "rfilter"
+            ]
+        )
+        output += "".join(
+            "\n# %s_stderr = %f" % (k, v) for k, v in stderr.items()
         )
         output += "\n# Rw = %f" % rw
         output += "\n# Pearson = %f" % pcc
         print(output)
 
-    rv_dict = dict(morph_chain=chain, morphed_config=rv_cfg, rw=rw, pcc=pcc)
+    rv_dict = dict(
+        morph_chain=chain,
+        morphed_config=rv_cfg,
+        rw=rw,
+        pcc=pcc,
+        result=refiner.result,
+        multistart=multistart_result,
+        stderr=stderr,
+        correlation=correlation,
+        scan=scan_result,
+    )
     return rv_dict
 
 
@@ -33,6 +33,7 @@ def single_morph_output(
     xy_out=None,
     verbose=False,
     stdout_flag=False,
+    correlation=None,
 ):
     """Helper function for printing details about a single morph.
     Handles both printing to terminal and printing to a file.
@@ -42,7 +43,9 @@ def single_morph_output(
     morph_inputs: dict
         Parameters given by the user.
     morph_results: dict
-        Resulting data after morphing.
+        Resulting data after morphing. The standard errors of refined
+        parameters, under keys ending in "_stderr", are only printed when
+        verbose.
     save_file
         Name of file to print to. If None (default) print to terminal.
     morph_file
@@ -55,6 +58,9 @@ def single_morph_output(
         Print additional details about the morph when True (default False).
     stdout_flag: bool
         Print to terminal when True (default False).
+    correlation: dict
+        Correlation coefficients correlation[p][q] of the refined
+        parameters, printed when verbose.
     """
 
     # Input and output parameters
@@ -68,8 +74,18 @@ def single_morph_output(
 
     morphs_out = "# Optimized morphing parameters:\n"
     morphs_out += "\n".join(
-        f"# {key} = {morph_results[key]:.6f}" for key in morph_results.keys()
+        f"# {key} = {morph_results[key]:.6f}"
+        for key in morph_results.keys()
+        if verbose or not key.endswith("_stderr")
     )
+    if verbose and correlation:
+        pars = list(correlation.keys())
+        morphs_out += "\n# Correlations of the refined parameters:\n"
+        morphs_out += "\n".join(
+            f"# {p}, {q} = {correlation[p][q]:.6f}"
+            for i, p in enumerate(pars)
+            for q in pars[i + 1 :]
+        )
 
     # Printing to terminal
     if stdout_flag:
@@ -15,16 +15,20 @@
 
 from __future__ import print_function
 
+import copy
 import sys
 from pathlib import Path
 
-import diffpy.pdfmorph.morph_helpers as helpers
+import numpy
+
 import diffpy.pdfmorph.morphs as morphs
 import diffpy.pdfmorph.pdfmorph_io as io
 import diffpy.pdfmorph.pdfplot as pdfplot
 import diffpy.pdfmorph.refine as refine
 import diffpy.pdfmorph.tools as tools
 from diffpy.pdfmorph import __save_morph_as__
+from diffpy.pdfmorph.registry import get_morph
+from diffpy.pdfmorph.trace import TraceRecorder
 from diffpy.pdfmorph.version import __version__
 
 
@@ -92,7 +96,10 @@ def create_option_parser():
         "--verbose",
         dest="verbose",
         action="store_true",
-        help="Print additional header details to saved files.",
+        help=(
+            "Print additional header details to saved files, and the "
+            "standard errors and correlations of the refined parameters."
+        ),
     )
     parser.add_option(
         "--rmin",
@@ -104,6 +111,42 @@ def create_option_parser():
         type="float",
         help="Maximum r-value to use for PDF comparisons.",
     )
+    parser.add_option(
+        "--rstep",
+        type="float",
+        help=(
+            "r-spacing to use for PDF comparisons. "
+            "Defaults to the coarser spacing of the two PDFs."
+        ),
+    )
+    parser.add_option(
+        "--qmax",
+        type="float",
+        help=(
+            "Qmax of the PDFs. When given, PDFs are compared on a grid with "
+            "the Nyquist spacing pi/QMAX, unless --rstep is set."
+        ),
+    )
+    parser.add_option(
+        "--nyquist",
+        type="float",
+        metavar="MULT",
+        help=(
+            "Compare PDFs on a grid with MULT times the Nyquist spacing "
+            "pi/Qmax, unless --rstep is set. Qmax is taken from --qmax, or "
+            "else the lower qmax in the headers of the two PDF files."
+        ),
+    )
+    parser.add_option(
+        "--rfilter",
+        type="choice",
+        choices=["box", "sinc"],
+        help=(
+            "Low-pass filter applied before resampling a PDF onto a coarser "
+            "--rstep, to avoid aliasing. Options are 'box' and 'sinc'. "
+            "PDFs are point-sampled by default."
+        ),
+    )
     parser.add_option(
         "--pearson",
         action="store_true",
@@ -120,6 +163,117 @@ def create_option_parser():
         help="""Maximize agreement in the Pearson function as well as
  minimizing the residual.""",
     )
+    parser.add_option(
+        "--pyramid",
+        metavar="LEVELS",
+        help=(
+            "Refine on coarser r-grids first. LEVELS is a comma-separated "
+            "list of multiples of the r-spacing, e.g. '8,2', each level "
+            "starting from the result of the previous one. The refinement "
+            "at full resolution is always done last."
+        ),
+    )
+    parser.add_option(
+        "--varpro",
+        action="store_true",
+        dest="varpro",
+        help=(
+            "Solve the linear parameters scale and vshift in closed form "
+            "at each step of the refinement, so that the optimizer only "
+            "refines the other parameters."
+        ),
+    )
+    parser.add_option(
+        "--schedule",
+        metavar="SCHEDULE",
+        help=(
+            "Stages of the refinement. SCHEDULE is the name of a preset, "
+            "'default' to refine all parameters at once, 'smear' to refine "
+            "smear and scale first or 'shape' to also start on coarse "
+            "grids, or a JSON file with a list of stages. By default all "
+            "parameters are refined at once, after smear and scale when "
+            "smear is refined."
+        ),
+    )
+    parser.add_option(
+        "--backend",
+        metavar="NAME",
+        help=(
+            "Optimizer used to refine the morph. This is 'leastsq' "
+            "(default), 'least_squares' or one of its methods 'trf', "
+            "'dogbox' and 'lm', a scipy.optimize.minimize method such as "
+            "'nelder-mead' or 'l-bfgs-b', or 'broyden', which updates the "
+            "finite difference jacobian between occasional recomputations."
+        ),
+    )
+    parser.add_option(
+        "--max-nfev",
+        type="int",
+        metavar="N",
+        help=(
+            "Stop the refinement of a file after N evaluations, counted "
+            "over all stages of the schedule, and keep the best parameters "
+            "found."
+        ),
+    )
+    parser.add_option(
+        "--time-limit",
+        type="float",
+        metavar="SECONDS",
+        help=(
+            "Stop the refinement of a file after SECONDS of wall time, "
+            "counted over all stages of the schedule, and keep the best "
+            "parameters found."
+        ),
+    )
+    parser.add_option(
+        "--rw-target",
+        type="float",
+        metavar="RW",
+        help="Stop a refinement as soon as Rw is at most RW.",
+    )
+    parser.add_option(
+        "--trace",
+        metavar="FILE",
+        help=(
+            "Append every evaluation of the refinements to FILE as a line "
+            "of JSON, with the morph and target files, the parameter "
+            "values, the cost, the elapsed time and whether the evaluation "
+            "probed a finite difference jacobian."
+        ),
+    )
+    parser.add_option(
+        "--auto-init",
+        action="store_true",
+        dest="autoinit",
+        help=(
+            "Estimate the initial values of the refined scale, stretch, "
+            "smear, qdamp and radius from the morph and target before the "
+            "refinement. Values given on the command line are replaced."
+        ),
+    )
+    parser.add_option(
+        "--scan",
+        action="append",
+        metavar="PAR=START:STOP:NUM",
+        help=(
+            "Evaluate Rw over NUM evenly spaced values of the morph "
+            "parameter PAR from START to STOP before the refinement, which "
+            "starts from the point with the lowest Rw. This can appear "
+            "multiple times to scan a grid."
+        ),
+    )
+    parser.add_option(
+        "--scan-file",
+        metavar="FILE",
+        dest="scanfile",
+        help=(
+            "Save the landscape of --scan to FILE in the numpy .npy format, "
+            "with the parameter values of the grid followed by Rw and the "
+            "Pearson coefficient. A scan of one or two parameters is also "
+            "plotted to a .png file of the same name."
+        ),
+    )
 
     # Manipulations
     group = optparse.OptionGroup(
@@ -347,6 +501,27 @@ def create_option_parser():
             "included in the header of all the PDF files."
         ),
     )
+    group.add_option(
+        "--sequential",
+        dest="sequential",
+        action="store_true",
+        help=(
+            "Start each morph from the refined parameters of the previous "
+            "one in the sorted order, instead of from the given values. "
+            "This suits sequences such as temperature ramps, in which the "
+            "parameters change slowly from file to file."
+        ),
+    )
+    group.add_option(
+        "--extrapolate",
+        dest="extrapolate",
+        action="store_true",
+        help=(
+            "Used with --sequential. Start each morph from a linear "
+            "extrapolation of the parameters of the previous two, in the "
+            "values of FIELD when those are numbers."
+        ),
+    )
     group.add_option(
         "--reverse",
         dest="reverse",
@@ -397,6 +572,10 @@ def create_option_parser():
     parser.set_defaults(refine=True)
     parser.set_defaults(pearson=False)
     parser.set_defaults(addpearson=False)
+    parser.set_defaults(varpro=False)
+    parser.set_defaults(autoinit=False)
+    parser.set_defaults(sequential=False)
+    parser.set_defaults(extrapolate=False)
     parser.set_defaults(mag=5)
     parser.set_defaults(lwidth=1.5)
 
@@ -429,7 +608,20 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
     config = {}
     config["rmin"] = opts.rmin
     config["rmax"] = opts.rmax
-    config["rstep"] = None
+    config["rstep"] = opts.rstep
+    if opts.rfilter is not None:
+        config["rfilter"] = opts.rfilter
+    # Nyquist grid
+    qmax = opts.qmax
+    if qmax is None and opts.nyquist is not None:
+        qmaxes = [tools.readQmax(fn) for fn in pargs]
+        if None in qmaxes:
+            e = "Qmax not found in file headers. Specify it with --qmax."
+            parser.custom_error(e)
+        qmax = min(qmaxes)
+    if qmax is not None:
+        config["qmax"] = qmax
+        config["nyquist"] = opts.nyquist
     if (
         opts.rmin is not None
         and opts.rmax is not None
@@ -441,24 +633,24 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
     # Set up the morphs
     chain = morphs.MorphChain(config)
     # Add the r-range morph, we will remove it when saving and plotting
-    chain.append(morphs.MorphRGrid())
+    chain.append(get_morph("rgrid")())
     refpars = []
 
     # Scale
     if opts.scale is not None:
         scale_in = opts.scale
-        chain.append(morphs.MorphScale())
+        chain.append(get_morph("scale")())
         config["scale"] = scale_in
         refpars.append("scale")
     # Stretch
     if opts.stretch is not None:
         stretch_in = opts.stretch
-        chain.append(morphs.MorphStretch())
+        chain.append(get_morph("stretch")())
         config["stretch"] = stretch_in
         refpars.append("stretch")
     # Shift
     if opts.hshift is not None or opts.vshift is not None:
-        chain.append(morphs.MorphShift())
+        chain.append(get_morph("shift")())
     if opts.hshift is not None:
         hshift_in = opts.hshift
         config["hshift"] = hshift_in
@@ -470,9 +662,9 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
     # Smear
     if opts.smear is not None:
         smear_in = opts.smear
-        chain.append(helpers.TransformXtalPDFtoRDF())
-        chain.append(morphs.MorphSmear())
-        chain.append(helpers.TransformXtalRDFtoPDF())
+        chain.append(get_morph("pdftordf")())
+        chain.append(get_morph("smear")())
+        chain.append(get_morph("rdftopdf")())
         refpars.append("smear")
         config["smear"] = smear_in
         # Set baselineslope if not given
@@ -486,31 +678,31 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
     if nrad == 1:
         radii.remove(None)
         config["radius"] = tools.nn_value(radii[0], "radius or pradius")
-        chain.append(morphs.MorphSphere())
+        chain.append(get_morph("sphere")())
         refpars.append("radius")
     elif nrad == 2:
         config["radius"] = tools.nn_value(radii[0], "radius")
         refpars.append("radius")
         config["pradius"] = tools.nn_value(radii[1], "pradius")
         refpars.append("pradius")
-        chain.append(morphs.MorphSpheroid())
+        chain.append(get_morph("spheroid")())
     iradii = [opts.iradius, opts.ipradius]
     inrad = 2 - iradii.count(None)
     if inrad == 1:
         iradii.remove(None)
         config["iradius"] = tools.nn_value(iradii[0], "iradius or ipradius")
-        chain.append(morphs.MorphISphere())
+        chain.append(get_morph("isphere")())
         refpars.append("iradius")
     elif inrad == 2:
         config["iradius"] = tools.nn_value(iradii[0], "iradius")
         refpars.append("iradius")
         config["ipradius"] = tools.nn_value(iradii[1], "ipradius")
         refpars.append("ipradius")
-        chain.append(morphs.MorphISpheroid())
+        chain.append(get_morph("ispheroid")())
 
     # Resolution
     if opts.qdamp is not None:
-        chain.append(morphs.MorphResolutionDamping())
+        chain.append(get_morph("qdamp")())
         refpars.append("qdamp")
         config["qdamp"] = opts.qdamp
 
@@ -524,16 +716,57 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
         refiner.residual = refiner._pearson
     if opts.addpearson:
         refiner.residual = refiner._add_pearson
+    if opts.backend is not None:
+        refiner.backend = opts.backend
+    refiner.varpro = opts.varpro
+    refiner.max_nfev = opts.max_nfev
+    refiner.time_limit = opts.time_limit
+    refiner.rw_target = opts.rw_target
+    if opts.trace is not None:
+        label = f"{Path(pargs[0]).name} -> {Path(pargs[1]).name}"
+        refiner.callback = TraceRecorder(filename=opts.trace, label=label)
+    if opts.pyramid is not None:
+        try:
+            refiner.pyramid = [float(f) for f in opts.pyramid.split(",")]
+        except ValueError:
+            parser.custom_error("--pyramid must be a list of numbers.")
+    if opts.autoinit:
+        config.update(
+            tools.estimateInitial(
+                x_morph, y_morph, x_target, y_target, refpars
+            )
+        )
+    if opts.scan is not None:
+        try:
+            grid = scan_grid(opts.scan)
+        except ValueError as e:
+            parser.custom_error(str(e))
+        for p in grid:
+            if p not in refpars:
+                parser.custom_error(
+                    f"--scan parameter {p} is not a refined morph parameter."
+                )
+        scan = refiner.scan(grid)
+        config.update(scan.best)
+        if stdout_flag:
+            best = ", ".join(f"{p} = {v:.6f}" for p, v in scan.best.items())
+            print(f"\n# Best scanned point: {best}, Rw = {scan.rw.min():.6f}")
+        if opts.scanfile is not None:
+            scan.save(opts.scanfile)
+            if len(grid) <= 2:
+                heatmap = Path(opts.scanfile).with_suffix(".png")
+                pdfplot.plotLandscape(scan, filename=heatmap)
     if opts.refine and refpars:
+        schedule = refine.default_schedule(refpars)
+        if opts.schedule is not None:
+            schedule = opts.schedule
+            if Path(schedule).is_file():
+                try:
+                    schedule = tools.readSchedule(schedule)
+                except ValueError as e:
+                    parser.custom_error(str(e))
         try:
-            # This works better when we adjust scale and smear first.
-            if "smear" in refpars:
-                rptemp = ["smear"]
-                if "scale" in refpars:
-                    rptemp.append("scale")
-                refiner.refine(*rptemp)
-            # Adjust all parameters
-            refiner.refine(*refpars)
+            refiner.refine_schedule(schedule, *refpars)
         except ValueError as e:
             parser.custom_error(str(e))
     # Smear is not being refined, but baselineslope needs to refined to apply
@@ -553,6 +786,18 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
     # Get Rw for the morph range
     rw = tools.getRw(chain)
     pcc = tools.get_pearson(chain)
+    # Standard errors and correlations of the refined parameters
+    stderr, correlation = refiner.uncertainties()
+    # Report a refinement that stopped early
+    result = refiner.result
+    if result is not None and result.stopped and stdout_flag:
+        print(f"\n# Refinement stopped early: {result.message}")
+    # Report the size of the Nyquist grid
+    if qmax is not None and stdout_flag:
+        print(
+            f"\n# Comparing {len(chain.x_morph_out)} points with "
+            f"rstep = {config['rstep']:.6f} for Qmax = {qmax:.6f}"
+        )
     # Replace the MorphRGrid with Morph identity
     chain[0] = morphs.Morph()
     chain(x_morph, y_morph, x_target, y_target)
@@ -567,6 +812,10 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
 
     # Output morph parameters
     morph_results = dict(config.items())
+    # Leave out the options of the comparison grid
+    for key in ["rfilter", "qmax", "nyquist"]:
+        morph_results.pop(key, None)
+    morph_results.update({f"{p}_stderr": v for p, v in stderr.items()})
     # Ensure Rw, Pearson last two outputs
     morph_results.update({"Rw": rw})
     morph_results.update({"Pearson": pcc})
@@ -581,6 +830,7 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
             xy_out=[chain.x_morph_out, chain.y_morph_out],
             verbose=opts.verbose,
             stdout_flag=stdout_flag,
+            correlation=correlation,
         )
 
     except (FileNotFoundError, RuntimeError):
@@ -617,6 +867,119 @@ def single_morph(parser, opts, pargs, stdout_flag=True):
     return morph_results
 
 
+# Options of the refined morph parameters that are warm started
+_warm_start_pars = [
+    "scale",
+    "stretch",
+    "smear",
+    "baselineslope",
+    "hshift",
+    "vshift",
+    "qdamp",
+    "radius",
+    "pradius",
+    "iradius",
+    "ipradius",
+]
+# Parameters that an extrapolation must keep positive
+_positive_pars = ["scale", "radius", "pradius", "iradius", "ipradius"]
+# The other option of a sphere radius, which is refined as the radius when
+# it is given alone
+_sphere_options = {"radius": "pradius", "iradius": "ipradius"}
+
+
+def scan_grid(specs):
+    """Return the grid of a parameter scan.
+
+    Parameters
+    ----------
+    specs: list
+        Strings "PAR=START:STOP:NUM" of the scanned parameters.
+
+    Returns
+    -------
+    dict
+        The values of each scanned parameter, in the order of specs.
+
+    Raises
+    ------
+    ValueError
+        A string is not of the form PAR=START:STOP:NUM.
+    """
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        try:
+            start, stop, num = values.split(":")
+            values = numpy.linspace(float(start), float(stop), int(num))
+        except ValueError:
+            emsg = f"--scan {spec} is not of the form PAR=START:STOP:NUM."
+            raise ValueError(emsg)
+        if not name or len(values) == 0:
+            emsg = f"--scan {spec} is not of the form PAR=START:STOP:NUM."
+            raise ValueError(emsg)
+        grid[name.strip()] = values
+    return grid
+
+
+def warm_start_options(opts, history, positions=None, extrapolate=False):
+    """Return the options with initial values from previous morphs.
+
+    All parameters of the last morph are warm started, including those
+    that were not given in opts and started from their defaults, such as
+    the baselineslope of a smear.
+
+    Parameters
+    ----------
+    opts
+        The parsed options.
+    history: list
+        The results of single_morph for the previous morphs in order.
+    positions: list
+        The positions of the previous morphs and the next one in the
+        sequence, e.g. their temperatures. Defaults to their indices.
+    extrapolate: bool
+        Extrapolate linearly from the last two morphs instead of starting
+        from the last one.
+
+    Returns
+    -------
+    optparse.Values
+        A copy of opts with the initial values of the next morph.
+    """
+    opts = copy.copy(opts)
+    if not history:
+        return opts
+    if positions is None:
+        positions = list(range(len(history) + 1))
+    last = history[-1]
+    for par in _warm_start_pars:
+        if par not in last:
+            continue
+        option = par
+        other = _sphere_options.get(par)
+        if other and other not in last and getattr(opts, par) is None:
+            option = other
+        value = last[par]
+        if extrapolate and len(history) > 1 and par in history[-2]:
+            x0, x1, x2 = positions[-3:]
+            if x1 != x0:
+                slope = (value - history[-2][par]) / (x1 - x0)
+                guess = value + slope * (x2 - x1)
+                if guess > 0 or par not in _positive_pars:
+                    value = guess
+        setattr(opts, option, float(value))
+    return opts
+
+
+def _sequence_positions(field_list, count):
+    """Return numeric field values of a sorted sequence, else indices."""
+    try:
+        return [float(v) for v in field_list]
+    except (TypeError, ValueError):
+        return list(range(count))
+
+
 def multiple_targets(parser, opts, pargs, stdout_flag=True):
     # Custom error messages since usage is distinct when --multiple tag is
     # applied
@@ -715,22 +1078,26 @@ def multiple_targets(parser, opts, pargs, stdout_flag=True):
 
     # Morph morph_file against all other files in target_directory
     morph_results = {}
-    for target_file in target_list:
+    history = []
+    positions = _sequence_positions(field_list, len(target_list))
+    for idx, target_file in enumerate(target_list):
         if target_file.is_file:
             # Set the save file destination to be a file within the SLOC
             # directory
             if save_directory is not None:
                 save_as = save_names[target_file.name][__save_morph_as__]
                 opts.slocation = Path(save_morphs_here).joinpath(save_as)
+            # Start from the previous morphs of a sequence
+            run_opts = opts
+            if opts.sequential:
+                run_opts = warm_start_options(
+                    opts, history, positions[: idx + 1], opts.extrapolate
+                )
             # Perform a morph of morph_file against target_file
             pargs = [morph_file, target_file]
-            morph_results.update(
-                {
-                    target_file.name: single_morph(
-                        parser, opts, pargs, stdout_flag=False
-                    ),
-                }
-            )
+            results = single_morph(parser, run_opts, pargs, stdout_flag=False)
+            morph_results.update({target_file.name: results})
+            history.append(results)
 
     target_file_names = []
     for key in morph_results.keys():
@@ -899,22 +1266,26 @@ def multiple_morphs(parser, opts, pargs, stdout_flag=True):
 
     # Morph morph_file against all other files in target_directory
     morph_results = {}
-    for morph_file in morph_list:
+    history = []
+    positions = _sequence_positions(field_list, len(morph_list))
+    for idx, morph_file in enumerate(morph_list):
         if morph_file.is_file:
             # Set the save file destination to be a file within the SLOC
             # directory
             if save_directory is not None:
                 save_as = save_names[morph_file.name][__save_morph_as__]
                 opts.slocation = Path(save_morphs_here).joinpath(save_as)
+            # Start from the previous morphs of a sequence
+            run_opts = opts
+            if opts.sequential:
+                run_opts = warm_start_options(
+                    opts, history, positions[: idx + 1], opts.extrapolate
+                )
             # Perform a morph of morph_file against target_file
             pargs = [morph_file, target_file]
-            morph_results.update(
-                {
-                    morph_file.name: single_morph(
-                        parser, opts, pargs, stdout_flag=False
-                    ),
-                }
-            )
+            results = single_morph(parser, run_opts, pargs, stdout_flag=False)
+            morph_results.update({morph_file.name: results})
+            history.append(results)
 
     morph_file_names = []
     for key in morph_results.keys():
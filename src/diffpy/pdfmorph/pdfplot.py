@@ -305,6 +305,51 @@ def plot_param(target_labels, param_list, param_name=None, field=None):
     return
 
 
+def plotLandscape(scan, ax=None, filename=None):
+    """Plot the Rw landscape of a grid scan.
+
+    A scan of one parameter is plotted as a line, a scan of two as a
+    heatmap with the first parameter along the vertical axis.
+
+    Parameters
+    ----------
+    scan: diffpy.pdfmorph.refine.ScanResult
+        The scan to plot.
+    ax: matplotlib.axes.Axes
+        Axes to plot on. If None (default), a new figure is created.
+    filename
+        When given, save the figure to this file and close it if it was
+        created here.
+
+    Returns
+    -------
+    matplotlib.artist.Artist
+        The plotted line or heatmap.
+    """
+    if len(scan.pars) not in (1, 2):
+        emsg = "Only scans of one or two parameters can be plotted."
+        raise ValueError(emsg)
+    created = ax is None
+    if created:
+        fig, ax = plt.subplots()
+    if len(scan.pars) == 1:
+        (artist,) = ax.plot(scan.axes[0], scan.rw)
+        ax.set_xlabel(scan.pars[0])
+        ax.set_ylabel("Rw")
+    else:
+        artist = ax.pcolormesh(
+            scan.axes[1], scan.axes[0], scan.rw, shading="nearest"
+        )
+        ax.figure.colorbar(artist, ax=ax, label="Rw")
+        ax.set_xlabel(scan.pars[1])
+        ax.set_ylabel(scan.pars[0])
+    if filename is not None:
+        ax.figure.savefig(filename)
+        if created:
+            plt.close(ax.figure)
+    return artist
+
+
 def truncatePDFs(r, gr, rmin=None, rmax=None):
     """Truncate a PDF to specified bounds.
 
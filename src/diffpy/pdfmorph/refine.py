@@ -16,11 +16,405 @@
 """refine -- Refine a morph or morph chain
 """
 
-from numpy import concatenate, dot, exp, ones_like
-from scipy.optimize import leastsq
-from scipy.stats import pearsonr
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy
+from numpy import atleast_1d, dot, exp
+from scipy.optimize import least_squares, leastsq, minimize
+
+from diffpy.pdfmorph.tools import getRw, pearsonCoefficient
 
 # Map of scipy minimizer names to the method that uses them
+_backends = {
+    "leastsq": "_leastsq",
+    "least_squares": "_least_squares",
+    "trf": "_least_squares",
+    "dogbox": "_least_squares",
+    "lm": "_least_squares",
+    "broyden": "_broyden",
+    "minimize": "_minimize",
+    "nelder-mead": "_minimize",
+    "powell": "_minimize",
+    "cg": "_minimize",
+    "bfgs": "_minimize",
+    "l-bfgs-b": "_minimize",
+    "tnc": "_minimize",
+    "slsqp": "_minimize",
+}
+# Termination messages of the broyden backend by status, following the
+# MINPACK codes of leastsq
+_broyden_messages = {
+    0: "The residual is not finite.",
+    1: "The relative reduction of the cost is at most ftol.",
+    2: "The relative change of the parameters is at most xtol.",
+    4: "The gradient is at most gtol.",
+    5: "The maximum number of iterations was reached.",
+    7: "No further reduction of the cost is possible at machine precision.",
+}
+# Keys of a stage of a refinement schedule
+_stage_keys = ("pars", "backend", "options", "coarsen")
+# Parameters of the smearing morphs
+_smear_pars = ("smear", "rsmear", "qsmear")
+
+# Refinement schedules for Refiner.refine_schedule by name. The smear schedule
+# adjusts the smear and scale before all parameters. The shape schedule does
+# the same on a coarse grid and refines all parameters there before the full
+# resolution, which saves most full resolution evaluations of the shape.
+schedules = dict(
+    default=[{}],
+    smear=[{"pars": _smear_pars + ("scale",)}, {}],
+    shape=[
+        {"pars": _smear_pars + ("scale",), "coarsen": 4},
+        {"coarsen": 4},
+        {},
+    ],
+)
+
+
+def default_schedule(pars):
+    """Return the name of the schedule used when none is selected.
+
+    This keeps the staging of single_morph and pdfmorph from before
+    schedules, so the other presets, such as shape, are only run on request.
+
+    Parameters
+    ----------
+    pars
+        Names of the refined parameters.
+
+    Returns
+    -------
+    str
+        "smear" when smear is refined, to adjust smear and scale first,
+        and "default" otherwise.
+    """
+    if "smear" in pars:
+        return "smear"
+    return "default"
+
+
+def get_schedule(schedule):
+    """Return the list of stages of a schedule.
+
+    Parameters
+    ----------
+    schedule
+        List of stages, or the name of a schedule in schedules.
+
+    Returns
+    -------
+    list
+        The stages.
+
+    Raises
+    ------
+    ValueError
+        No schedule is defined under the name.
+    """
+    if not isinstance(schedule, str):
+        return list(schedule)
+    if schedule not in schedules:
+        emsg = "schedule: %s is not defined!" % schedule
+        raise ValueError(emsg)
+    return schedules[schedule]
+
+
+# Parameters that enter the morphed profile linearly
+_linear_pars = ("scale", "vshift")
+# Values of the linear parameters in the run of the projected residual
+_linear_origin = dict(scale=1.0, vshift=0.0)
+# Minimizer methods that use the gradient
+_gradient_methods = ("cg", "bfgs", "l-bfgs-b", "tnc", "slsqp")
+# Minimizer methods that support bounds
+_bounded_methods = ("nelder-mead", "powell", "l-bfgs-b", "tnc", "slsqp")
+
+
+class _BoundsTransform(object):
+    """Smooth map of unbounded internal to bounded external parameters.
+
+    This is the transform of MINUIT, where a parameter x with a lower bound
+    lo is x = lo - 1 + sqrt(u**2 + 1), one with an upper bound hi is
+    x = hi + 1 - sqrt(u**2 + 1) and one with both is
+    x = lo + (hi - lo) * (sin(u) + 1) / 2.
+    """
+
+    # Smallest distance of the initial internal value to a point where the
+    # derivative of the transform vanishes
+    umin = 1e-2
+
+    def __init__(self, lower, upper):
+        self.lower = numpy.asarray(lower, dtype=float)
+        self.upper = numpy.asarray(upper, dtype=float)
+        self.haslower = numpy.isfinite(self.lower)
+        self.hasupper = numpy.isfinite(self.upper)
+        self.hasboth = self.haslower & self.hasupper
+        self.haslower &= ~self.hasboth
+        self.hasupper &= ~self.hasboth
+        return
+
+    def internal(self, x):
+        """Return the internal values of external values x."""
+        x = numpy.clip(numpy.array(x, dtype=float), self.lower, self.upper)
+        u = x.copy()
+        lo, hi = self.lower, self.upper
+        sel = self.haslower
+        u[sel] = numpy.sqrt((x[sel] - lo[sel] + 1) ** 2 - 1)
+        sel = self.hasupper
+        u[sel] = numpy.sqrt((hi[sel] - x[sel] + 1) ** 2 - 1)
+        sel = self.haslower | self.hasupper
+        u[sel] = numpy.maximum(u[sel], self.umin)
+        sel = self.hasboth
+        t = 2 * (x[sel] - lo[sel]) / (hi[sel] - lo[sel]) - 1
+        tmax = numpy.cos(self.umin)
+        u[sel] = numpy.arcsin(numpy.clip(t, -tmax, tmax))
+        return u
+
+    def external(self, u):
+        """Return the external values of internal values u."""
+        u = numpy.asarray(u, dtype=float)
+        x = u.copy()
+        lo, hi = self.lower, self.upper
+        sel = self.haslower
+        x[sel] = lo[sel] - 1 + numpy.sqrt(u[sel] ** 2 + 1)
+        sel = self.hasupper
+        x[sel] = hi[sel] + 1 - numpy.sqrt(u[sel] ** 2 + 1)
+        sel = self.hasboth
+        x[sel] = lo[sel] + 0.5 * (hi[sel] - lo[sel]) * (numpy.sin(u[sel]) + 1)
+        return x
+
+    def derivative(self, u):
+        """Return the derivatives dx/du of the external values."""
+        u = numpy.asarray(u, dtype=float)
+        d = numpy.ones_like(u)
+        lo, hi = self.lower, self.upper
+        sel = self.haslower
+        d[sel] = u[sel] / numpy.sqrt(u[sel] ** 2 + 1)
+        sel = self.hasupper
+        d[sel] = -u[sel] / numpy.sqrt(u[sel] ** 2 + 1)
+        sel = self.hasboth
+        d[sel] = 0.5 * (hi[sel] - lo[sel]) * numpy.cos(u[sel])
+        return d
+
+
+# End class _BoundsTransform
+
+
+def _jacobian_covariance(jac):
+    """Return the pseudo-inverse of J^T J from the jacobian J.
+
+    Singular values below the numerical rank of J are left out, as in
+    scipy.optimize.curve_fit.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        None when the jacobian is only available as a linear operator.
+    """
+    if hasattr(jac, "toarray"):
+        jac = jac.toarray()
+    if not isinstance(jac, numpy.ndarray) or jac.size == 0:
+        return None
+    _u, sv, vt = numpy.linalg.svd(jac, full_matrices=False)
+    threshold = numpy.finfo(float).eps * max(jac.shape) * sv[0]
+    keep = sv > threshold
+    vt = vt[keep]
+    return dot(vt.T / sv[keep] ** 2, vt)
+
+
+class _StopRefinement(Exception):
+    """Raised by the objective when a refinement budget is used up."""
+
+    def __init__(self, reason, message):
+        Exception.__init__(self, message)
+        self.reason = reason
+        self.message = message
+        return
+
+
+# End class _StopRefinement
+
+
+class RefinementResult(object):
+    """Summary of a refinement.
+
+    Attributes
+    ----------
+    x
+        The refined parameter values.
+    cost
+        The final scalar residual, the sum of squares of the residual.
+    nfev
+        Number of evaluations of the residual.
+    njev
+        Number of evaluations of the jacobian, zero for finite differences
+        that are counted in nfev.
+    time
+        Wall time of the refinement in seconds.
+    status
+        Termination status reported by the backend.
+    message
+        Termination reason reported by the backend.
+    success
+        True when the backend converged.
+    backend
+        Name of the backend.
+    stopped
+        None, or the budget that stopped the refinement early, "max_nfev",
+        "time_limit" or "rw_target". x and cost are then those of the best
+        evaluation.
+    covariance
+        Covariance matrix of the refined parameters, or None when it is not
+        available. It is estimated from the jacobian of the residual at the
+        solution, which the backends already computed, and scaled by the
+        residual variance cost / (nres - npars). The minimize backends
+        only provide it for "bfgs" and "l-bfgs-b", from their approximate
+        inverse Hessian.
+    """
+
+    def __init__(self, **kw):
+        self.x = kw.get("x")
+        self.cost = kw.get("cost")
+        self.nfev = kw.get("nfev", 0)
+        self.njev = kw.get("njev", 0)
+        self.time = kw.get("time", 0.0)
+        self.status = kw.get("status")
+        self.message = kw.get("message", "")
+        self.success = kw.get("success", False)
+        self.backend = kw.get("backend")
+        self.stopped = kw.get("stopped")
+        self.covariance = kw.get("covariance")
+        return
+
+    @property
+    def stderr(self):
+        """Standard errors of the refined parameters, or None."""
+        if self.covariance is None:
+            return None
+        return numpy.sqrt(numpy.diag(self.covariance))
+
+    @property
+    def correlation(self):
+        """Correlation matrix of the refined parameters, or None."""
+        if self.covariance is None:
+            return None
+        stderr = self.stderr
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return self.covariance / numpy.outer(stderr, stderr)
+
+    def __repr__(self):
+        return (
+            "RefinementResult(backend=%r, success=%r, cost=%g, nfev=%i, "
+            "njev=%i, time=%.3g, message=%r)"
+            % (
+                self.backend,
+                self.success,
+                self.cost,
+                self.nfev,
+                self.njev,
+                self.time,
+                self.message,
+            )
+        )
+
+
+# End class RefinementResult
+
+
+class MultistartResult(object):
+    """Summary of a multi-start refinement.
+
+    Attributes
+    ----------
+    pars
+        Names of the refined parameters.
+    best
+        RefinementResult of the start with the lowest cost.
+    starts
+        Array of the initial values of each start, one row per start.
+    solutions
+        Array of the refined values of each start, NaN where the
+        refinement failed.
+    costs
+        Array of the final costs of each start, infinite where the
+        refinement failed.
+    """
+
+    def __init__(self, pars, best, starts, solutions, costs):
+        self.pars = list(pars)
+        self.best = best
+        self.starts = starts
+        self.solutions = solutions
+        self.costs = costs
+        return
+
+    @property
+    def x(self):
+        """The refined values of the best start."""
+        return self.best.x
+
+    @property
+    def cost(self):
+        """The final cost of the best start."""
+        return self.best.cost
+
+    @property
+    def spread(self):
+        """Standard deviation of each parameter over the refined starts."""
+        return numpy.nanstd(self.solutions, axis=0)
+
+
+# End class MultistartResult
+
+
+class ScanResult(object):
+    """Rw and Pearson landscapes of a grid scan.
+
+    Attributes
+    ----------
+    pars
+        Names of the scanned parameters.
+    axes
+        Arrays of the values of each scanned parameter.
+    rw
+        Array of Rw over the grid, where axis i runs over axes[i].
+    pearson
+        Array of the Pearson correlation coefficient over the grid.
+    """
+
+    def __init__(self, pars, axes, rw, pearson):
+        self.pars = list(pars)
+        self.axes = list(axes)
+        self.rw = rw
+        self.pearson = pearson
+        return
+
+    @property
+    def best(self):
+        """Dictionary of the parameter values with the lowest Rw."""
+        index = numpy.unravel_index(numpy.nanargmin(self.rw), self.rw.shape)
+        return {p: float(a[i]) for p, a, i in zip(self.pars, self.axes, index)}
+
+    def save(self, filename):
+        """Save the landscapes in the numpy .npy format.
+
+        The saved array has shape (len(pars) + 2,) + rw.shape. It holds
+        the values of each scanned parameter over the grid, followed by
+        Rw and the Pearson coefficient.
+
+        Parameters
+        ----------
+        filename
+            Name of the file.
+        """
+        grids = list(numpy.meshgrid(*self.axes, indexing="ij"))
+        numpy.save(filename, numpy.stack(grids + [self.rw, self.pearson]))
+        return
+
+
+# End class ScanResult
 
 
 class Refiner(object):
@@ -41,6 +435,70 @@ class Refiner(object):
     residual
         The residual function to optimize. Default _residual. Can be assigned
         to other functions.
+    backend
+        Name of the optimizer. This is "leastsq" (default), "least_squares"
+        or one of its methods "trf", "dogbox" and "lm", "minimize" or the
+        name of a scipy.optimize.minimize method, e.g. "nelder-mead" or
+        "l-bfgs-b", or "broyden", a Levenberg-Marquardt refinement that
+        updates a finite difference jacobian with Broyden's method between
+        occasional full recomputations, see _broyden. The scalar minimizers
+        minimize the sum of squares of the residual.
+    bounds: dict
+        Bounds (lower, upper) of parameters, where None is unbounded. These
+        override the parbounds declared by the morphs. The least_squares
+        methods "trf" and "dogbox" and the minimize methods that support
+        bounds enforce them directly. Other backends refine the parameters
+        through a smooth transform that maps the real line onto the bounds.
+    backend_options: dict
+        Keyword arguments passed to the optimizer. For least_squares this
+        can select the method ("trf", "dogbox" or "lm") and set x_scale,
+        jac_sparsity or diff_step. x_scale defaults to "jac", which scales
+        the parameters by the norms of their jacobian columns.
+    pyramid
+        Optional multiples of rstep, e.g. (8, 2, 1), to refine on in turn
+        before the refinement at full resolution. Each level starts from
+        the result of the previous one. The coarse levels low-pass filter
+        the data with a "box" rfilter unless an rfilter is configured. This
+        applies to chains that resample the data with MorphRGrid.
+    varpro: bool
+        Refine by variable projection. The parameters scale and vshift,
+        which enter the morphed profile linearly, are then solved by linear
+        least squares in each evaluation of the residual and the optimizer
+        only refines the other parameters. Each evaluation runs the chain
+        once, with scale at one and vshift at zero, and fits the target with
+        the scaled output plus a constant. This assumes that the morphs act
+        linearly on the profile. The baseline terms of the PDF <--> RDF
+        transforms do not scale, so with smear the solution is close to,
+        but not exactly, the full least-squares one. Bounds of the linear
+        parameters are not enforced. This applies to the standard residual
+        only.
+    max_nfev: int
+        Maximum number of evaluations of the residual in a call of refine,
+        refine_schedule or multistart, or in a budget block, including all
+        stages, pyramid levels and starts.
+    time_limit: float
+        Maximum wall time in seconds of a call of refine, refine_schedule
+        or multistart, or of a budget block.
+    rw_target: float
+        Rw at which a refinement stops early.
+        When one of these budgets is reached, the refinement stops without
+        raising and the remaining stages are skipped. The best parameters
+        found are placed in the config dictionary and the result attribute
+        tells which budget stopped it. By default there are no budgets.
+    cachesize: int
+        Number of chain outputs kept for reuse by evaluations at the same
+        parameter values within a refinement. Default 4.
+    callback
+        Optional function called after each evaluation of the residual as
+        callback(pars, cost, elapsed, probe), with the dictionary of the
+        refined parameter values, the sum of squares of the residual, the
+        time in seconds since refine was called and whether this is a probe
+        of a finite difference jacobian. Probes are recognized as steps of
+        at most 1e-5 * max(1, abs(x)) in one parameter from the previous
+        evaluation that was not a probe. See diffpy.pdfmorph.trace for a
+        recorder of these evaluations.
+    result: RefinementResult
+        Summary of the last refinement.
     """
 
     def __init__(self, chain, x_morph, y_morph, x_target, y_target):
@@ -51,43 +509,278 @@ class Refiner(object):
         self.y_target = y_target
         self.pars = []
         self.residual = self._residual
+        self.backend = "leastsq"
+        self.backend_options = {}
+        self.bounds = {}
+        self.pyramid = None
+        self.varpro = False
+        self.max_nfev = None
+        self.time_limit = None
+        self.rw_target = None
+        self.cachesize = 4
+        self.callback = None
+        self.result = None
+        self._transform = None
+        self._linear = []
+        # Recent chain outputs keyed on the parameter values, the key of the
+        # values the chain was last run at and the outputs of the last
+        # evaluation, which may have come from the cache
+        self._cache = OrderedDict()
+        self._lastkey = None
+        self._outputs = None
+        # Whether a budget block is open, its evaluations and deadline, and
+        # the best (pvals, cost) of the current refinement
+        self._budget = False
+        self._nfev = 0
+        self._deadline = None
+        self._best = (None, numpy.inf)
+        # Length of the residual vector of the current refinement
+        self._nres = 0
+        # Start of the current budget block and the last evaluation that
+        # was not a jacobian probe, for the callback
+        self._start = None
+        self._base = None
         return
 
     def _update_chain(self, pvals):
         """Update the parameters in the chain."""
+        if self._transform is not None:
+            pvals = self._transform.external(pvals)
         pairs = zip(self.pars, pvals)
         self.chain.config.update(pairs)
         return
 
-    def _residual(self, pvals):
-        """Standard vector residual."""
+    def parameter_bounds(self):
+        """Return the arrays of lower and upper bounds of the parameters.
+
+        The bounds come from the parbounds of the chain, overridden by the
+        bounds attribute.
+
+        Returns
+        -------
+        tuple
+            The (lower, upper) arrays over the refined parameters, with
+            infinite values where they are unbounded.
+        """
+        bounds = dict(getattr(self.chain, "parbounds", {}))
+        bounds.update(self.bounds)
+        lower = []
+        upper = []
+        for p in self.pars:
+            lo, hi = bounds.get(p, (None, None))
+            lower.append(-numpy.inf if lo is None else lo)
+            upper.append(numpy.inf if hi is None else hi)
+        return numpy.array(lower, dtype=float), numpy.array(upper, dtype=float)
+
+    def clear_cache(self):
+        """Forget the chain outputs kept from previous evaluations.
+
+        Call this before evaluating the residual on changed data or chains
+        outside of refine, which clears the cache itself.
+        """
+        self._cache.clear()
+        self._lastkey = None
+        self._outputs = None
+        return
+
+    def _parameter_bounds(self):
+        """Return the parameter bounds, or None if no parameter is bounded."""
+        lower, upper = self.parameter_bounds()
+        if numpy.isinf(lower).all() and numpy.isinf(upper).all():
+            return None
+        return lower, upper
+
+    def _native_bounds(self, name):
+        """Check if a backend supports bounds."""
+        method = self.backend_options.get("method", name)
+        if _backends[name] == "_least_squares":
+            return method != "lm"
+        if _backends[name] == "_minimize":
+            return method == "minimize" or method.lower() in _bounded_methods
+        return False
+
+    def _objective(self, pvals):
+        """Evaluate the residual within the budgets of the refinement.
+
+        Raises
+        ------
+        _StopRefinement
+            A budget is used up.
+        """
+        rvec = self.residual(pvals)
+        self._nfev += 1
+        self._nres = len(rvec)
+        cost = dot(rvec, rvec)
+        if cost < self._best[1]:
+            self._best = (numpy.array(pvals, dtype=float), cost)
+        if self.callback is not None:
+            self._trace(pvals, cost)
+        if self.max_nfev is not None and self._nfev >= self.max_nfev:
+            emsg = "The maximum number of evaluations was reached."
+            raise _StopRefinement("max_nfev", emsg)
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise _StopRefinement("time_limit", "The time limit was reached.")
+        if self.rw_target is not None and self._rw(rvec) <= self.rw_target:
+            raise _StopRefinement("rw_target", "The target Rw was reached.")
+        return rvec
+
+    def _trace(self, pvals, cost):
+        """Pass an evaluation of the residual to the callback."""
+        pvals = numpy.array(pvals, dtype=float)
+        base = self._base
+        probe = False
+        if base is not None and base.shape == pvals.shape:
+            step = numpy.abs(pvals - base)
+            moved = numpy.flatnonzero(step)
+            probe = len(moved) == 1 and step[moved[0]] <= 1e-5 * max(
+                1.0, abs(base[moved[0]])
+            )
+        if not probe:
+            self._base = pvals
+        if self._transform is not None:
+            pvals = self._transform.external(pvals)
+        values = dict(zip(self.pars, pvals.tolist()))
+        elapsed = time.perf_counter() - self._start
+        self.callback(values, cost, elapsed, probe)
+        return
+
+    def _rw(self, rvec):
+        """Return the Rw of the last evaluation of the residual."""
+        if self._outputs is None:
+            # the residual does not evaluate the chain through _evaluate
+            return getRw(self.chain)
+        _x_morph, _y_morph, _x_target, _y_target = self._outputs
+        if self.residual not in (self._residual, self._projected_residual):
+            rvec = _y_target - _y_morph
+        return (dot(rvec, rvec) / dot(_y_target, _y_target)) ** 0.5
+
+    def _needs_residuals(self, name):
+        """Check if a backend needs as many residuals as parameters."""
+        if _backends[name] == "_leastsq":
+            return True
+        if _backends[name] == "_least_squares":
+            return self.backend_options.get("method", name) == "lm"
+        return False
+
+    def _evaluate(self, pvals):
+        """Run the chain at the parameter values.
+
+        The outputs of the last cachesize evaluations are kept, so that
+        residuals evaluated at the same values share one run of the chain.
+        The chain attributes hold the outputs of its last actual run.
+
+        Returns
+        -------
+        tuple
+            The chain outputs (x_morph, y_morph, x_target, y_target).
+        """
         self._update_chain(pvals)
-        _x_morph, _y_morph, _x_target, _y_target = self.chain(
+        key = numpy.asarray(pvals, dtype=float).tobytes()
+        cache = self._cache
+        if key in cache:
+            cache.move_to_end(key)
+            self._outputs = cache[key]
+            return self._outputs
+        xyallout = self.chain(
             self.x_morph, self.y_morph, self.x_target, self.y_target
         )
+        self._lastkey = key
+        self._outputs = xyallout
+        if self.cachesize > 0:
+            cache[key] = xyallout
+            while len(cache) > self.cachesize:
+                cache.popitem(last=False)
+        return xyallout
+
+    def _residual(self, pvals):
+        """Standard vector residual."""
+        _x_morph, _y_morph, _x_target, _y_target = self._evaluate(pvals)
         rvec = _y_target - _y_morph
         return rvec
 
+    def _projected_residual(self, pvals):
+        """Residual with the linear parameters solved in closed form.
+
+        The chain is run once with scale at one and vshift at zero, and
+        the target is fit with the scaled output plus a constant offset by
+        linear least squares. This is exact when the morphed profile is
+        proportional to scale apart from a constant vshift, which holds up
+        to the baseline terms of the PDF <--> RDF transforms for the chains
+        of pdfmorph. The solution is placed in the config dictionary.
+        """
+        config = self.chain.config
+        config.update((p, _linear_origin[p]) for p in self._linear)
+        _x_morph, _y_morph, _x_target, _y_target = self._evaluate(pvals)
+        basis = []
+        rvec = _y_target.copy()
+        if "scale" in self._linear:
+            basis.append(_y_morph)
+        else:
+            rvec -= _y_morph
+        if "vshift" in self._linear:
+            basis.append(numpy.ones_like(_y_morph))
+        basis = numpy.transpose(basis)
+        sol = numpy.linalg.lstsq(basis, rvec, rcond=None)[0]
+        rvec -= dot(basis, sol)
+        config.update(zip(self._linear, sol))
+        return rvec
+
     def _pearson(self, pvals):
         """Pearson correlation function.
 
-        This gives e**-p (vector), where p is the pearson correlation function.
-        We seek to minimize this, which occurs when the correlation is the
-        largest.
+        This gives e**-p as a single residual, where p is the pearson
+        correlation coefficient. We seek to minimize this, which occurs when
+        the correlation is the largest. Backends that need at least as many
+        residuals as parameters refine it with scipy.optimize.minimize.
         """
-        self._update_chain(pvals)
-        _x_morph, _y_morph, _x_target, _y_target = self.chain(
-            self.x_morph, self.y_morph, self.x_target, self.y_target
-        )
-        pcc, pval = pearsonr(_y_morph, _y_target)
-        return ones_like(_x_morph) * exp(-pcc)
+        _x_morph, _y_morph, _x_target, _y_target = self._evaluate(pvals)
+        pcc = pearsonCoefficient(_y_morph, _y_target)
+        return numpy.array([exp(-pcc)])
+
+    def _analytic_jacobian(self):
+        """Return the analytic jacobian function of the residual, if any.
+
+        This is available when the standard residual is refined, the last
+        morph of the chain supplies analytic derivatives and all refined
+        parameters belong to that morph.
+
+        Returns
+        -------
+        callable or None
+            Function of the parameter values that returns the derivatives of
+            the residual with one row per refined parameter.
+        """
+        if self.residual != self._residual:
+            return None
+        morph = self.chain
+        if isinstance(morph, list) and len(morph) > 0:
+            morph = morph[-1]
+        if getattr(morph, "jacobian", None) is None:
+            return None
+        if not set(self.pars).issubset(morph.parnames):
+            return None
+        rows = [morph.parnames.index(p) for p in self.pars]
+
+        def jacobian(pvals):
+            self._update_chain(pvals)
+            jac = -morph.derivatives()[rows]
+            if self._transform is not None:
+                jac *= self._transform.derivative(pvals)[:, None]
+            return jac
+
+        return jacobian
 
     def _add_pearson(self, pvals):
-        """Refine both the pearson and residual."""
-        res1 = self._residual(pvals)
-        res2 = self._pearson(pvals)
-        res = concatenate([res1, res2])
-        return res
+        """Refine both the pearson and residual.
+
+        The pearson residual is weighted by the square root of the number of
+        points, so that it counts as much as in a residual vector of one
+        e**-p per point.
+        """
+        _x_morph, _y_morph, _x_target, _y_target = self._evaluate(pvals)
+        rvec = _y_target - _y_morph
+        pcc = pearsonCoefficient(_y_morph, _y_target)
+        return numpy.append(rvec, len(rvec) ** 0.5 * exp(-pcc))
 
     def refine(self, *args, **kw):
         """Refine the chain.
@@ -98,16 +791,22 @@ class Refiner(object):
         Keywords pass initial values to the parameters, whether or not they
         are refined.
 
-        This uses the leastsq algorithm from scipy.optimize.
+        This uses the optimizer selected by the backend attribute, by
+        default the leastsq algorithm from scipy.optimize, on each level of
+        the pyramid attribute. Analytic
+        derivatives are used when the chain provides them, see
+        MorphFunction.
 
         This returns the final scalar residual value.
         The parameters from the fit can be retrieved from the config
-        dictionary of the morph or morph chain.
+        dictionary of the morph or morph chain. A summary of the refinement
+        is stored in the result attribute.
 
         Raises
         ------
         ValueError
-            Exception raised if a minimum cannot be found.
+            Exception raised if a minimum cannot be found or the backend is
+            not supported.
         """
 
         self.pars = args or self.chain.config.keys()
@@ -118,22 +817,836 @@ class Refiner(object):
         if not self.pars:
             return 0.0
 
-        initial = [config[p] for p in self.pars]
+        self._base = None
+        with self.budget():
+            if self.pyramid and "rstep" in config:
+                return self._refine_pyramid()
+            return self._refine()
+
+    @contextmanager
+    def budget(self):
+        """Share the budgets between the refinements in a block.
+
+        The evaluations and the time limit are counted from the start of
+        the outermost block, so that a sequence of calls, such as
+        refine_schedule followed by multistart, stays within max_nfev and
+        time_limit. Each call of refine, refine_schedule and multistart
+        opens such a block.
+        """
+        if self._budget:
+            yield
+            return
+        self._budget = True
+        self._nfev = 0
+        self._start = time.perf_counter()
+        self._deadline = None
+        if self.time_limit is not None:
+            self._deadline = self._start + self.time_limit
+        try:
+            yield
+        finally:
+            self._budget = False
+        return
+
+    def _remaining(self):
+        """Return the evaluations and seconds left in the budget block.
+
+        Either is None when it is not limited.
+        """
+        nfev = seconds = None
+        if self.max_nfev is not None:
+            nfev = max(self.max_nfev - self._nfev, 0)
+        if self._deadline is not None:
+            seconds = max(self._deadline - time.perf_counter(), 0.0)
+        return nfev, seconds
+
+    def _refine_pyramid(self):
+        """Refine on coarser r-grids before the full resolution one."""
+        with self._grid_settings() as rstep:
+            for factor in self.pyramid:
+                if factor <= 1:
+                    continue
+                self._coarsen(rstep, factor)
+                try:
+                    self._refine()
+                except ValueError:
+                    # the next level starts from the last converged values
+                    pass
+        return self._refine()
+
+    @contextmanager
+    def _grid_settings(self):
+        """Restore the r-grid settings on exit, yielding the full rstep."""
+        config = self.chain.config
+        rstep = config["rstep"]
+        rfilter = config.get("rfilter", False)
+        if rstep is None:
+            # let MorphRGrid resolve the full resolution rstep
+            self.chain(
+                self.x_morph, self.y_morph, self.x_target, self.y_target
+            )
+        try:
+            yield config["rstep"]
+        finally:
+            config["rstep"] = rstep
+            if rfilter is False:
+                config.pop("rfilter", None)
+            else:
+                config["rfilter"] = rfilter
+        return
+
+    def _coarsen(self, rstep, factor):
+        """Set a coarser rstep, low-pass filtered unless rfilter is set."""
+        config = self.chain.config
+        config["rstep"] = rstep * factor
+        if not config.get("rfilter"):
+            config["rfilter"] = "box"
+        return
+
+    def refine_schedule(self, schedule, *args, **kw):
+        """Refine the chain in stages.
+
+        Each stage refines a subset of the parameters, starting from the
+        result of the previous stage, and may select its own optimizer and
+        a coarser r-grid. A stage is a dictionary with the optional keys
+
+        pars
+            Names of the parameters refined in the stage. Only those that
+            are also given in args are refined and stages without any are
+            skipped. All parameters are refined when this is missing.
+        backend
+            The backend of the stage, by default that of the Refiner.
+        options
+            The backend_options of the stage, by default those of the
+            Refiner.
+        coarsen
+            Multiple of rstep to refine on, as in the pyramid attribute.
+            The stage is refined at full resolution when this is missing.
+
+        Pyramid levels apply to each stage. The budgets apply to the whole
+        schedule and a stage that reaches one ends it.
+
+        Parameters
+        ----------
+        schedule
+            List of stages, or the name of a schedule in schedules.
+        args
+            Names of the parameters to refine. All parameters are refined
+            when none are given.
+        kw
+            Initial values of the parameters, whether or not they are
+            refined.
+
+        Returns
+        -------
+        float
+            The final scalar residual value of the last stage.
+
+        Raises
+        ------
+        ValueError
+            Exception raised if the schedule is unknown or invalid, or if a
+            stage fails.
+        """
+        schedule = get_schedule(schedule)
+        config = self.chain.config
+        config.update(kw)
+        pars = list(args or config.keys())
+        backend = self.backend
+        backend_options = self.backend_options
+        cost = 0.0
+        try:
+            with self.budget():
+                for stage in schedule:
+                    unknown = set(stage) - set(_stage_keys)
+                    if unknown:
+                        emsg = "Unknown keys in schedule stage: %s" % (
+                            ", ".join(sorted(unknown))
+                        )
+                        raise ValueError(emsg)
+                    spars = stage.get("pars")
+                    spars = (
+                        pars
+                        if spars is None
+                        else [p for p in spars if p in pars]
+                    )
+                    if not spars:
+                        continue
+                    self.backend = stage.get("backend", backend)
+                    self.backend_options = stage.get(
+                        "options", backend_options
+                    )
+                    coarsen = stage.get("coarsen", 1)
+                    if coarsen > 1 and "rstep" in config:
+                        with self._grid_settings() as rstep:
+                            self._coarsen(rstep, coarsen)
+                            cost = self.refine(*spars)
+                    else:
+                        cost = self.refine(*spars)
+                    if self.result is not None and self.result.stopped:
+                        break
+        finally:
+            self.backend = backend
+            self.backend_options = backend_options
+        return cost
+
+    def _refine(self):
+        """Refine the chain at the current r-grid."""
+        config = self.chain.config
+        if self.varpro and self.residual == self._residual:
+            linear = [p for p in self.pars if p in _linear_pars]
+            if linear:
+                return self._refine_projected(linear)
+        name = self.backend.lower()
+        if name not in _backends:
+            emsg = "backend: %s is not supported!" % self.backend
+            raise ValueError(emsg)
+        if self.residual == self._pearson and self._needs_residuals(name):
+            # the single pearson residual is minimized as a scalar
+            name = "minimize"
+        initial = numpy.array([config[p] for p in self.pars], dtype=float)
+        bounds = self._parameter_bounds()
+        if bounds is not None:
+            initial = numpy.clip(initial, *bounds)
+            if not self._native_bounds(name):
+                self._transform = _BoundsTransform(*bounds)
+                initial = self._transform.internal(initial)
+                bounds = None
+        self.clear_cache()
+        self._best = (None, numpy.inf)
+        self._base = None
+        start = time.perf_counter()
+        try:
+            try:
+                result = getattr(self, _backends[name])(initial, bounds)
+            except _StopRefinement as stop:
+                result = RefinementResult(
+                    x=self._best[0],
+                    cost=self._best[1],
+                    nfev=self._nfev,
+                    status=stop.reason,
+                    message=stop.message,
+                    success=stop.reason == "rw_target",
+                    backend=name,
+                    stopped=stop.reason,
+                )
+            key = numpy.asarray(result.x, dtype=float).tobytes()
+            if self._transform is not None:
+                if result.covariance is not None:
+                    d = self._transform.derivative(result.x)
+                    result.covariance = result.covariance * numpy.outer(d, d)
+                result.x = self._transform.external(result.x)
+        finally:
+            self._transform = None
+            self._cache.clear()
+            self._outputs = None
+        result.time = time.perf_counter() - start
+        dof = self._nres - len(self.pars)
+        if result.stopped or dof <= 0:
+            result.covariance = None
+        elif result.covariance is not None:
+            result.covariance = result.covariance * result.cost / dof
+        self.result = result
+        if not (result.success or result.stopped):
+            raise ValueError(result.message)
+
+        # Place the fit parameters in config
+        self.chain.config.update(zip(self.pars, atleast_1d(result.x)))
+        if self._lastkey not in (None, key):
+            # The outputs of the solution came from the cache
+            self.chain(
+                self.x_morph, self.y_morph, self.x_target, self.y_target
+            )
+
+        return result.cost
+
+    def _refine_projected(self, linear):
+        """Refine the other parameters with the linear ones projected out."""
+        pars = list(self.pars)
+        self.pars = [p for p in pars if p not in linear]
+        self._linear = linear
+        self.residual = self._projected_residual
+        try:
+            if self.pars:
+                self._refine()
+                result = self.result
+            else:
+                start = time.perf_counter()
+                rvec = self._projected_residual([])
+                result = RefinementResult(
+                    cost=dot(rvec, rvec),
+                    nfev=1,
+                    njev=0,
+                    time=time.perf_counter() - start,
+                    status=0,
+                    message="The linear parameters were solved directly.",
+                    success=True,
+                    backend="varpro",
+                )
+            # Evaluate at the optimum to leave its linear solution in config
+            self._projected_residual([self.chain.config[p] for p in self.pars])
+        finally:
+            self.pars = pars
+            self.residual = self._residual
+        _x_morph, _y_morph, _x_target, _y_target = self.chain(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        rvec = _y_target - _y_morph
+        result.x = numpy.array([self.chain.config[p] for p in pars])
+        result.cost = dot(rvec, rvec)
+        # the covariance of the projected refinement leaves out the linear
+        # parameters
+        result.covariance = None
+        self.result = result
+        return result.cost
+
+    def _leastsq(self, initial, bounds):
+        """Refine with scipy.optimize.leastsq."""
+        options = dict(self.backend_options)
         sol, cov_sol, infodict, emesg, ier = leastsq(
-            self.residual, initial, full_output=1
+            self._objective,
+            initial,
+            Dfun=self._analytic_jacobian(),
+            col_deriv=1,
+            full_output=1,
+            **options,
         )
         fvec = infodict["fvec"]
-        if ier not in (1, 2, 3, 4):
-            emesg
-            raise ValueError(emesg)
+        return RefinementResult(
+            x=sol,
+            cost=dot(fvec, fvec),
+            nfev=infodict["nfev"],
+            njev=infodict.get("njev", 0),
+            status=ier,
+            message=emesg,
+            success=ier in (1, 2, 3, 4),
+            backend="leastsq",
+            covariance=cov_sol,
+        )
 
-        # Place the fit parameters in config
-        vals = sol
-        if not hasattr(vals, "__iter__"):
-            vals = [vals]
-        self.chain.config.update(zip(self.pars, vals))
+    def _least_squares(self, initial, bounds):
+        """Refine with scipy.optimize.least_squares."""
+        options = dict(self.backend_options)
+        if self.backend.lower() != "least_squares":
+            options.setdefault("method", self.backend.lower())
+        options.setdefault("x_scale", "jac")
+        if bounds is not None:
+            options.setdefault("bounds", bounds)
+        jacobian = self._analytic_jacobian()
+        if jacobian is not None:
+            options.setdefault("jac", lambda pvals: jacobian(pvals).T)
+        sol = least_squares(self._objective, initial, **options)
+        return RefinementResult(
+            x=sol.x,
+            cost=dot(sol.fun, sol.fun),
+            nfev=sol.nfev,
+            njev=sol.njev or 0,
+            status=sol.status,
+            message=sol.message,
+            success=sol.success,
+            backend="least_squares",
+            covariance=_jacobian_covariance(sol.jac),
+        )
+
+    def _broyden(self, initial, bounds):
+        """Refine by Levenberg-Marquardt with Broyden updates of the jacobian.
+
+        The jacobian is computed by forward differences, or analytically
+        when the chain provides derivatives, at the start and on refreshes.
+        In between, each accepted step updates it with the rank-one secant
+        update of Broyden, which costs no evaluations. The convergence tests
+        and the covariance only use a jacobian without such updates. This
+        can save evaluations on fits of many parameters, while a fit of a
+        few parameters takes about as many evaluations as with leastsq.
+
+        The damping follows the ratio of the actual and predicted
+        reductions of the cost, so that steps stay within the region where
+        the linear model is trusted, and scales with the largest diagonal
+        of the normal equations so far, as in MINPACK. A rejected step, a
+        step that achieves less than a tenth of the predicted reduction or
+        a passed convergence test refreshes an updated jacobian, so that
+        the refinement neither stalls nor stops on an outdated model. After
+        n consecutive rejected steps on updated jacobians, the next
+        2**n - 1 accepted steps refresh it without updates. As in MINPACK,
+        ftol bounds both the actual and the predicted reductions, and the
+        test on xtol only counts accepted steps.
+
+        The backend_options are ftol, xtol and gtol as in
+        scipy.optimize.leastsq, maxiter, the maximum number of iterations
+        (default 100 * (len(pars) + 1)), refresh, the number of accepted
+        steps after which the jacobian is recomputed regardless (default
+        5), and diff_step, the relative step of the finite differences
+        (default 1.49012e-8).
+        """
+        options = dict(self.backend_options)
+        npars = len(initial)
+        ftol = options.pop("ftol", 1.49012e-8)
+        xtol = options.pop("xtol", 1.49012e-8)
+        gtol = options.pop("gtol", 0.0)
+        maxiter = options.pop("maxiter", 100 * (npars + 1))
+        refresh = options.pop("refresh", 5)
+        diff_step = options.pop("diff_step", 1.49012e-8)
+        if options:
+            emsg = "broyden: unsupported options %s" % ", ".join(options)
+            raise ValueError(emsg)
+        analytic = self._analytic_jacobian()
+        counts = dict(nfev=0, njev=0)
+
+        def residual(pvals):
+            counts["nfev"] += 1
+            return self._objective(pvals)
+
+        def jacobian(pvals, rvec):
+            if analytic is not None:
+                counts["njev"] += 1
+                return analytic(pvals).T
+            jac = numpy.empty((len(rvec), npars))
+            for j in range(npars):
+                h = diff_step * max(abs(pvals[j]), 1.0)
+                stepped = pvals.copy()
+                stepped[j] += h
+                jac[:, j] = (residual(stepped) - rvec) / h
+            return jac
+
+        pvals = numpy.array(initial, dtype=float)
+        rvec = residual(pvals)
+        cost = dot(rvec, rvec)
+        status = 0
+        if numpy.isfinite(cost):
+            status = 5
+            jac = jacobian(pvals, rvec)
+        # accepted steps since the jacobian was computed, whether it has had
+        # no rank-one update since, the consecutive failed steps on updated
+        # jacobians and the accepted steps that skip the updates
+        naccepted = 0
+        exact = True
+        failures = 0
+        skip = 0
+        lam = 1e-3
+        nu = 2.0
+        scaling = numpy.zeros(npars)
+        for iteration in range(maxiter if status else 0):
+            A = dot(jac.T, jac)
+            g = dot(jac.T, rvec)
+            if numpy.abs(g).max() <= gtol or cost == 0:
+                if exact:
+                    status = 1 if cost == 0 else 4
+                    break
+                jac = jacobian(pvals, rvec)
+                naccepted = 0
+                exact = True
+                continue
+            # Solve the damped normal equations (A + lam D) d = -g, where D
+            # keeps the largest diagonal of A so far, as in MINPACK, so that
+            # directions that flatten out stay damped
+            scaling = numpy.maximum(scaling, numpy.diag(A))
+            damped = A + lam * numpy.diag(numpy.maximum(scaling, 1e-12))
+            try:
+                delta = -numpy.linalg.solve(damped, g)
+            except numpy.linalg.LinAlgError:
+                delta = -numpy.linalg.lstsq(damped, g, rcond=None)[0]
+            trial = pvals + delta
+            rtrial = residual(trial)
+            ctrial = dot(rtrial, rtrial)
+            actual = cost - ctrial
+            predicted = -2 * dot(delta, g) - dot(delta, dot(A, delta))
+            accepted = numpy.isfinite(ctrial) and actual > 0
+            update = numpy.isfinite(ctrial) and analytic is None
+            if update:
+                secant = rtrial - rvec - dot(jac, delta)
+            # Convergence tests, as in MINPACK. Rejected steps shrink as the
+            # damping grows, so they only end the refinement once they
+            # vanish.
+            dnorm = numpy.linalg.norm(delta)
+            pnorm = numpy.linalg.norm(pvals)
+            small_step = accepted and dnorm <= xtol * (pnorm + xtol)
+            small_cost = max(abs(actual), predicted) <= ftol * cost
+            stuck = not accepted and dnorm <= numpy.finfo(float).eps * pnorm
+            if accepted:
+                # Nielsen's update of the damping
+                rho = actual / predicted if predicted > 0 else 0.0
+                lam *= max(1 / 3, 1 - (2 * rho - 1) ** 3)
+                nu = 2.0
+                pvals, rvec, cost = trial, rtrial, ctrial
+                naccepted += 1
+                if not exact:
+                    failures = 0
+                # refresh periodically and when the model predicts poorly
+                stale = naccepted >= refresh or rho < 0.1
+                stale |= analytic is not None
+                if exact and skip:
+                    skip -= 1
+                    stale = True
+            elif exact:
+                lam *= nu
+                nu *= 2
+                stale = False
+            else:
+                # a failed step on an updated jacobian refreshes it and
+                # keeps the damping, which is not at fault, ...
+                stale = True
+                failures += 1
+                # and the next 2**failures - 1 accepted steps refresh it
+                # at once, so that updates are only tried where they help
+                skip = 2**failures - 1
+            if small_cost or small_step or stuck:
+                if exact:
+                    status = 1 if small_cost else 2 if small_step else 7
+                    break
+                stale = True
+            if stale:
+                jac = jacobian(pvals, rvec)
+                naccepted = 0
+                exact = True
+            elif update and accepted:
+                # Broyden's rank-one update with the secant of the step
+                jac += numpy.outer(secant, delta / dot(delta, delta))
+                exact = False
+        return RefinementResult(
+            x=pvals,
+            cost=cost,
+            nfev=counts["nfev"],
+            njev=counts["njev"],
+            status=status,
+            message=_broyden_messages[status],
+            success=status in (1, 2, 4),
+            backend="broyden",
+            covariance=_jacobian_covariance(jac) if status and exact else None,
+        )
+
+    def _minimize(self, initial, bounds):
+        """Refine the sum of squares with scipy.optimize.minimize."""
+        name = self.backend.lower()
+        options = {}
+        # options of other backends do not apply to a fallback to minimize
+        if _backends.get(name) == "_minimize":
+            options.update(self.backend_options)
+            if name != "minimize":
+                options.setdefault("method", self.backend)
+        if bounds is not None:
+            options.setdefault("bounds", list(zip(*bounds)))
+        method = options.get("method")
+        jacobian = None
+        if method is None or method.lower() in _gradient_methods:
+            jacobian = self._analytic_jacobian()
+
+        def cost(pvals):
+            rvec = self._objective(pvals)
+            return dot(rvec, rvec)
+
+        if jacobian is not None:
+
+            def gradient(pvals):
+                rvec = self.residual(pvals)
+                return 2 * dot(jacobian(pvals), rvec)
+
+            options.setdefault("jac", gradient)
+        sol = minimize(cost, initial, **options)
+        # The Hessian of the sum of squares approximates 2 J^T J
+        covariance = sol.get("hess_inv")
+        if hasattr(covariance, "todense"):
+            covariance = covariance.todense()
+        if covariance is not None:
+            covariance = 2 * numpy.asarray(covariance, dtype=float)
+        return RefinementResult(
+            x=sol.x,
+            cost=sol.fun,
+            nfev=sol.nfev,
+            njev=sol.get("njev", 0),
+            status=sol.status,
+            message=sol.message,
+            success=sol.success,
+            backend=options.get("method") or "minimize",
+            covariance=covariance,
+        )
+
+    def uncertainties(self):
+        """Return the standard errors and correlations of the last refinement.
+
+        These come from the covariance of the refinement result and take no
+        further evaluations of the chain.
+
+        Returns
+        -------
+        tuple
+            Dictionaries (stderr, correlation), where stderr maps the names
+            of the refined parameters to their standard errors and
+            correlation[p][q] is the correlation coefficient of parameters
+            p and q. Both are empty when no covariance is available.
+        """
+        result = self.result
+        if result is None or result.covariance is None:
+            return {}, {}
+        pars = list(self.pars)
+        if len(pars) != len(result.covariance):
+            return {}, {}
+        stderr = dict(zip(pars, result.stderr.tolist()))
+        correlation = {
+            p: dict(zip(pars, row))
+            for p, row in zip(pars, result.correlation.tolist())
+        }
+        return stderr, correlation
+
+    def scan(self, grid, vectorized=None, memory=2**27):
+        """Evaluate Rw and the Pearson coefficient over a parameter grid.
+
+        Parameters
+        ----------
+        grid: dict
+            Values of each scanned parameter, in the order of the axes of
+            the grid. The other parameters keep their config values.
+        vectorized: bool or None
+            Evaluate the chain once for a chunk of grid points, with the
+            scanned parameters as arrays of shape (npoints, 1). This
+            requires morphs that broadcast over stacked profiles. When
+            False the chain is run for each grid point in turn. When None
+            (default) the chunks are used if the vectorized attribute of
+            the chain is True, as for chains of the built-in morphs.
+        memory: int
+            Memory budget in bytes of the morphed profiles of a chunk of
+            grid points. Default 128 MiB.
+
+        Returns
+        -------
+        ScanResult
+            The landscapes. The config dictionary is restored.
+        """
+        pars = list(grid)
+        axes = [
+            numpy.atleast_1d(numpy.asarray(grid[p], dtype=float)) for p in pars
+        ]
+        shape = tuple(len(a) for a in axes)
+        meshes = numpy.meshgrid(*axes, indexing="ij")
+        points = numpy.stack([m.ravel() for m in meshes], axis=1)
+        rw = numpy.empty(len(points))
+        pcc = numpy.empty(len(points))
+        xyall = (self.x_morph, self.y_morph, self.x_target, self.y_target)
+        config = self.chain.config
+        saved = dict(config)
+        if vectorized is None:
+            vectorized = getattr(self.chain, "vectorized", False)
+        try:
+            if vectorized:
+                # the profiles, their difference and the centered profiles
+                # of a chunk take about 4 arrays of doubles per point
+                npts = max(len(self.y_morph), len(self.y_target))
+                chunksize = max(1, memory // (32 * npts))
+                for start in range(0, len(points), chunksize):
+                    chunk = slice(start, start + chunksize)
+                    config.update(zip(pars, points[chunk].T[:, :, None]))
+                    xyallout = self.chain(*xyall)
+                    rw[chunk], pcc[chunk] = _landscape(
+                        xyallout[1], xyallout[3]
+                    )
+            else:
+                for i, point in enumerate(points):
+                    config.update(zip(pars, point))
+                    xyallout = self.chain(*xyall)
+                    rw[i], pcc[i] = _landscape(xyallout[1], xyallout[3])
+        finally:
+            config.update(saved)
+        return ScanResult(pars, axes, rw.reshape(shape), pcc.reshape(shape))
+
+    def multistart(
+        self, nstarts, *args, ranges=None, processes=None, seed=None
+    ):
+        """Refine the chain from several starting points.
+
+        The starting points are a Latin hypercube sample of the parameter
+        ranges, in addition to the current parameter values, which are
+        refined as the first start. The starts are refined in parallel on a
+        pool of processes, each of which holds one copy of this Refiner, so
+        the chain, residual and data must be picklable.
+
+        Parameters
+        ----------
+        nstarts: int
+            Number of sampled starting points.
+        args
+            Names of the parameters to refine. All parameters are refined
+            when none are given.
+        ranges: dict
+            Ranges (lower, upper) to sample each parameter from. By default
+            this is the range of the parameter bounds when they are finite,
+            and the current value plus or minus half its magnitude, or 1 if
+            it is zero, otherwise.
+        processes: int
+            Number of worker processes. The default uses all CPUs. The starts
+            are refined in this process when this is 1.
+        seed
+            Seed of the Latin hypercube sample.
 
-        return dot(fvec, fvec)
+        The budgets apply to all starts. In this process the starts that
+        remain when a budget is reached are skipped. On a pool the
+        remaining evaluations are split evenly between the starts and each
+        start stops at the remaining time.
+
+        Returns
+        -------
+        MultistartResult
+            Summary of all starts. The parameters of the best start are
+            placed in the config dictionary and its RefinementResult is
+            stored in the result attribute.
+
+        Raises
+        ------
+        ValueError
+            Exception raised if no start converges.
+        """
+        from scipy.stats import qmc
+
+        pars = list(args or self.chain.config.keys())
+        config = self.chain.config
+        initial = numpy.array([config[p] for p in pars], dtype=float)
+        self.pars = pars
+        bounds = self._parameter_bounds()
+        if bounds is None:
+            bounds = (
+                numpy.full(len(pars), -numpy.inf),
+                numpy.full(len(pars), numpy.inf),
+            )
+        ranges = ranges or {}
+        lower = []
+        upper = []
+        for p, x0, lo, hi in zip(pars, initial, *bounds):
+            if p in ranges:
+                lo, hi = ranges[p]
+            elif not (numpy.isfinite(lo) and numpy.isfinite(hi)):
+                width = 0.5 * abs(x0) or 1.0
+                lo = max(lo, x0 - width)
+                hi = min(hi, x0 + width)
+            lower.append(lo)
+            upper.append(hi)
+        sampler = qmc.LatinHypercube(d=len(pars), seed=seed)
+        sample = qmc.scale(sampler.random(nstarts), lower, upper)
+        starts = numpy.vstack([initial, sample])
+
+        with self.budget():
+            if processes == 1:
+                results = []
+                _init_worker(self)
+                try:
+                    for start in starts:
+                        if 0 in self._remaining():
+                            results.append(None)
+                        else:
+                            results.append(_refine_start(pars, start))
+                finally:
+                    _init_worker(None)
+            else:
+                nfev, seconds = self._remaining()
+                if nfev is not None:
+                    nfev = max(nfev // len(starts), 1)
+                deadline = None
+                if seconds is not None:
+                    deadline = time.time() + seconds
+                with ProcessPoolExecutor(
+                    max_workers=processes,
+                    initializer=_init_worker,
+                    initargs=(self,),
+                ) as executor:
+                    results = list(
+                        executor.map(
+                            _refine_start,
+                            [pars] * len(starts),
+                            starts,
+                            [(nfev, deadline)] * len(starts),
+                        )
+                    )
+
+        costs = numpy.array(
+            [numpy.inf if r is None else r.cost for r in results]
+        )
+        solutions = numpy.array(
+            [
+                numpy.full(len(pars), numpy.nan) if r is None else r.x
+                for r in results
+            ]
+        )
+        if numpy.isinf(costs).all():
+            raise ValueError("No refinement converged.")
+        best = results[int(numpy.argmin(costs))]
+        # Place the best parameters in config and evaluate the chain there
+        self.pars = pars
+        self.result = best
+        self._update_chain(best.x)
+        self.chain(self.x_morph, self.y_morph, self.x_target, self.y_target)
+        return MultistartResult(pars, best, starts, solutions, costs)
 
 
 # End class Refiner
+
+
+def _landscape(y_morph, y_target):
+    """Return the Rw and Pearson coefficients of stacked morphed profiles.
+
+    Parameters
+    ----------
+    y_morph, y_target
+        Profiles of shape (..., npts) that broadcast together.
+
+    Returns
+    -------
+    tuple
+        Arrays (rw, pearson) over the stacked profiles.
+    """
+    y_morph, y_target = numpy.broadcast_arrays(y_morph, y_target)
+    diff = y_target - y_morph
+    rw = numpy.sqrt(
+        numpy.sum(diff * diff, axis=-1)
+        / numpy.sum(y_target * y_target, axis=-1)
+    )
+    d1 = y_morph - numpy.mean(y_morph, axis=-1, keepdims=True)
+    d2 = y_target - numpy.mean(y_target, axis=-1, keepdims=True)
+    norm = numpy.sqrt(
+        numpy.sum(d1 * d1, axis=-1) * numpy.sum(d2 * d2, axis=-1)
+    )
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        pcc = numpy.sum(d1 * d2, axis=-1) / norm
+    # rounding can take the ratio slightly past +-1
+    return rw, numpy.clip(pcc, -1.0, 1.0)
+
+
+# Refiner of a multi-start worker process
+_worker_refiner = None
+
+
+def _init_worker(refiner):
+    """Hold the refiner of a multi-start worker."""
+    global _worker_refiner
+    _worker_refiner = refiner
+    return
+
+
+def _refine_start(pars, start, budget=None):
+    """Refine one start of a multi-start refinement.
+
+    Parameters
+    ----------
+    pars
+        Names of the refined parameters.
+    start
+        Their starting values.
+    budget
+        Optional (max_nfev, deadline) of a start in a worker process, where
+        deadline is a time.time() value. Either is None when unlimited.
+
+    Returns
+    -------
+    RefinementResult or None
+        The result, or None if the refinement failed.
+    """
+    refiner = _worker_refiner
+    if budget is not None:
+        # the copy of a worker counts its own budgets
+        refiner._budget = False
+        max_nfev, deadline = budget
+        refiner.max_nfev = max_nfev
+        refiner.time_limit = None
+        if deadline is not None:
+            refiner.time_limit = max(deadline - time.time(), 0.0)
+    try:
+        refiner.refine(*pars, **dict(zip(pars, start)))
+    except ValueError:
+        return None
+    return refiner.result
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""registry -- Look up morph classes by operation name.
+
+Morphs are registered as entry points in the "diffpy.pdfmorph.morphs"
+group, where the entry point name is the operation name and its value is
+the morph class, e.g. in pyproject.toml
+
+    [project.entry-points."diffpy.pdfmorph.morphs"]
+    myenvelope = "mypackage.morphs:MorphMyEnvelope"
+
+The module defining a morph is only imported when the morph is requested.
+"""
+
+from importlib import import_module
+from importlib.metadata import entry_points
+
+ENTRY_POINT_GROUP = "diffpy.pdfmorph.morphs"
+
+# Morphs shipped with pdfmorph. These are also declared as entry points and
+# are listed here so that they resolve without the package metadata.
+_builtin_morphs = dict(
+    rgrid="diffpy.pdfmorph.morphs.morphrgrid:MorphRGrid",
+    scale="diffpy.pdfmorph.morphs.morphscale:MorphScale",
+    stretch="diffpy.pdfmorph.morphs.morphstretch:MorphStretch",
+    shift="diffpy.pdfmorph.morphs.morphshift:MorphShift",
+    smear="diffpy.pdfmorph.morphs.morphsmear:MorphSmear",
+    qdamp="diffpy.pdfmorph.morphs.morphresolution:MorphResolutionDamping",
+    sphere="diffpy.pdfmorph.morphs.morphshape:MorphSphere",
+    spheroid="diffpy.pdfmorph.morphs.morphshape:MorphSpheroid",
+    isphere="diffpy.pdfmorph.morphs.morphishape:MorphISphere",
+    ispheroid="diffpy.pdfmorph.morphs.morphishape:MorphISpheroid",
+    qsmear="diffpy.pdfmorph.morphs.morphqspace:MorphQSmear",
+    qmaxcut="diffpy.pdfmorph.morphs.morphqspace:MorphQmax",
+    qmincut="diffpy.pdfmorph.morphs.morphqspace:MorphQmin",
+    rsmear="diffpy.pdfmorph.morphs.morphrsmear:MorphRSmear",
+    pdftordf=(
+        "diffpy.pdfmorph.morph_helpers.transformpdftordf:"
+        "TransformXtalPDFtoRDF"
+    ),
+    rdftopdf=(
+        "diffpy.pdfmorph.morph_helpers.transformrdftopdf:"
+        "TransformXtalRDFtoPDF"
+    ),
+)
+
+# Map of operation names to an entry point, a "module:class" string or a
+# loaded morph class. Filled on first use.
+_morphs = None
+
+
+def _registry():
+    """Return the map of operation names, discovering entry points once."""
+    global _morphs
+    if _morphs is None:
+        _morphs = dict(_builtin_morphs)
+        for ep in entry_points(group=ENTRY_POINT_GROUP):
+            _morphs[ep.name] = ep
+    return _morphs
+
+
+def register_morph(name, morph):
+    """Register a morph class under an operation name.
+
+    Parameters
+    ----------
+    name: str
+        The operation name.
+    morph
+        The morph class, or a "module:class" string to import it lazily.
+    """
+    _registry()[name] = morph
+    return
+
+
+def available_morphs():
+    """Return a sorted list of the registered operation names."""
+    return sorted(_registry())
+
+
+def get_morph(name):
+    """Return the morph class registered under an operation name.
+
+    The class is imported on the first request and cached.
+
+    Parameters
+    ----------
+    name: str
+        The operation name.
+
+    Returns
+    -------
+    type
+        The morph class.
+
+    Raises
+    ------
+    ValueError
+        No morph is registered under the name.
+    """
+    registry = _registry()
+    if name not in registry:
+        e = "operation: %s is not currently supported!" % name
+        raise ValueError(e)
+    morph = registry[name]
+    if isinstance(morph, str):
+        modname, clsname = morph.split(":")
+        morph = getattr(import_module(modname), clsname)
+    elif not isinstance(morph, type):
+        morph = morph.load()
+    registry[name] = morph
+    return morph
+
+
+# End of file
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""sampling -- Sample the posterior distribution of morph parameters
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+from numpy import dot
+from numpy.lib.format import open_memmap
+
+from diffpy.pdfmorph.refine import _landscape
+
+
+class SamplingResult(object):
+    """Samples of the posterior distribution of morph parameters.
+
+    Attributes
+    ----------
+    pars
+        Names of the sampled parameters.
+    samples
+        Array of the kept positions of the walkers, of shape
+        (nkept, nwalkers, len(pars)).
+    logprob
+        Array of the log-probabilities of the samples, of shape
+        (nkept, nwalkers).
+    acceptance
+        Array of the fraction of accepted moves of each walker.
+    variance
+        Variance of the residual points that the likelihood assumes.
+    nfev
+        Number of evaluations of the residual.
+    time
+        Wall time of the sampling in seconds.
+    """
+
+    def __init__(self, pars, samples, logprob, acceptance, **kw):
+        self.pars = list(pars)
+        self.samples = samples
+        self.logprob = logprob
+        self.acceptance = acceptance
+        self.variance = kw.get("variance")
+        self.nfev = kw.get("nfev", 0)
+        self.time = kw.get("time", 0.0)
+        return
+
+    @property
+    def flat(self):
+        """Array of all samples, of shape (nkept * nwalkers, len(pars))."""
+        return numpy.reshape(self.samples, (-1, len(self.pars)))
+
+    @property
+    def best(self):
+        """Dictionary of the parameter values of the most probable sample."""
+        index = numpy.unravel_index(
+            numpy.argmax(self.logprob), self.logprob.shape
+        )
+        return {p: float(v) for p, v in zip(self.pars, self.samples[index])}
+
+    def intervals(self, level=0.683):
+        """Return the central credible intervals of the parameters.
+
+        Parameters
+        ----------
+        level: float
+            Probability enclosed by the intervals. The default 0.683
+            matches one standard deviation of a normal distribution.
+
+        Returns
+        -------
+        dict
+            The (lower, median, upper) quantiles of each parameter.
+        """
+        tail = 0.5 * (1 - level)
+        quantiles = numpy.quantile(self.flat, [tail, 0.5, 1 - tail], axis=0)
+        return {
+            p: tuple(float(q) for q in quantiles[:, i])
+            for i, p in enumerate(self.pars)
+        }
+
+
+# End class SamplingResult
+
+
+class EnsembleSampler(object):
+    """Affine-invariant ensemble sampler of morph parameters.
+
+    This draws samples of the posterior distribution of the parameters of
+    the chain of a Refiner with the stretch move of Goodman and Weare. The
+    walkers are split in two halves that are moved in turn, each walker
+    along the line through a random walker of the other half. The moves of
+    a half are independent of each other, so their log-probabilities are
+    evaluated in one batch.
+
+    The likelihood is exp(-0.5 * cost / variance), where cost is the sum of
+    squares of the residual function of the Refiner, so the standard, the
+    Pearson and the combined residuals can all be sampled. The prior is
+    uniform within the parameter bounds of the Refiner.
+
+    Attributes
+    ----------
+    refiner
+        The Refiner whose chain, data, residual and bounds are used.
+    nwalkers: int
+        Number of walkers, an even number of at least twice the number of
+        parameters. By default 4 times the number of parameters and at
+        least 16.
+    a: float
+        Scale of the stretch move. Default 2.
+    variance: float
+        Variance of each residual point. By default this is estimated from
+        the cost at the starting point as cost / (nres - npars), which
+        assumes that sampling starts from a refinement. The Pearson
+        residual is a single number, so it needs an explicit variance and
+        sample raises ValueError without one.
+    vectorized: bool or None
+        Evaluate the chain once for a batch of walkers, with the parameters
+        as arrays of shape (nbatch, 1), as in Refiner.scan. This requires
+        morphs that broadcast over stacked profiles and the standard, the
+        Pearson or the combined residual of the Refiner. When False the
+        residual of the Refiner is evaluated for each walker in turn. When
+        None (default) the walkers are batched if the vectorized attribute
+        of the chain is True and the residual has a batched form.
+    processes: int
+        Number of worker processes that share the evaluations of each
+        batch, each of which holds a copy of the Refiner. Default 1, which
+        evaluates in this process, while None uses all CPUs.
+    seed
+        Seed of the random moves and starting points.
+    """
+
+    def __init__(self, refiner):
+        self.refiner = refiner
+        self.nwalkers = None
+        self.a = 2.0
+        self.variance = None
+        self.vectorized = None
+        self.processes = 1
+        self.seed = None
+        self.pars = []
+        self._nfev = 0
+        self._nworkers = 1
+        self._variance = None
+        return
+
+    def _batched(self):
+        """Return True if the walkers are evaluated in batches."""
+        if self.vectorized is not None:
+            return self.vectorized
+        refiner = self.refiner
+        residuals = (refiner._residual, refiner._pearson, refiner._add_pearson)
+        return getattr(refiner.chain, "vectorized", False) and any(
+            refiner.residual == r for r in residuals
+        )
+
+    def _costs(self, points):
+        """Return the sums of squares of the residual at parameter points.
+
+        The config dictionary of the chain is restored afterwards.
+        """
+        refiner = self.refiner
+        config = refiner.chain.config
+        saved = dict(config)
+        try:
+            if self._batched():
+                config.update(zip(self.pars, points.T[:, :, None]))
+                xyallout = refiner.chain(
+                    refiner.x_morph,
+                    refiner.y_morph,
+                    refiner.x_target,
+                    refiner.y_target,
+                )
+                return _batch_costs(refiner, xyallout[1], xyallout[3])
+            refiner.pars = self.pars
+            costs = numpy.empty(len(points))
+            for i, point in enumerate(points):
+                rvec = refiner.residual(point)
+                costs[i] = dot(rvec, rvec)
+            return costs
+        finally:
+            config.update(saved)
+
+    def _log_probs(self, points, lower, upper, executor):
+        """Return the log-probabilities of a batch of parameter points."""
+        logp = numpy.full(len(points), -numpy.inf)
+        inside = numpy.all((points >= lower) & (points <= upper), axis=1)
+        index = numpy.flatnonzero(inside)
+        if len(index) == 0:
+            return logp
+        if executor is None:
+            costs = self._costs(points[index])
+        else:
+            chunks = numpy.array_split(points[index], self._nworkers)
+            chunks = [c for c in chunks if len(c)]
+            costs = numpy.concatenate(
+                list(executor.map(_worker_costs, chunks))
+            )
+        self._nfev += len(index)
+        with numpy.errstate(invalid="ignore"):
+            logp[index] = numpy.where(
+                numpy.isfinite(costs),
+                -0.5 * costs / self._variance,
+                -numpy.inf,
+            )
+        return logp
+
+    def _start(self, rng, lower, upper, stderr):
+        """Return starting points in a small ball around the config values.
+
+        The ball has the standard errors stderr of the parameters where
+        these are given, and 1e-4 times the magnitude of the value, or 1e-4
+        if it is zero, otherwise.
+        """
+        config = self.refiner.chain.config
+        x0 = numpy.array([config[p] for p in self.pars], dtype=float)
+        width = numpy.array(
+            [
+                stderr.get(p) or 1e-4 * max(abs(x), 1.0)
+                for p, x in zip(self.pars, x0)
+            ]
+        )
+        points = x0 + width * rng.standard_normal((self.nwalkers, len(x0)))
+        return numpy.clip(points, lower, upper)
+
+    def sample(
+        self,
+        nsteps,
+        *args,
+        burn=0,
+        thin=1,
+        initial=None,
+        filename=None,
+        chunksize=100,
+    ):
+        """Sample the posterior distribution of the parameters.
+
+        Parameters
+        ----------
+        nsteps: int
+            Number of steps, in each of which every walker moves once.
+        args
+            Names of the parameters to sample. The parameters of the last
+            refinement of the Refiner are sampled when none are given, or
+            all parameters if it has not refined any.
+        burn: int
+            Number of initial steps that are discarded. Default 0.
+        thin: int
+            Keep every thin-th step after the burn-in. Default 1.
+        initial
+            Optional array of starting points of shape
+            (nwalkers, len(pars)). By default the walkers start in a small
+            ball around the config values.
+        filename
+            Optional name of a file in the numpy .npy format to store the
+            kept samples in, instead of memory. The array has shape
+            (nkept, nwalkers, len(pars) + 1) and holds the parameter values
+            followed by the log-probability. The file is flushed every
+            chunksize kept steps, so a long run can be inspected while it
+            goes on.
+        chunksize: int
+            Number of kept steps between flushes of the file. Default 100.
+
+        Returns
+        -------
+        SamplingResult
+            The samples. With a file, its arrays are views of the file.
+            The config dictionary is restored.
+
+        Raises
+        ------
+        ValueError
+            Exception raised if the walkers are too few or odd in number,
+            if the variance is not given and the residual has no more
+            points than parameters, as the Pearson residual, or if the
+            starting points have no finite probability.
+        """
+        refiner = self.refiner
+        config = refiner.chain.config
+        self.pars = list(args or refiner.pars or config.keys())
+        npars = len(self.pars)
+        nwalkers = self.nwalkers or max(16, 4 * npars)
+        if nwalkers % 2 or nwalkers < 2 * npars:
+            emsg = (
+                "nwalkers must be an even number of at least twice the "
+                "number of parameters."
+            )
+            raise ValueError(emsg)
+        self.nwalkers = nwalkers
+        # the errors of the last refinement size the starting ball
+        stderr = refiner.uncertainties()[0]
+        refined = refiner.pars
+        refiner.pars = self.pars
+        saved = dict(config)
+        executor = None
+        try:
+            lower, upper = refiner.parameter_bounds()
+            rng = numpy.random.default_rng(self.seed)
+            self._variance = self.variance
+            if self._variance is None:
+                x0 = numpy.array([config[p] for p in self.pars], dtype=float)
+                rvec = refiner.residual(x0)
+                if len(rvec) <= npars:
+                    emsg = (
+                        "variance must be given when the residual has no "
+                        "more points than parameters."
+                    )
+                    raise ValueError(emsg)
+                self._variance = dot(rvec, rvec) / (len(rvec) - npars)
+            if initial is None:
+                walkers = self._start(rng, lower, upper, stderr)
+            else:
+                walkers = numpy.array(initial, dtype=float)
+                if walkers.shape != (nwalkers, npars):
+                    emsg = "initial must have shape (nwalkers, len(pars))."
+                    raise ValueError(emsg)
+
+            kept = range(burn, nsteps, max(1, thin))
+            shape = (len(kept), nwalkers, npars + 1)
+            if filename is None:
+                store = numpy.empty(shape)
+            else:
+                store = open_memmap(
+                    filename, mode="w+", dtype=float, shape=shape
+                )
+            halves = numpy.array_split(numpy.arange(nwalkers), 2)
+            accepted = numpy.zeros(nwalkers, dtype=int)
+            self._nfev = 0
+            start = time.perf_counter()
+            self._nworkers = self.processes or os.cpu_count()
+            if self._nworkers > 1:
+                executor = ProcessPoolExecutor(
+                    max_workers=self._nworkers,
+                    initializer=_init_worker,
+                    initargs=(self,),
+                )
+            logp = self._log_probs(walkers, lower, upper, executor)
+            if not numpy.isfinite(logp).any():
+                raise ValueError("No starting point has a finite probability.")
+            nkept = 0
+            for step in range(nsteps):
+                for move, other in (halves, halves[::-1]):
+                    # the stretch move of Goodman and Weare
+                    z = (self.a - 1) * rng.random(len(move)) + 1
+                    z = z * z / self.a
+                    partners = walkers[rng.choice(other, len(move))]
+                    proposal = partners + z[:, None] * (
+                        walkers[move] - partners
+                    )
+                    logp_new = self._log_probs(
+                        proposal, lower, upper, executor
+                    )
+                    with numpy.errstate(invalid="ignore"):
+                        log_ratio = logp_new - logp[move]
+                        log_ratio += (npars - 1) * numpy.log(z)
+                    accept = numpy.log(rng.random(len(move))) < log_ratio
+                    walkers[move[accept]] = proposal[accept]
+                    logp[move[accept]] = logp_new[accept]
+                    accepted[move[accept]] += 1
+                if step in kept:
+                    store[nkept, :, :npars] = walkers
+                    store[nkept, :, npars] = logp
+                    nkept += 1
+                    if filename is not None and nkept % chunksize == 0:
+                        store.flush()
+            if filename is not None:
+                store.flush()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            config.update(saved)
+            refiner.pars = refined
+        return SamplingResult(
+            self.pars,
+            store[:, :, :npars],
+            store[:, :, npars],
+            accepted / max(nsteps, 1),
+            variance=self._variance,
+            nfev=self._nfev,
+            time=time.perf_counter() - start,
+        )
+
+
+# End class EnsembleSampler
+
+
+def _batch_costs(refiner, y_morph, y_target):
+    """Return the costs of the residual of a Refiner for stacked profiles.
+
+    Raises
+    ------
+    ValueError
+        The residual of the Refiner has no batched form.
+    """
+    y_morph, y_target = numpy.broadcast_arrays(y_morph, y_target)
+    diff = y_target - y_morph
+    if refiner.residual == refiner._residual:
+        return numpy.sum(diff * diff, axis=-1)
+    _rw, pcc = _landscape(y_morph, y_target)
+    if refiner.residual == refiner._pearson:
+        return numpy.exp(-2 * pcc)
+    if refiner.residual == refiner._add_pearson:
+        npts = y_target.shape[-1]
+        return numpy.sum(diff * diff, axis=-1) + npts * numpy.exp(-2 * pcc)
+    emsg = "Only the residuals of the Refiner can be vectorized."
+    raise ValueError(emsg)
+
+
+# Sampler of a worker process
+_worker_sampler = None
+
+
+def _init_worker(sampler):
+    """Hold the sampler of a worker process."""
+    global _worker_sampler
+    _worker_sampler = sampler
+    return
+
+
+def _worker_costs(points):
+    """Return the costs at parameter points in a worker process."""
+    return _worker_sampler._costs(points)
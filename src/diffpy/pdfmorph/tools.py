@@ -18,6 +18,8 @@
 """
 
 
+import json
+
 import numpy
 
 from diffpy.utils.parsers.loaddata import loadData
@@ -88,6 +90,323 @@ def estimateBaselineSlope(r, gr, rmin=None, rmax=None):
     return slope
 
 
+def _commonGrid(x_morph, y_morph, x_target, y_target):
+    """Resample the morph and target on a uniform grid over their overlap.
+
+    The grid has the median spacing of the target grid.
+
+    Returns
+    -------
+    tuple
+        Arrays (r, y_morph, y_target) on the common grid.
+    """
+    rmin = max(x_morph[0], x_target[0])
+    rmax = min(x_morph[-1], x_target[-1])
+    dr = numpy.median(numpy.diff(x_target))
+    r = rmin + dr * numpy.arange(int(numpy.floor((rmax - rmin) / dr)) + 1)
+    return (
+        r,
+        numpy.interp(r, x_morph, y_morph),
+        numpy.interp(r, x_target, y_target),
+    )
+
+
+def estimateStretch(r, y_morph, y_target, maxstretch=0.1):
+    """Estimate the stretch that maps the morph onto the target.
+
+    A stretch is a shift on a logarithmic r-grid. Both profiles are
+    resampled on such a grid, from rmax / 100 to rmax, and the shift is the
+    maximum of their cross-correlation, computed by FFT.
+
+    Parameters
+    ----------
+    r
+        Uniform r-grid of both profiles.
+    y_morph, y_target
+        The morph and target over the r-grid.
+    maxstretch
+        Largest magnitude of the stretch considered (default 0.1).
+
+    Returns
+    -------
+    float
+        The estimated stretch.
+    """
+    rmax = r[-1]
+    rmin = max(r[r > 0][0], rmax / 100)
+    dr = r[1] - r[0]
+    # the finest step of r at rmax
+    du = dr / rmax
+    u = numpy.arange(numpy.log(rmin), numpy.log(rmax), du)
+    m = numpy.interp(numpy.exp(u), r, y_morph)
+    t = numpy.interp(numpy.exp(u), r, y_target)
+    m -= m.mean()
+    t -= t.mean()
+    n = 2 * len(u)
+    corr = numpy.fft.irfft(
+        numpy.fft.rfft(t, n) * numpy.conj(numpy.fft.rfft(m, n)), n
+    )
+    maxlag = min(int(numpy.ceil(numpy.log1p(maxstretch) / du)), len(u) - 1)
+    lags = numpy.arange(-maxlag, maxlag + 1)
+    c = corr[lags]
+    k = int(numpy.argmax(c))
+    lag = float(lags[k])
+    # parabolic interpolation of the maximum
+    if 0 < k < len(c) - 1:
+        curvature = c[k - 1] - 2 * c[k] + c[k + 1]
+        if curvature < 0:
+            lag += 0.5 * (c[k - 1] - c[k + 1]) / curvature
+    return float(numpy.expm1(lag * du))
+
+
+def _fourierRatio(r, y_morph, y_target):
+    """Fit the ratio of the Fourier amplitudes of the target and morph.
+
+    Returns
+    -------
+    tuple
+        The Gaussian width sigma and amplitude a of the fit
+        a * exp(-0.5 * (sigma * Q)**2) of the ratio.
+    """
+    dr = r[1] - r[0]
+    n = 2 * len(r)
+    fm = numpy.abs(numpy.fft.rfft(y_morph - y_morph.mean(), n))
+    ft = numpy.abs(numpy.fft.rfft(y_target - y_target.mean(), n))
+    q = 2 * numpy.pi * numpy.fft.rfftfreq(n, dr)
+    # fit where both profiles have signal, weighted by their amplitudes
+    sel = (fm > 0.05 * fm.max()) & (ft > 0.05 * ft.max())
+    if sel.sum() < 2:
+        return 0.0, estimateScale(y_morph, y_target)
+    w = numpy.sqrt(fm[sel] * ft[sel])
+    A = numpy.transpose([w, -0.5 * w * q[sel] ** 2])
+    b = w * numpy.log(ft[sel] / fm[sel])
+    (loga, sigma2), *_ = numpy.linalg.lstsq(A, b, rcond=None)
+    return float(numpy.sqrt(max(sigma2, 0))), float(numpy.exp(loga))
+
+
+def estimateSmear(r, y_morph, y_target):
+    """Estimate the Gaussian smear that broadens the morph to the target.
+
+    Broadening every peak by a Gaussian of width smear multiplies the
+    Fourier amplitudes by exp(-0.5 * (smear * Q)**2). The smear is fit to
+    the ratio of the amplitudes of the target and morph, where both have
+    signal.
+
+    Parameters
+    ----------
+    r
+        Uniform r-grid of both profiles.
+    y_morph, y_target
+        The morph and target over the r-grid.
+
+    Returns
+    -------
+    float
+        The estimated smear, zero when the target is not broader.
+    """
+    return _fourierRatio(r, y_morph, y_target)[0]
+
+
+def _envelopeRatio(r, y_morph, y_target, window=2.0):
+    """Return the ratio of the target and morph envelopes and its weights.
+
+    The envelopes are root mean squares over a moving window.
+    """
+    from scipy.ndimage import uniform_filter1d
+
+    size = max(1, int(round(window / (r[1] - r[0]))))
+    # the running sums leave roundoff below zero where the profiles vanish
+    pm = uniform_filter1d(y_morph * y_morph, size, mode="nearest")
+    pt = uniform_filter1d(y_target * y_target, size, mode="nearest")
+    pm = numpy.maximum(pm, 0.0)
+    pt = numpy.maximum(pt, 0.0)
+    sel = pm > 1e-3 * pm.max()
+    ratio = numpy.zeros_like(r)
+    ratio[sel] = numpy.sqrt(pt[sel] / pm[sel])
+    sel &= numpy.isfinite(ratio)
+    ratio[~sel] = 0.0
+    return ratio, numpy.where(sel, pm, 0.0)
+
+
+def estimateQdamp(r, y_morph, y_target, window=2.0):
+    """Estimate the resolution damping of the target relative to the morph.
+
+    The ratio of the envelopes of the target and morph is fit to
+    a * exp(-0.5 * (qdamp * r)**2).
+
+    Parameters
+    ----------
+    r
+        Uniform r-grid of both profiles.
+    y_morph, y_target
+        The morph and target over the r-grid.
+    window
+        Width of the window of the envelopes (default 2.0).
+
+    Returns
+    -------
+    float
+        The estimated qdamp, zero when the target is not damped.
+    """
+    ratio, w = _envelopeRatio(r, y_morph, y_target, window)
+    sel = (ratio > 0) & (w > 0)
+    if sel.sum() < 2:
+        return 0.0
+    w = numpy.sqrt(w[sel])
+    A = numpy.transpose([w, -0.5 * w * r[sel] ** 2])
+    b = w * numpy.log(ratio[sel])
+    (loga, qdamp2), *_ = numpy.linalg.lstsq(A, b, rcond=None)
+    return float(numpy.sqrt(max(qdamp2, 0)))
+
+
+def estimateRadius(r, y_morph, y_target, window=2.0, nradii=200):
+    """Estimate the radius of the spherical particle envelope of the target.
+
+    The ratio of the envelopes of the target and morph is fit to a multiple
+    of the characteristic function of a sphere, for geometrically spaced
+    radii from rmax / 20 to 20 * rmax that are evaluated together.
+
+    Parameters
+    ----------
+    r
+        Uniform r-grid of both profiles.
+    y_morph, y_target
+        The morph and target over the r-grid.
+    window
+        Width of the window of the envelopes (default 2.0).
+    nradii
+        Number of radii tried (default 200).
+
+    Returns
+    -------
+    float
+        The radius with the best fit.
+    """
+    ratio, w = _envelopeRatio(r, y_morph, y_target, window)
+    rmax = r[-1]
+    radii = numpy.geomspace(rmax / 20, 20 * rmax, nradii)
+    x = r / (2 * radii[:, None])
+    cf = numpy.where(x < 1, 1.0 - 1.5 * x + 0.5 * x**3, 0.0)
+    # the best amplitude of each radius in closed form
+    wcf = w * cf
+    norm = numpy.sum(wcf * cf, axis=1)
+    amp = numpy.divide(
+        numpy.dot(wcf, ratio), norm, out=numpy.zeros(nradii), where=norm > 0
+    )
+    resid = ratio - amp[:, None] * cf
+    cost = numpy.sum(w * resid * resid, axis=1)
+    return float(radii[numpy.argmin(cost)])
+
+
+def _estimateRadiusQdamp(r, y_morph, y_target, window=2.0, nradii=200):
+    """Estimate the radius and qdamp of the target envelope together.
+
+    For each radius of estimateRadius, qdamp is fit to the log of the
+    envelope ratio over the characteristic function of the sphere as in
+    estimateQdamp, and the radius with the best fit of the ratio is kept.
+    Fitting the qdamp first would absorb the envelope of the sphere. When
+    the target is best fit without a sphere, the largest radius is
+    returned.
+
+    Returns
+    -------
+    tuple
+        The estimated (radius, qdamp).
+    """
+    ratio, w = _envelopeRatio(r, y_morph, y_target, window)
+    rmax = r[-1]
+    # an infinite radius leaves the qdamp alone to fit the envelope
+    radii = numpy.geomspace(rmax / 20, 20 * rmax, nradii)
+    radii = numpy.append(radii, numpy.inf)
+    x = r / (2 * radii[:, None])
+    cf = numpy.where(x < 1, 1.0 - 1.5 * x + 0.5 * x**3, 0.0)
+    # weighted fits of log(ratio / cf) = log(a) - 0.5 * qdamp**2 * r**2
+    wsel = numpy.where((cf > 0) & (ratio > 0), w, 0.0)
+    logr = numpy.log(ratio, out=numpy.zeros_like(r), where=ratio > 0)
+    logcf = numpy.log(cf, out=numpy.zeros_like(cf), where=cf > 0)
+    u = -0.5 * r * r
+    s0 = wsel.sum(axis=1)
+    s1 = numpy.dot(wsel, u)
+    s2 = numpy.dot(wsel, u * u)
+    b0 = numpy.sum(wsel * (logr - logcf), axis=1)
+    b1 = numpy.sum(wsel * u * (logr - logcf), axis=1)
+    det = s0 * s2 - s1 * s1
+    qdamp2 = numpy.divide(
+        s0 * b1 - s1 * b0, det, out=numpy.zeros(len(radii)), where=det > 0
+    )
+    qdamps = numpy.sqrt(numpy.maximum(qdamp2, 0.0))
+    # the best amplitude of each envelope in closed form
+    env = cf * numpy.exp(-0.5 * (qdamps[:, None] * r) ** 2)
+    wenv = w * env
+    norm = numpy.sum(wenv * env, axis=1)
+    amp = numpy.divide(
+        numpy.dot(wenv, ratio),
+        norm,
+        out=numpy.zeros(len(radii)),
+        where=norm > 0,
+    )
+    resid = ratio - amp[:, None] * env
+    cost = numpy.sum(w * resid * resid, axis=1)
+    best = numpy.argmin(cost)
+    return float(min(radii[best], 20 * rmax)), float(qdamps[best])
+
+
+def estimateInitial(x_morph, y_morph, x_target, y_target, pars):
+    """Estimate initial values of morph parameters.
+
+    The morph and target are resampled on a common grid. The stretch is
+    estimated first and applied to the morph, then the smear, qdamp and
+    radius are estimated from the aligned profiles. The qdamp and radius
+    are fit together when both are estimated. The scale is that of the
+    morph with all estimates applied.
+
+    Parameters
+    ----------
+    x_morph, y_morph
+        The morph arrays.
+    x_target, y_target
+        The target arrays.
+    pars
+        Names of the parameters to estimate. Only "scale", "stretch",
+        "smear", "qdamp" and "radius" are estimated, others are ignored.
+
+    Returns
+    -------
+    dict
+        The estimates of the parameters in pars.
+    """
+    r, m, t = _commonGrid(x_morph, y_morph, x_target, y_target)
+    estimates = {}
+    if "stretch" in pars:
+        stretch = estimateStretch(r, m, t)
+        estimates["stretch"] = stretch
+        m = numpy.interp(r / (1 + stretch), r, m)
+    if "smear" in pars:
+        smear = estimateSmear(r, m, t)
+        estimates["smear"] = smear
+        # smear the morph in Fourier space for the scale
+        n = 2 * len(r)
+        q = 2 * numpy.pi * numpy.fft.rfftfreq(n, r[1] - r[0])
+        fm = numpy.fft.rfft(m, n) * numpy.exp(-0.5 * (smear * q) ** 2)
+        m = numpy.fft.irfft(fm, n)[: len(r)]
+    if "qdamp" in pars and "radius" in pars:
+        radius, qdamp = _estimateRadiusQdamp(r, m, t)
+    elif "qdamp" in pars:
+        qdamp = estimateQdamp(r, m, t)
+    elif "radius" in pars:
+        radius = estimateRadius(r, m, t)
+    if "qdamp" in pars:
+        estimates["qdamp"] = qdamp
+        m = m * numpy.exp(-0.5 * (qdamp * r) ** 2)
+    if "radius" in pars:
+        estimates["radius"] = radius
+        x = r / (2 * radius)
+        m = m * numpy.where(x < 1, 1.0 - 1.5 * x + 0.5 * x**3, 0.0)
+    if "scale" in pars:
+        estimates["scale"] = float(estimateScale(m, t))
+    return estimates
+
+
 def getRw(chain):
     """Get Rw from the outputs of a morph or chain."""
     # Make sure we put these on the proper grid
@@ -99,12 +418,34 @@ def getRw(chain):
     return rw
 
 
-def get_pearson(chain):
-    from scipy.stats import pearsonr
+def pearsonCoefficient(y1, y2):
+    """Pearson correlation coefficient of two profiles.
+
+    This centers both profiles and takes three dot products, which is
+    cheaper than scipy.stats.pearsonr as no p-value is computed.
+
+    Parameters
+    ----------
+    y1, y2
+        Profiles on the same grid.
 
+    Returns
+    -------
+    float
+        The correlation coefficient, or nan if a profile is constant.
+    """
+    d1 = y1 - numpy.mean(y1)
+    d2 = y2 - numpy.mean(y2)
+    norm = numpy.sqrt(numpy.dot(d1, d1) * numpy.dot(d2, d2))
+    if norm == 0:
+        return numpy.nan
+    # rounding can take the ratio slightly past +-1
+    return max(-1.0, min(1.0, numpy.dot(d1, d2) / norm))
+
+
+def get_pearson(chain):
     x_morph, y_morph, x_target, y_target = chain.xyallout
-    pcc, pval = pearsonr(y_morph, y_target)
-    return pcc
+    return pearsonCoefficient(y_morph, y_target)
 
 
 def readPDF(fname):
@@ -127,6 +468,64 @@ def readPDF(fname):
     return (None, None)
 
 
+def readQmax(fname):
+    """Read the Qmax of a PDF from the header of its file.
+
+    Parameters
+    ----------
+    fname
+        Name of the file we want to read.
+
+    Returns
+    -------
+    float or None
+        The Qmax, or None when the header has no positive numeric qmax
+        entry.
+    """
+
+    header = loadData(fname, headers=True)
+    for key, value in header.items():
+        if key.lstrip("#").strip().lower() != "qmax":
+            continue
+        try:
+            qmax = float(value)
+        except (TypeError, ValueError):
+            return None
+        return qmax if qmax > 0 else None
+    return None
+
+
+def readSchedule(fname):
+    """Read a refinement schedule from a JSON file.
+
+    The file holds a list of stages, each an object with the optional keys
+    of a stage of diffpy.pdfmorph.refine.Refiner.refine_schedule.
+
+    Parameters
+    ----------
+    fname
+        Name of the file we want to read.
+
+    Returns
+    -------
+    list
+        The stages.
+
+    Raises
+    ------
+    ValueError
+        The file does not hold a list of stages.
+    """
+
+    with open(fname) as f:
+        schedule = json.load(f)
+    if not isinstance(schedule, list) or not all(
+        isinstance(stage, dict) for stage in schedule
+    ):
+        raise ValueError("%s does not hold a list of stages." % fname)
+    return schedule
+
+
 def nn_value(val, name):
     """Convenience function for ensuring certain non-negative inputs."""
     if val < 0:
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.pdfmorph   by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 Trustees of the Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""trace -- Record the evaluations of refinements
+"""
+
+import json
+from collections import deque
+
+
+class TraceRecorder(object):
+    """Record the evaluations of refinements.
+
+    An instance is assigned as the callback of a Refiner. Each evaluation of
+    the residual becomes a record, a dictionary with the keys
+
+    label
+        The label of the recorder.
+    nfev
+        Number of the evaluation, counted over all refinements recorded.
+    pars
+        Dictionary of the refined parameter values.
+    cost
+        Sum of squares of the residual.
+    time
+        Seconds since the refinement started.
+    probe
+        True for probes of a finite difference jacobian.
+
+    Attributes
+    ----------
+    records: collections.deque
+        The last maxlen records.
+    filename
+        Optional name of a file that each record is appended to as a line
+        of JSON. The file is opened for each record, so that recorders
+        passed to the worker processes of Refiner.multistart append to the
+        same file.
+    label
+        Optional label of the records, e.g. the names of the files of a
+        morph, to tell refinements apart in a file.
+    nfev: int
+        Number of recorded evaluations.
+    nprobes: int
+        Number of recorded jacobian probes.
+    """
+
+    def __init__(self, maxlen=10000, filename=None, label=None):
+        """Create a TraceRecorder.
+
+        Parameters
+        ----------
+        maxlen: int
+            Number of records kept in memory. Default 10000.
+        filename
+            Optional name of the file to append records to.
+        label
+            Optional label of the records.
+        """
+        self.records = deque(maxlen=maxlen)
+        self.filename = filename
+        self.label = label
+        self.nfev = 0
+        self.nprobes = 0
+        return
+
+    def __call__(self, pars, cost, elapsed, probe):
+        """Record an evaluation, as a callback of Refiner."""
+        self.nfev += 1
+        self.nprobes += bool(probe)
+        record = dict(
+            label=self.label,
+            nfev=self.nfev,
+            pars=pars,
+            cost=float(cost),
+            time=elapsed,
+            probe=bool(probe),
+        )
+        self.records.append(record)
+        if self.filename is not None:
+            with open(self.filename, "a") as outfile:
+                print(json.dumps(record), file=outfile)
+        return
+
+
+# End class TraceRecorder
@@ -1,6 +1,7 @@
 import json
 from pathlib import Path
 
+import numpy
 import pytest
 
 
@@ -17,3 +18,19 @@ def user_filesystem(tmp_path):
         json.dump(home_config_data, f)
 
     yield tmp_path
+
+
+@pytest.fixture
+def sin_exp_profiles():
+    """Return a function of the stretch that gives a damped sine wave and
+    its target, stretched and scaled by 2, as x_morph, y_morph, x_target,
+    y_target."""
+
+    def profiles(stretch=0.02):
+        x_target = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x_target) * numpy.exp(-0.1 * x_target)
+        x_morph = x_target.copy()
+        y_target = 2 * numpy.interp(x_target / (1 + stretch), x_morph, y_morph)
+        return x_morph, y_morph, x_target, y_target
+
+    return profiles
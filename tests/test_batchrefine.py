@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph.batchrefine import BatchRefiner
+from diffpy.pdfmorph.morph_helpers.transformpdftordf import (
+    TransformXtalPDFtoRDF,
+)
+from diffpy.pdfmorph.morph_helpers.transformrdftopdf import (
+    TransformXtalRDFtoPDF,
+)
+from diffpy.pdfmorph.morphs.morphchain import MorphChain
+from diffpy.pdfmorph.morphs.morphfunction import MorphFunction
+from diffpy.pdfmorph.morphs.morphscale import MorphScale
+from diffpy.pdfmorph.morphs.morphsmear import MorphSmear
+from diffpy.pdfmorph.morphs.morphstretch import MorphStretch
+from diffpy.pdfmorph.refine import Refiner
+
+
+def damped_wave(r, y, scale, stretch):
+    return scale * numpy.sin(5 * r * (1 + stretch)) * numpy.exp(-0.05 * r)
+
+
+class TestBatchRefiner:
+    @pytest.fixture
+    def setup(self):
+        self.x = numpy.arange(0.01, 20, 0.05)
+        self.y = damped_wave(self.x, None, 1.0, 0.0)
+        rng = numpy.random.default_rng(0)
+        self.truth = numpy.column_stack(
+            [rng.uniform(0.5, 2, 10), rng.uniform(-0.005, 0.005, 10)]
+        )
+        self.y_target = damped_wave(
+            self.x, None, self.truth[:, :1], self.truth[:, 1:]
+        )
+        self.y_target += 0.01 * rng.normal(size=self.y_target.shape)
+        return
+
+    def _chain(self):
+        return MorphChain(
+            {"scale": 1.0, "stretch": 0.0},
+            MorphFunction(damped_wave, ["scale", "stretch"]),
+        )
+
+    def test_vectorized(self, setup):
+        """batched fits agree with separate fits"""
+        chain = self._chain()
+        batch = BatchRefiner(chain, self.x, self.y, self.x, self.y_target)
+        batch.vectorized = True
+        costs = batch.refine("scale", "stretch")
+        assert len(costs) == len(self.truth)
+        assert len(batch.results) == len(self.truth)
+        assert all(result.success for result in batch.results)
+        # Initial values are kept in the config
+        assert chain.config == {"scale": 1.0, "stretch": 0.0}
+        for i, values in enumerate(batch.values):
+            refiner = Refiner(
+                self._chain(), self.x, self.y, self.x, self.y_target[i]
+            )
+            cost = refiner.refine("scale", "stretch")
+            assert costs[i] == pytest.approx(cost, rel=1e-6)
+            assert batch.results[i].cost == costs[i]
+            assert values["scale"] == pytest.approx(
+                refiner.chain.config["scale"], rel=1e-5
+            )
+            assert values["stretch"] == pytest.approx(
+                refiner.chain.config["stretch"], abs=1e-7
+            )
+        return
+
+    def test_loop(self, setup):
+        """problems run in turn when vectorized is False"""
+        chain = MorphChain(
+            {"scale": 1.0, "stretch": 0.0}, MorphScale(), MorphStretch()
+        )
+        batch = BatchRefiner(
+            chain, self.x, self.y_target[0], self.x, self.y_target
+        )
+        batch.vectorized = False
+        batch.chunksize = 3
+        costs = batch.refine("scale", "stretch")
+        assert costs[0] == pytest.approx(0, abs=1e-12)
+        for i, values in enumerate(batch.values):
+            chain.config.update(scale=1.0, stretch=0.0)
+            refiner = Refiner(
+                chain, self.x, self.y_target[0], self.x, self.y_target[i]
+            )
+            cost = refiner.refine("scale", "stretch")
+            assert costs[i] == pytest.approx(cost, rel=1e-5, abs=1e-12)
+        return
+
+    def test_builtin(self, setup, monkeypatch):
+        """chains of the built-in morphs are stacked by default"""
+        config = {
+            "scale": 1.0,
+            "stretch": 0.0,
+            "smear": 0.1,
+            "baselineslope": -0.5,
+        }
+        chain = MorphChain(
+            config,
+            MorphScale(),
+            MorphStretch(),
+            TransformXtalPDFtoRDF(),
+            MorphSmear(),
+            TransformXtalRDFtoPDF(),
+        )
+        # targets from stacked parameters
+        truth = numpy.column_stack([self.truth[:4], [0.1, 0.15, 0.2, 0.25]])
+        config.update(zip(["scale", "stretch", "smear"], truth.T[:, :, None]))
+        y_target = chain(self.x, self.y, self.x, self.y_target[:4])[1]
+        config.update(scale=1.0, stretch=0.0, smear=0.1)
+        calls = []
+        call = MorphChain.__call__
+
+        def counted(self, *xyall):
+            calls.append(numpy.ndim(xyall[1]))
+            return call(self, *xyall)
+
+        monkeypatch.setattr(MorphChain, "__call__", counted)
+        batch = BatchRefiner(chain, self.x, self.y, self.x, y_target)
+        stacked = batch.refine("scale", "stretch", "smear")
+        assert set(calls) == {2}
+        assert all(result.success for result in batch.results)
+        values = batch.values
+        for v, (scale, stretch, smear) in zip(values, truth):
+            assert v["scale"] == pytest.approx(scale, rel=1e-5)
+            assert v["stretch"] == pytest.approx(stretch, abs=1e-7)
+            assert v["smear"] == pytest.approx(smear, rel=1e-4)
+        calls.clear()
+        batch.vectorized = False
+        looped = batch.refine("scale", "stretch", "smear")
+        assert set(calls) == {1}
+        assert numpy.allclose(stacked, looped, atol=1e-12)
+        for v, w in zip(values, batch.values):
+            assert v == pytest.approx(w, rel=1e-6)
+        assert config["smear"] == 0.1
+        return
+
+    def test_rejected(self, setup):
+        """small rejected steps do not end the refinement"""
+
+        def cliff(r, y, scale):
+            return numpy.where(scale > 1.001, 10.0, scale) * (1 + 0 * r)
+
+        chain = MorphChain({"scale": 1.0}, MorphFunction(cliff, ["scale"]))
+        y_target = numpy.full((2, len(self.x)), 1.05)
+        batch = BatchRefiner(chain, self.x, self.y, self.x, y_target)
+        batch.xtol = 1e-2
+        batch.refine("scale")
+        # the steps past the cliff are rejected until they are short
+        # enough to be accepted
+        for values, result in zip(batch.values, batch.results):
+            assert 1.0 < values["scale"] <= 1.001
+            assert result.success
+        return
+
+    def test_initial(self, setup):
+        """problems start from their own values and respect bounds"""
+        batch = BatchRefiner(
+            self._chain(), self.x, self.y, self.x, self.y_target
+        )
+        batch.vectorized = True
+        batch.maxiter = 0
+        scales = numpy.linspace(1, 2, len(self.truth))
+        costs = batch.refine("scale", "stretch", scale=scales, stretch=0.01)
+        assert numpy.array_equal([v["scale"] for v in batch.values], scales)
+        assert all(v["stretch"] == 0.01 for v in batch.values)
+        assert all(r.status == 5 for r in batch.results)
+        assert all(r.nfev == 1 for r in batch.results)
+        assert not any(r.success for r in batch.results)
+
+        batch.maxiter = 100
+        batch.bounds = {"scale": (None, 1.0)}
+        costs = batch.refine("scale", "stretch")
+        for values, (scale, stretch) in zip(batch.values, self.truth):
+            assert values["scale"] <= 1.0
+            if scale < 0.95:
+                assert values["scale"] == pytest.approx(scale, rel=1e-2)
+        assert numpy.all(numpy.isfinite(costs))
+        return
+
+    def test_nonfinite(self, setup):
+        """problems with a non-finite residual are retired"""
+        self.y_target[2, 5] = numpy.nan
+        batch = BatchRefiner(
+            self._chain(), self.x, self.y, self.x, self.y_target
+        )
+        batch.vectorized = True
+        batch.refine("scale", "stretch")
+        assert batch.results[2].status == 0
+        assert not batch.results[2].success
+        assert batch.results[2].nfev == 1
+        assert batch.results[3].success
+        return
+
+
+# End of class TestBatchRefiner
+
+if __name__ == "__main__":
+    TestBatchRefiner()
+
+# End of file
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph.jointrefine import JointRefiner
+from diffpy.pdfmorph.morphs.morphchain import MorphChain
+from diffpy.pdfmorph.morphs.morphscale import MorphScale
+from diffpy.pdfmorph.morphs.morphshape import MorphSphere
+from diffpy.pdfmorph.morphs.morphstretch import MorphStretch
+from diffpy.pdfmorph.refine import Refiner
+
+
+class TestJointRefiner:
+    @pytest.fixture
+    def setup(self):
+        self.x = numpy.arange(0.01, 30, 0.01)
+        self.y = numpy.sin(5 * self.x) * numpy.exp(-0.05 * self.x)
+        self.truth = [(1.0, 0.0), (1.5, 0.004), (2.0, 0.008)]
+        self.refiners = []
+        for scale, stretch in self.truth:
+            config = {"scale": scale, "stretch": stretch, "radius": 15.0}
+            chain = MorphChain(
+                config, MorphScale(), MorphStretch(), MorphSphere()
+            )
+            y_target = chain(self.x, self.y, self.x, self.y)[1].copy()
+            config = {"scale": 1.0, "stretch": 0.0, "radius": 20.0}
+            chain = MorphChain(
+                config, MorphScale(), MorphStretch(), MorphSphere()
+            )
+            self.refiners.append(
+                Refiner(chain, self.x, self.y, self.x, y_target)
+            )
+        return
+
+    def test_refine(self, setup):
+        """refine a shared radius and per-dataset scale and stretch"""
+        joint = JointRefiner(self.refiners)
+        cost = joint.refine("scale", "stretch", shared=["radius"])
+        assert cost == pytest.approx(0, abs=1e-8)
+        assert joint.result.success
+        assert len(joint.result.x) == 1 + 2 * len(self.truth)
+        assert len(joint.values) == len(self.truth)
+        for values, refiner, (scale, stretch) in zip(
+            joint.values, self.refiners, self.truth
+        ):
+            assert values["radius"] == pytest.approx(15.0, rel=1e-4)
+            assert values["scale"] == pytest.approx(scale, rel=1e-4)
+            assert values["stretch"] == pytest.approx(stretch, abs=1e-6)
+            assert refiner.chain.config["radius"] == values["radius"]
+        return
+
+    def test_sparsity(self, setup):
+        """the jacobian pattern couples datasets only through shared pars"""
+        joint = JointRefiner(self.refiners)
+        joint.shared = ["radius"]
+        joint.pars = ["scale", "stretch"]
+        for refiner in self.refiners:
+            refiner.pars = joint.shared + joint.pars
+        pvals = numpy.array([20.0] + [1.0, 0.0] * len(self.truth))
+        sparsity = joint._sparsity(pvals).toarray()
+        npts = len(self.x)
+        assert sparsity.shape == (npts * len(self.truth), len(pvals))
+        assert sparsity.sum() == 3 * npts * len(self.truth)
+        assert sparsity[:, 0].all()
+        assert sparsity[:npts, 1:3].all()
+        assert not sparsity[:npts, 3:].any()
+        assert sparsity[-npts:, -2:].all()
+        return
+
+    def test_kwargs(self, setup):
+        """initial values are set in all chains"""
+        joint = JointRefiner(self.refiners)
+        joint.refine("scale", radius=15.0)
+        for refiner in self.refiners:
+            assert refiner.chain.config["radius"] == 15.0
+        assert joint.values[0] == {"scale": pytest.approx(1.0)}
+        return
+
+
+# End of class TestJointRefiner
+
+if __name__ == "__main__":
+    TestJointRefiner()
+
+# End of file
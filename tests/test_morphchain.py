@@ -2,6 +2,7 @@
 
 
 import os
+import pickle
 
 import numpy
 import pytest
@@ -54,6 +55,21 @@ class TestMorphChain:
         assert numpy.allclose(y_morph, y_target)
         return
 
+    def test_pickle(self, setup):
+        """chains and their morphs can be pickled"""
+        config = {"rmin": 1, "rmax": 6, "rstep": 0.1, "scale": 3.0}
+        chain = MorphChain(config, MorphRGrid(), MorphScale())
+        chain(self.x_morph, self.y_morph, self.x_target, self.y_target)
+        copy = pickle.loads(pickle.dumps(chain))
+        assert copy.config == config
+        assert copy[1].config is copy.config
+        assert copy.scale == 3.0
+        x_morph, y_morph, x_target, y_target = copy(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        assert numpy.allclose(y_morph, chain.y_morph_out)
+        return
+
 
 # End of class TestMorphChain
 
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph.morphs.morphchain import MorphChain
+from diffpy.pdfmorph.morphs.morphfunction import MorphFunction
+from diffpy.pdfmorph.morphs.morphrgrid import MorphRGrid
+from diffpy.pdfmorph.refine import Refiner
+
+
+def envelope(r, y, amp, decay):
+    return amp * numpy.exp(-decay * r) * y
+
+
+def envelope_jacobian(r, y, amp, decay):
+    f = numpy.exp(-decay * r) * y
+    return [f, -amp * r * f]
+
+
+class TestMorphFunction:
+    @pytest.fixture
+    def setup(self):
+        self.x_morph = numpy.arange(0.01, 10, 0.01)
+        self.y_morph = numpy.sin(3 * self.x_morph)
+        self.x_target = self.x_morph.copy()
+        self.y_target = envelope(self.x_target, self.y_morph, 1.5, 0.2)
+        return
+
+    def test_morph(self, setup):
+        """check MorphFunction.morph()"""
+        morph = MorphFunction(envelope, ["amp", "decay"])
+        morph.amp = 1.5
+        morph.decay = 0.2
+
+        x_morph, y_morph, x_target, y_target = morph(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+
+        assert numpy.allclose(y_morph, self.y_target)
+        # Inputs are passed through without copies
+        assert x_morph is self.x_morph
+        assert y_target is self.y_target
+        return
+
+    def test_morph_stacked(self, setup):
+        """stacked profiles are morphed in one call"""
+        morph = MorphFunction(envelope, ["amp", "decay"])
+        morph.config.update(amp=1.5, decay=0.2)
+        y_stack = numpy.vstack([self.y_morph, 2 * self.y_morph])
+        y_morph = morph(self.x_morph, y_stack, self.x_target, self.y_target)[1]
+        assert numpy.allclose(y_morph[0], self.y_target)
+        assert numpy.allclose(y_morph[1], 2 * self.y_target)
+        return
+
+    def test_derivatives(self, setup):
+        """analytic derivatives agree with finite differences"""
+        config = {"amp": 1.2, "decay": 0.1}
+        morph = MorphFunction(envelope, ["amp", "decay"], envelope_jacobian)
+        morph.applyConfig(config)
+        y0 = morph(self.x_morph, self.y_morph, self.x_target, self.y_target)[1]
+        jac = morph.derivatives()
+        assert jac.shape == (2, len(self.x_morph))
+        config["decay"] += 1e-7
+        y1 = morph(self.x_morph, self.y_morph, self.x_target, self.y_target)[1]
+        assert numpy.allclose((y1 - y0) / 1e-7, jac[1], atol=1e-5)
+        assert MorphFunction(envelope, ["amp"]).derivatives() is None
+        return
+
+    def test_refine_jacobian(self, setup):
+        """refine a chain that ends with an analytic jacobian"""
+        calls = []
+
+        def jacobian(r, y, amp, decay):
+            calls.append((amp, decay))
+            return envelope_jacobian(r, y, amp, decay)
+
+        config = {"rmin": None, "rmax": None, "rstep": None}
+        config.update(amp=1.0, decay=0.0)
+        chain = MorphChain(config)
+        chain.append(MorphRGrid())
+        chain.append(MorphFunction(envelope, ["amp", "decay"], jacobian))
+        refiner = Refiner(
+            chain, self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        refiner.refine("amp", "decay")
+
+        assert calls
+        assert numpy.isclose(config["amp"], 1.5)
+        assert numpy.isclose(config["decay"], 0.2)
+        return
+
+
+# End of class TestMorphFunction
+
+if __name__ == "__main__":
+    TestMorphFunction()
+
+# End of file
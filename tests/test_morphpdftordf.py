@@ -46,6 +46,37 @@ class TestTransformXtalPDFtoRDF:
         assert numpy.allclose(rdf2, y_target)
         return
 
+    def test_transform_stacked(self, setup):
+        """stacked profiles are transformed row by row"""
+        config = {"baselineslope": -1.0}
+        transform = TransformXtalPDFtoRDF(config)
+        y_morph = numpy.vstack([self.y_morph, 2 * self.y_morph + 1])
+
+        x_morph, y_stack, x_target, y_target = transform(
+            self.x_morph, y_morph, self.x_target, self.y_target
+        )
+
+        assert y_stack.shape == y_morph.shape
+        rdf1 = numpy.exp(-0.5 * (x_morph - 1.0) ** 2)
+        assert numpy.allclose(rdf1, y_stack[0])
+        assert numpy.allclose(2 * rdf1 - x_morph**2 + x_morph, y_stack[1])
+        # Inputs are not modified
+        assert numpy.allclose(y_morph[0], self.y_morph)
+        return
+
+    def test_grid_changed_in_place(self, setup):
+        """cached r-grid terms follow in-place changes of the grid"""
+        config = {"baselineslope": -1.0}
+        transform = TransformXtalPDFtoRDF(config)
+        x_morph = self.x_morph.copy()
+        transform(x_morph, self.y_morph, self.x_target, self.y_target)
+        x_morph *= 2
+        y_out = transform(x_morph, self.y_morph, self.x_target, self.y_target)[
+            1
+        ]
+        assert numpy.allclose(y_out, x_morph * (self.y_morph + x_morph))
+        return
+
 
 # End of class TestTransformXtalPDFtoRDF
 
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+
+import os
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph.morphs.morphqspace import (
+    MorphQmax,
+    MorphQmin,
+    MorphQSmear,
+)
+
+# useful variables
+thisfile = locals().get("__file__", "file.py")
+tests_dir = os.path.dirname(os.path.abspath(thisfile))
+testdata_dir = os.path.join(tests_dir, "testdata")
+
+
+class TestMorphQSpace:
+    @pytest.fixture
+    def setup(self):
+        self.sigma = 0.1
+        self.r0 = 7 * numpy.pi / 22.0 * 2
+        self.x_morph = numpy.arange(0.01, 10, 0.01)
+        self.y_morph = numpy.exp(
+            -0.5 * ((self.x_morph - self.r0) / self.sigma) ** 2
+        )
+        self.x_target = self.x_morph.copy()
+        self.y_target = self.x_target.copy()
+        return
+
+    def test_qsmear(self, setup):
+        """check MorphQSmear.morph()"""
+        morph = MorphQSmear()
+        morph.qsmear = 0.15
+
+        x_morph, y_morph, x_target, y_target = morph(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+
+        # Target should be unchanged
+        assert numpy.allclose(self.y_target, y_target)
+
+        # Compare to broadened Gaussian
+        sigbroad = (self.sigma**2 + morph.qsmear**2) ** 0.5
+        ysmear = numpy.exp(-0.5 * ((self.x_morph - self.r0) / sigbroad) ** 2)
+        ysmear *= self.sigma / sigbroad
+        assert numpy.allclose(ysmear, y_morph, atol=1e-6)
+        return
+
+    def test_qsmear_zero(self, setup):
+        """zero smear leaves the morph unchanged"""
+        morph = MorphQSmear({"qsmear": 0.0})
+        x_morph, y_morph, x_target, y_target = morph(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        assert numpy.allclose(self.y_morph, y_morph)
+        return
+
+    def test_termination(self, setup):
+        """Qmin and Qmax at the same cutoff split the signal"""
+        config = {"qmincut": 12.3, "qmaxcut": 12.3}
+        mqmin = MorphQmin(config)
+        mqmax = MorphQmax(config)
+        ylow = mqmax(self.x_morph, self.y_morph, self.x_target, self.y_target)[
+            1
+        ]
+        yhigh = mqmin(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )[1]
+        assert not numpy.allclose(ylow, self.y_morph)
+        assert numpy.allclose(ylow + yhigh, self.y_morph)
+        return
+
+    def test_qmax_data(self):
+        """terminating above the data Qmax does not change the data"""
+        morph_file = os.path.join(testdata_dir, "ni_qmax25.cgr")
+        x_morph, y_morph = numpy.loadtxt(morph_file, unpack=True)
+        morph = MorphQmax({"qmaxcut": 30.0})
+        y_out = morph(x_morph, y_morph, x_morph, y_morph)[1]
+        sel = x_morph < 15
+        assert numpy.allclose(y_out[sel], y_morph[sel], atol=1e-3)
+        return
+
+    def test_transform_cache(self, setup):
+        """the forward transform is reused for unchanged inputs"""
+        morph = MorphQSmear({"qsmear": 0.1})
+        morph(self.x_morph, self.y_morph, self.x_target, self.y_target)
+        fq = morph.transform(self.x_morph, self.y_morph)[2]
+        morph.qsmear = 0.2
+        morph(
+            self.x_morph.copy(),
+            self.y_morph.copy(),
+            self.x_target,
+            self.y_target,
+        )
+        assert morph.transform(self.x_morph, self.y_morph)[2] is fq
+        morph(self.x_morph, 2 * self.y_morph, self.x_target, self.y_target)
+        assert morph.transform(self.x_morph, 2 * self.y_morph)[2] is not fq
+        return
+
+
+# End of class TestMorphQSpace
+
+if __name__ == "__main__":
+    TestMorphQSpace()
+
+# End of file
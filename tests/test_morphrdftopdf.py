@@ -40,6 +40,40 @@ class TestTransformXtalRDFtoPDF:
         assert numpy.allclose(rdf2, y_target)
         return
 
+    def test_transform_zero(self, setup):
+        """r = 0 is masked on each grid independently"""
+        config = {"baselineslope": -1.0}
+        transform = TransformXtalRDFtoPDF(config)
+        x_morph = numpy.arange(0, 5, 0.01)
+        y_morph = numpy.exp(-0.5 * (x_morph - 1.0) ** 2)
+
+        x_morph, y_morph, x_target, y_target = transform(
+            x_morph, y_morph, self.x_target, self.y_target
+        )
+
+        assert y_morph[0] == 0
+        assert numpy.all(numpy.isfinite(y_morph))
+        pdf1 = numpy.exp(-0.5 * (x_morph[1:] - 1.0) ** 2) / x_morph[1:]
+        assert numpy.allclose(pdf1 - x_morph[1:], y_morph[1:])
+        return
+
+    def test_transform_stacked(self, setup):
+        """stacked profiles are transformed row by row"""
+        config = {"baselineslope": -1.0}
+        transform = TransformXtalRDFtoPDF(config)
+        y_morph = numpy.vstack([self.y_morph, 2 * self.y_morph])
+
+        x_morph, y_stack, x_target, y_target = transform(
+            self.x_morph, y_morph, self.x_target, self.y_target
+        )
+
+        for row, y in zip(y_stack, y_morph):
+            expected = transform(
+                self.x_morph, y, self.x_target, self.y_target
+            )[1]
+            assert numpy.allclose(expected, row)
+        return
+
 
 # End of class TestTransformXtalRDFtoPDF
 
@@ -6,7 +6,12 @@ import os
 import numpy
 import pytest
 
-from diffpy.pdfmorph.morphs.morphrgrid import MorphRGrid
+from diffpy.pdfmorph.morphs.morphrgrid import (
+    MorphRGrid,
+    decimation_kernel,
+    nyquistStep,
+)
+from diffpy.pdfmorph.pdfmorph_api import morph_default_config, pdfmorph
 
 # useful variables
 thisfile = locals().get("__file__", "file.py")
@@ -105,6 +110,134 @@ class TestMorphRGrid:
         self._runTests(xyallout, morph)
         return
 
+    @pytest.mark.parametrize("rfilter", ["box", "sinc"])
+    def testFilter(self, setup, rfilter):
+        """Low-pass filter before resampling onto a coarser grid"""
+
+        config = {
+            "rmin": 1.0,
+            "rmax": 4.0,
+            "rstep": 0.1,
+            "rfilter": rfilter,
+        }
+        # ripple at the Nyquist frequency of the input grid
+        ripple = 0.5 * (-1) ** numpy.arange(len(self.x_target))
+        morph = MorphRGrid(config)
+        xyallout = morph(
+            self.x_morph,
+            self.y_morph,
+            self.x_target,
+            self.y_target + ripple,
+        )
+        self._runTests(xyallout, morph)
+        x_morph, y_morph, x_target, y_target = xyallout
+        # smooth profiles are kept and the ripple is removed away from the
+        # edge of the target
+        assert numpy.allclose(y_morph, x_morph)
+        sel = x_target > 1.5
+        assert numpy.allclose(y_target[sel], x_target[sel] ** 2, atol=1e-2)
+        # point sampling keeps the ripple
+        config["rfilter"] = None
+        y_target = morph(
+            self.x_morph,
+            self.y_morph,
+            self.x_target,
+            self.y_target + ripple,
+        )[3]
+        assert not numpy.allclose(y_target, x_target**2, atol=0.1)
+        return
+
+    def testFilterSameStep(self, setup):
+        """No filter is applied when the grid is not coarser"""
+
+        config = {"rmin": 1.0, "rmax": 2.0, "rstep": 0.01, "rfilter": "sinc"}
+        morph = MorphRGrid(config)
+        y_morph = morph(
+            self.x_morph, self.y_morph**3, self.x_target, self.y_target
+        )[1]
+        assert numpy.allclose(y_morph, morph.x_morph_out**3)
+        return
+
+    def testNyquist(self, setup):
+        """Nyquist grid for a given Qmax"""
+
+        config = {"rmin": 1.0, "rmax": 4.0, "rstep": None, "qmax": 25.0}
+        morph = MorphRGrid(config)
+        xyallout = morph(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        assert numpy.isclose(morph.rstep, numpy.pi / 25)
+        self._runTests(xyallout, morph)
+        # multiple of the Nyquist spacing
+        config.update(rstep=None, nyquist=0.5)
+        morph(self.x_morph, self.y_morph, self.x_target, self.y_target)
+        assert numpy.isclose(morph.rstep, numpy.pi / 50)
+        # an explicit rstep is kept
+        config.update(rstep=0.05)
+        morph(self.x_morph, self.y_morph, self.x_target, self.y_target)
+        assert morph.rstep == 0.05
+        return
+
+    def testFilterPdfmorph(self):
+        """pdfmorph compares a noisy profile on a filtered coarse grid"""
+
+        sigma0 = 0.3
+        r0 = 2.5
+        x_target = numpy.arange(0.01, 5, 0.01)
+        y_target = numpy.exp(-0.5 * ((x_target - r0) / sigma0) ** 2)
+        x_morph = x_target.copy()
+        y_morph = 2 * y_target + 0.2 * (-1) ** numpy.arange(len(x_morph))
+        cfg = morph_default_config(scale=1.0)
+        morph_rv = pdfmorph(
+            x_morph,
+            y_morph,
+            x_target,
+            y_target,
+            rstep=0.1,
+            rfilter="sinc",
+            **cfg,
+        )
+        morphed_cfg = morph_rv["morphed_config"]
+        assert morphed_cfg["rfilter"] == "sinc"
+        assert numpy.allclose(0.5, morphed_cfg["scale"], atol=1e-3)
+        return
+
+    def testNyquistPdfmorph(self):
+        """pdfmorph compares on a multiple of the Nyquist grid"""
+
+        x_target = numpy.arange(0.01, 5, 0.01)
+        y_target = numpy.sin(10 * x_target)
+        x_morph = x_target.copy()
+        y_morph = 2 * y_target
+        cfg = morph_default_config(scale=1.0)
+        morph_rv = pdfmorph(
+            x_morph, y_morph, x_target, y_target, qmax=25, nyquist=0.5, **cfg
+        )
+        chain = morph_rv["morph_chain"]
+        assert numpy.isclose(chain.config["rstep"], numpy.pi / 50)
+        assert numpy.allclose(0.5, morph_rv["morphed_config"]["scale"])
+        return
+
+    def testNyquistStep(self):
+        """r-spacing of a multiple of the Nyquist sampling"""
+
+        assert numpy.isclose(nyquistStep(25), numpy.pi / 25)
+        assert numpy.isclose(nyquistStep(25, 0.5), numpy.pi / 50)
+        return
+
+    def testKernel(self):
+        """Decimation kernels are normalized and cached per ratio"""
+
+        for rfilter in ["box", "sinc"]:
+            kernel = decimation_kernel(rfilter, 2.5)
+            assert numpy.isclose(kernel.sum(), 1)
+            assert numpy.allclose(kernel, kernel[::-1])
+            assert decimation_kernel(rfilter, 2.5) is kernel
+        assert len(decimation_kernel("box", 3.0)) == 5
+        with pytest.raises(ValueError):
+            decimation_kernel("gauss", 2.0)
+        return
+
 
 # End of class TestMorphRGrid
 
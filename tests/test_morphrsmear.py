@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph.morphs.morphrsmear import MorphRSmear
+from diffpy.pdfmorph.pdfmorph_api import pdfmorph
+
+
+def gaussians(r, centers, sigma0, sigma2=0.0):
+    """Normalized Gaussians with width sqrt(sigma0**2 + sigma2 * r0**2)."""
+    y = numpy.zeros_like(r)
+    for r0 in centers:
+        s = (sigma0**2 + sigma2 * r0**2) ** 0.5
+        y += numpy.exp(-0.5 * ((r - r0) / s) ** 2) / s
+    return y
+
+
+class TestMorphRSmear:
+    @pytest.fixture
+    def setup(self):
+        self.smear = 0.1
+        self.centers = [3.0, 8.0, 15.0]
+        self.x_morph = numpy.arange(0.01, 20, 0.01)
+        self.y_morph = gaussians(self.x_morph, self.centers, self.smear)
+        self.x_target = self.x_morph.copy()
+        self.y_target = self.x_target.copy()
+        return
+
+    def test_morph(self, setup):
+        """check MorphRSmear.morph() with a constant width"""
+        morph = MorphRSmear()
+        morph.rsmear = 0.15
+
+        x_morph, y_morph, x_target, y_target = morph(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+
+        # Target should be unchanged
+        assert numpy.allclose(self.y_target, y_target)
+        assert morph.rsmear1 == 0
+        assert morph.rsmear2 == 0
+
+        # Compare to broadened Gaussian
+        sigbroad = (self.smear**2 + morph.rsmear**2) ** 0.5
+        ysmear = gaussians(self.x_morph, self.centers, sigbroad)
+        assert numpy.allclose(ysmear, y_morph, atol=1e-4)
+        return
+
+    def test_rdependent(self, setup):
+        """the broadening grows with r and conserves the integral"""
+        config = {"rsmear": 0.05, "rsmear1": 0.0, "rsmear2": 4e-4}
+        morph = MorphRSmear(config)
+        y_morph = morph(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )[1]
+        assert numpy.isclose(y_morph.sum(), self.y_morph.sum())
+        # peak heights drop as the peaks broaden, more at high r
+        idx = [numpy.argmin(abs(self.x_morph - r0)) for r0 in self.centers]
+        ratio = y_morph[idx] / self.y_morph[idx]
+        assert numpy.all(numpy.diff(ratio) < 0)
+        # and approximately follow the width at their centers
+        sigbroad = (self.smear**2 + 0.05**2) ** 0.5
+        ybroad = gaussians(self.x_morph, self.centers, sigbroad, 4e-4)
+        assert numpy.allclose(ybroad[idx], y_morph[idx], rtol=1e-2)
+        return
+
+    def test_zero(self, setup):
+        """zero and negative widths leave the morph unchanged"""
+        morph = MorphRSmear({"rsmear": 0.0, "rsmear1": -0.1, "rsmear2": 0})
+        y_morph = morph(
+            self.x_morph, self.y_morph, self.x_target, self.y_target
+        )[1]
+        assert numpy.allclose(self.y_morph, y_morph)
+        return
+
+    def test_band_cache(self, setup):
+        """the band structure is reused for the same grid and band width"""
+        morph = MorphRSmear({"rsmear": 0.099})
+        morph(self.x_morph, self.y_morph, self.x_target, self.y_target)
+        offsets = morph.band(self.x_morph, 50)[0]
+        assert len(offsets) == 101
+        morph.rsmear = 0.0995
+        morph(self.x_morph, self.y_morph, self.x_target, self.y_target)
+        assert morph.band(self.x_morph, 50)[0] is offsets
+        assert morph.band(self.x_morph, 51)[0] is not offsets
+        return
+
+    def test_refine(self, setup):
+        """r-dependent smear is refined through pdfmorph"""
+        x = self.x_morph
+        y_target = gaussians(x, self.centers, 0.12, 4e-4)
+        rv = pdfmorph(
+            x,
+            self.y_morph / x,
+            x,
+            y_target / x,
+            rsmear=0.05,
+            rsmear2=1e-4,
+            baselineslope=0.0,
+            fixed_operations=["baselineslope"],
+        )
+        cfg = rv["morphed_config"]
+        assert numpy.isclose(cfg["rsmear"] ** 2, 0.12**2 - 0.1**2, rtol=0.05)
+        assert numpy.isclose(cfg["rsmear2"], 4e-4, rtol=0.05)
+        assert cfg["rsmear1"] == 0
+        return
+
+    def test_default_baselineslope(self, setup):
+        """pdfmorph guesses the baselineslope for rsmear alone"""
+        x = self.x_morph
+        rv = pdfmorph(x, self.y_morph, x, self.y_target, rsmear=0.05)
+        cfg = rv["morphed_config"]
+        assert "baselineslope" in cfg
+        assert numpy.isfinite(cfg["rsmear"])
+        assert numpy.isfinite(rv["rw"])
+        rv = pdfmorph(
+            x, self.y_morph, x, self.y_target, rsmear=0.05, baselineslope=0.0
+        )
+        assert rv["morphed_config"]["baselineslope"] != -0.5
+        return
+
+
+# End of class TestMorphRSmear
+
+if __name__ == "__main__":
+    TestMorphRSmear()
+
+# End of file
@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 
+import json
 from pathlib import Path
 
+import numpy
 import pytest
 
 from diffpy.pdfmorph.pdfmorphapp import (
     create_option_parser,
     multiple_targets,
     single_morph,
+    warm_start_options,
 )
 
 thisfile = locals().get("__file__", "file.py")
@@ -16,6 +19,8 @@ testdata_dir = tests_dir.joinpath("testdata")
 testsequence_dir = testdata_dir.joinpath("testsequence")
 
 nickel_PDF = testdata_dir.joinpath("nickel_ss0.01.cgr")
+qmax_PDF = testdata_dir.joinpath("ni_qmax25.cgr")
+qmax_qdamp_PDF = testdata_dir.joinpath("ni_qmax25_qdamp0.01.cgr")
 serial_JSON = testdata_dir.joinpath("testsequence_serialfile.json")
 
 testsaving_dir = testdata_dir.joinpath("testsaving")
@@ -53,6 +58,7 @@ class TestApp:
         n_names = [
             "--rmin",
             "--rmax",
+            "--rstep",
             "--scale",
             "--smear",
             "--stretch",
@@ -62,6 +68,7 @@ class TestApp:
         n_values = [
             "2.5",
             "40",
+            "0.05",
             "2.1",
             "-0.8",
             "0.0000005",
@@ -197,6 +204,306 @@ class TestApp:
         with pytest.raises(SystemExit):
             multiple_targets(self.parser, opts, pargs, stdout_flag=False)
 
+    def test_rfilter(self, setup_morphsequence):
+        morph_file, target_file = self.testfiles[:2]
+        pargs = [morph_file, target_file]
+        results = {}
+        for rfilter in [None, "box", "sinc"]:
+            args = ["--scale", "1", "--stretch", "0", "--rstep", "0.1", "-n"]
+            if rfilter is not None:
+                args += ["--rfilter", rfilter]
+            (opts, _) = self.parser.parse_args(args)
+            results[rfilter] = single_morph(
+                self.parser, opts, pargs, stdout_flag=False
+            )
+            assert results[rfilter]["rstep"] == pytest.approx(0.1)
+            assert "rfilter" not in results[rfilter]
+        # the filters only change the comparison grid sampling
+        for rfilter in ["box", "sinc"]:
+            for par in ["scale", "stretch"]:
+                assert results[rfilter][par] == pytest.approx(
+                    results[None][par], rel=1e-2, abs=1e-4
+                )
+        with pytest.raises(SystemExit):
+            self.parser.parse_args(["--rfilter", "gauss"])
+
+    def test_backend(self, setup_parser):
+        pargs = [nickel_PDF, nickel_PDF]
+        results = {}
+        for backend in ["leastsq", "least_squares", "nelder-mead"]:
+            (opts, _) = self.parser.parse_args(
+                ["--scale", "1.1", "--backend", backend, "-n"]
+            )
+            results[backend] = single_morph(
+                self.parser, opts, pargs, stdout_flag=False
+            )
+            assert results[backend]["scale"] == pytest.approx(1, abs=1e-3)
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1.1", "--backend", "unknown", "-n"]
+        )
+        with pytest.raises(SystemExit):
+            single_morph(self.parser, opts, pargs, stdout_flag=False)
+
+    def test_pyramid(self, setup_morphsequence):
+        morph_file, target_file = self.testfiles[:2]
+        pargs = [morph_file, target_file]
+        results = {}
+        for pyramid in [None, "4,2"]:
+            args = ["--scale", "1", "--stretch", "0", "-n"]
+            if pyramid is not None:
+                args += ["--pyramid", pyramid]
+            (opts, _) = self.parser.parse_args(args)
+            results[pyramid] = single_morph(
+                self.parser, opts, pargs, stdout_flag=False
+            )
+            assert "rfilter" not in results[pyramid]
+        for par in ["scale", "stretch", "rstep"]:
+            assert results["4,2"][par] == pytest.approx(results[None][par])
+        (opts, _) = self.parser.parse_args(["--pyramid", "4,x", "-n"])
+        with pytest.raises(SystemExit):
+            single_morph(self.parser, opts, pargs, stdout_flag=False)
+
+    def test_pearson(self, setup_morphsequence):
+        morph_file, target_file = self.testfiles[:2]
+        pargs = [morph_file, target_file]
+        results = {}
+        for flag in ["--pearson", "--addpearson"]:
+            (opts, _) = self.parser.parse_args(
+                ["--scale", "1", "--stretch", "0", flag, "-n"]
+            )
+            results[flag] = single_morph(
+                self.parser, opts, pargs, stdout_flag=False
+            )
+            assert results[flag]["Pearson"] > 0.99
+        # the Rw term of --addpearson also fixes the scale
+        assert results["--addpearson"]["Rw"] < results["--pearson"]["Rw"]
+
+    def test_varpro(self, setup_morphsequence):
+        morph_file, target_file = self.testfiles[:2]
+        pargs = [morph_file, target_file]
+        results = {}
+        for varpro in [False, True]:
+            args = ["--scale", "1", "--stretch", "0", "--smear", "0.01", "-n"]
+            if varpro:
+                args.append("--varpro")
+            (opts, _) = self.parser.parse_args(args)
+            results[varpro] = single_morph(
+                self.parser, opts, pargs, stdout_flag=False
+            )
+        # smear and baselineslope are barely determined by these data
+        for par in ["scale", "stretch", "Rw"]:
+            assert results[True][par] == pytest.approx(
+                results[False][par], rel=1e-3
+            )
+
+    def test_budgets(self, setup_parser, capsys):
+        pargs = [nickel_PDF, nickel_PDF]
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1.1", "--stretch", "0.01", "--max-nfev", "3", "-n"]
+        )
+        results = single_morph(self.parser, opts, pargs, stdout_flag=True)
+        assert results["Rw"] > 0.01
+        out = capsys.readouterr().out
+        assert "# Refinement stopped early: The maximum number" in out
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1.1", "--stretch", "0.01", "--rw-target", "0.05"]
+            + ["--time-limit", "60", "-n"]
+        )
+        results = single_morph(self.parser, opts, pargs, stdout_flag=True)
+        assert 0 < results["Rw"] <= 0.05
+        out = capsys.readouterr().out
+        assert "# Refinement stopped early: The target Rw" in out
+
+    def test_schedule(self, setup_morphsequence, tmp_path):
+        morph_file, target_file = self.testfiles[:2]
+        pargs = [morph_file, target_file]
+        schedule_file = tmp_path / "schedule.json"
+        schedule_file.write_text('[{"pars": ["scale"], "coarsen": 2}, {}]')
+        results = {}
+        schedules = [None, "smear", "default", "shape", str(schedule_file)]
+        for schedule in schedules:
+            args = ["--scale", "1", "--stretch", "0", "--smear", "0.01", "-n"]
+            if schedule is not None:
+                args += ["--schedule", schedule]
+            (opts, _) = self.parser.parse_args(args)
+            results[schedule] = single_morph(
+                self.parser, opts, pargs, stdout_flag=False
+            )
+            assert results[schedule]["Rw"] < 1.01 * results[None]["Rw"]
+        # smear is refined with scale first by default
+        assert results["smear"] == results[None]
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--schedule", "unknown", "-n"]
+        )
+        with pytest.raises(SystemExit):
+            single_morph(self.parser, opts, pargs, stdout_flag=False)
+
+    def test_uncertainties(self, setup_morphsequence, capsys):
+        pargs = self.testfiles[:2]
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--stretch", "0", "-n"]
+        )
+        results = single_morph(self.parser, opts, pargs, stdout_flag=True)
+        assert 0 < results["scale_stderr"] < 0.01
+        assert 0 < results["stretch_stderr"] < 0.001
+        assert list(results)[-2:] == ["Rw", "Pearson"]
+        out = capsys.readouterr().out
+        assert "stderr" not in out
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--stretch", "0", "-n", "--verbose"]
+        )
+        single_morph(self.parser, opts, pargs, stdout_flag=True)
+        out = capsys.readouterr().out
+        assert "# scale_stderr = " in out
+        assert "# Correlations of the refined parameters:" in out
+        assert "# scale, stretch = " in out
+
+    def test_trace(self, setup_morphsequence, tmp_path):
+        trace = tmp_path / "trace.jsonl"
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--stretch", "0", "--trace", str(trace), "-n"]
+        )
+        for target_file in self.testfiles[1:3]:
+            pargs = [self.testfiles[0], target_file]
+            single_morph(self.parser, opts, pargs, stdout_flag=False)
+        with open(trace) as infile:
+            records = [json.loads(line) for line in infile]
+        labels = [record["label"] for record in records]
+        assert labels[0] == "g_174K.gr -> f_180K.gr"
+        assert labels[-1] == "g_174K.gr -> e_186K.gr"
+        assert any(record["probe"] for record in records)
+        assert set(records[0]["pars"]) == {"scale", "stretch"}
+
+    def test_scan(self, setup_parser, capsys, tmp_path):
+        pargs = [nickel_PDF, nickel_PDF]
+        scanfile = tmp_path / "landscape.npy"
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--stretch", "0.03", "--rstep", "0.1"]
+            + ["--scan", "scale=0.5:1.5:5", "--scan", "stretch=-0.02:0.02:5"]
+            + ["--scan-file", str(scanfile), "-a", "-n"]
+        )
+        results = single_morph(self.parser, opts, pargs, stdout_flag=True)
+        # the best grid point is applied without refinement
+        assert results["scale"] == pytest.approx(1)
+        assert results["stretch"] == pytest.approx(0)
+        assert results["Rw"] == pytest.approx(0)
+        out = capsys.readouterr().out
+        assert (
+            "# Best scanned point: scale = 1.000000, stretch = 0.0000" in out
+        )
+        landscape = numpy.load(scanfile)
+        assert landscape.shape == (4, 5, 5)
+        assert landscape[2, 2, 2] == pytest.approx(0)
+        assert scanfile.with_suffix(".png").is_file()
+        for scan in ["scale=0.5:1.5", "scale", "=1:2:3", "smear=0:1:3"]:
+            (opts, _) = self.parser.parse_args(
+                ["--scale", "1", "--scan", scan, "-n"]
+            )
+            with pytest.raises(SystemExit):
+                single_morph(self.parser, opts, pargs, stdout_flag=False)
+
+    def test_auto_init(self, setup_parser, tmp_path):
+        x, y = numpy.loadtxt(nickel_PDF, unpack=True)
+        target = tmp_path / "target.cgr"
+        numpy.savetxt(
+            target, numpy.transpose([x, 0.7 * numpy.interp(x / 1.04, x, y)])
+        )
+        pargs = [nickel_PDF, target]
+        argv = ["--scale", "1", "--stretch", "0", "-n"]
+        # the refinement gets stuck in a local minimum far from the target
+        (opts, _) = self.parser.parse_args(argv)
+        results = single_morph(self.parser, opts, pargs, stdout_flag=False)
+        assert results["Rw"] > 0.1
+        (opts, _) = self.parser.parse_args(argv + ["--auto-init"])
+        results = single_morph(self.parser, opts, pargs, stdout_flag=False)
+        assert results["scale"] == pytest.approx(0.7, rel=1e-3)
+        assert results["stretch"] == pytest.approx(0.04, rel=1e-3)
+        assert results["Rw"] < 0.01
+
+    def test_nyquist(self, setup_parser, capsys):
+        pargs = [qmax_PDF, qmax_qdamp_PDF]
+        # Qmax from the file headers
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--nyquist", "1", "-n"]
+        )
+        results = single_morph(self.parser, opts, pargs, stdout_flag=True)
+        assert results["rstep"] == pytest.approx(numpy.pi / 25)
+        assert "qmax" not in results and "nyquist" not in results
+        npts = len(
+            numpy.arange(results["rmin"], results["rmax"], numpy.pi / 25)
+        )
+        assert f"# Comparing {npts} points" in capsys.readouterr().out
+        # Qmax from the option, at a multiple of the Nyquist spacing
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--qmax", "20", "--nyquist", "0.5", "-n"]
+        )
+        results = single_morph(self.parser, opts, pargs, stdout_flag=False)
+        assert results["rstep"] == pytest.approx(numpy.pi / 40)
+        # An explicit rstep takes precedence
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--qmax", "20", "--rstep", "0.05", "-n"]
+        )
+        results = single_morph(self.parser, opts, pargs, stdout_flag=False)
+        assert results["rstep"] == pytest.approx(0.05)
+        # No Qmax in the file headers
+        (opts, _) = self.parser.parse_args(["--nyquist", "1", "-n"])
+        with pytest.raises(SystemExit):
+            single_morph(
+                self.parser, opts, [nickel_PDF, qmax_PDF], stdout_flag=False
+            )
+
+    def test_warm_start_options(self, setup_parser):
+        (opts, _) = self.parser.parse_args(
+            ["--scale", "1", "--stretch", "0", "--radius", "10"]
+            + ["--smear", "0.1"]
+        )
+        history = [
+            {"scale": 1.2, "stretch": 0.01, "radius": 6.0, "smear": 0.1},
+            {"scale": 1.4, "stretch": 0.02, "radius": 2.0, "smear": 0.2},
+        ]
+        for result, slope in zip(history, [-0.4, -0.3]):
+            result["baselineslope"] = slope
+        # the first morph starts from the given values
+        assert warm_start_options(opts, []).scale == 1
+        run_opts = warm_start_options(opts, history)
+        assert (run_opts.scale, run_opts.stretch) == (1.4, 0.02)
+        assert run_opts.radius == 2.0
+        # parameters with defaults are warm started too
+        assert (run_opts.smear, run_opts.baselineslope) == (0.2, -0.3)
+        assert opts.baselineslope is None
+        assert opts.scale == 1
+        # the radius of a sphere given as pradius stays in pradius
+        (popts, _) = self.parser.parse_args(["--pradius", "10"])
+        run_opts = warm_start_options(popts, history)
+        assert (run_opts.radius, run_opts.pradius) == (None, 2.0)
+        # extrapolate in the positions of the morphs
+        run_opts = warm_start_options(opts, history, [100, 110, 130], True)
+        assert numpy.isclose(run_opts.scale, 1.8)
+        assert numpy.isclose(run_opts.stretch, 0.04)
+        # keeping the radius positive
+        assert run_opts.radius == 2.0
+
+    def test_sequential(self, setup_morphsequence):
+        target_file = self.testfiles[-1]
+        results = {}
+        for extra in [[], ["--sequential"], ["--sequential", "--extrapolate"]]:
+            (opts, _) = self.parser.parse_args(
+                ["--scale", "1", "--stretch", "0", "--multiple-targets"]
+                + ["--sort-by", "temperature", "-n"]
+                + extra
+            )
+            results[len(extra)] = multiple_targets(
+                self.parser, opts, [target_file, testsequence_dir], False
+            )
+            assert opts.scale == 1
+        for n in [1, 2]:
+            assert list(results[n]) == list(results[0])
+            for name, result in results[n].items():
+                for par in ["scale", "stretch", "Rw"]:
+                    assert result[par] == pytest.approx(
+                        results[0][name][par], rel=1e-3, abs=1e-6
+                    )
+
     def test_morphsequence(self, setup_morphsequence):
         # Parse arguments sorting by field
         (opts, pargs) = self.parser.parse_args(
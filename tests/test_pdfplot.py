@@ -4,12 +4,15 @@
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
+import pytest
 
 from diffpy.pdfmorph.pdfmorph_api import (
     morph_default_config,
     pdfmorph,
     plot_morph,
 )
+from diffpy.pdfmorph.pdfplot import plotLandscape
+from diffpy.pdfmorph.refine import ScanResult
 from tests.test_morphstretch import heaviside
 
 
@@ -30,3 +33,22 @@ def test_plot_morph():
     fig, ax = plt.subplots()
     l_list = plot_morph(chain, ax)
     assert all([isinstance(x, mpl.lines.Line2D) for x in l_list])
+
+
+# smoke test
+def test_plot_landscape(tmp_path):
+    rw = np.arange(12.0).reshape(3, 4)
+    scan = ScanResult(["scale", "stretch"], [[1, 2, 3], [0, 1, 2, 3]], rw, rw)
+    fig, ax = plt.subplots()
+    mesh = plotLandscape(scan, ax)
+    assert isinstance(mesh, mpl.collections.QuadMesh)
+    assert ax.get_xlabel() == "stretch"
+    line = plotLandscape(ScanResult(["scale"], [[1, 2, 3]], rw[:, 0], rw))
+    assert isinstance(line, mpl.lines.Line2D)
+    heatmap = tmp_path / "landscape.png"
+    plotLandscape(scan, filename=heatmap)
+    assert heatmap.is_file()
+    scan = ScanResult(["a", "b", "c"], [[1], [1], [1]], rw, rw)
+    with pytest.raises(ValueError):
+        plotLandscape(scan)
+    plt.close("all")
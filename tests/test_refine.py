@@ -6,6 +6,7 @@ import os
 import numpy
 import pytest
 
+from diffpy.pdfmorph import refine
 from diffpy.pdfmorph.morph_helpers.transformpdftordf import (
     TransformXtalPDFtoRDF,
 )
@@ -13,10 +14,22 @@ from diffpy.pdfmorph.morph_helpers.transformrdftopdf import (
     TransformXtalRDFtoPDF,
 )
 from diffpy.pdfmorph.morphs.morphchain import MorphChain
+from diffpy.pdfmorph.morphs.morphfunction import MorphFunction
+from diffpy.pdfmorph.morphs.morphresolution import MorphResolutionDamping
+from diffpy.pdfmorph.morphs.morphrgrid import MorphRGrid
 from diffpy.pdfmorph.morphs.morphscale import MorphScale
+from diffpy.pdfmorph.morphs.morphshape import MorphSphere
+from diffpy.pdfmorph.morphs.morphshift import MorphShift
 from diffpy.pdfmorph.morphs.morphsmear import MorphSmear
 from diffpy.pdfmorph.morphs.morphstretch import MorphStretch
-from diffpy.pdfmorph.refine import Refiner
+from diffpy.pdfmorph.pdfmorph_api import morph_default_config, pdfmorph
+from diffpy.pdfmorph.refine import (
+    RefinementResult,
+    Refiner,
+    _BoundsTransform,
+    default_schedule,
+)
+from diffpy.pdfmorph.tools import get_pearson, getRw
 
 # useful variables
 thisfile = locals().get("__file__", "file.py")
@@ -82,6 +95,651 @@ class TestRefine:
         pytest.approx(chain.stretch, 0.1, 2)
         return
 
+    @pytest.mark.parametrize(
+        "backend, options",
+        [
+            ("leastsq", {}),
+            ("least_squares", {}),
+            ("trf", {"diff_step": 1e-6}),
+            ("dogbox", {}),
+            ("lm", {"x_scale": 1.0}),
+            ("minimize", {}),
+            ("nelder-mead", {"options": {"xatol": 1e-8, "fatol": 1e-12}}),
+            ("L-BFGS-B", {}),
+            ("broyden", {"refresh": 2}),
+        ],
+    )
+    def test_backend(self, setup, backend, options):
+        """refine with each optimizer backend"""
+        config = {"scale": 1.0}
+        mscale = MorphScale(config)
+        refiner = Refiner(
+            mscale, self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        refiner.backend = backend
+        refiner.backend_options = options
+        cost = refiner.refine()
+
+        assert numpy.isclose(config["scale"], 3.0, atol=1e-4)
+        result = refiner.result
+        assert isinstance(result, RefinementResult)
+        assert result.success
+        assert result.cost == cost
+        assert numpy.isclose(result.x[0], config["scale"])
+        assert result.nfev > 0
+        assert result.time >= 0
+        assert result.message
+        return
+
+    @pytest.mark.parametrize(
+        "backend", ["leastsq", "trf", "lm", "nelder-mead", "bfgs", "broyden"]
+    )
+    def test_bounds(self, setup, backend):
+        """refined parameters stay within the bounds"""
+        config = {"scale": 1.0, "radius": 1.0}
+        chain = MorphChain(config, MorphScale(), MorphSphere())
+        assert chain.parbounds == {"radius": (0, None)}
+        y_target = (
+            3
+            * MorphSphere({"radius": 2.0})(
+                self.x_morph, self.y_morph, self.x_target, self.y_target
+            )[1]
+        )
+        refiner = Refiner(
+            chain, self.x_morph, self.y_morph, self.x_target, y_target
+        )
+        refiner.backend = backend
+        refiner.bounds = {"scale": (None, 2.5)}
+        radii = []
+        scales = []
+
+        def residual(pvals):
+            rvec = refiner._residual(pvals)
+            radii.append(config["radius"])
+            scales.append(config["scale"])
+            return rvec
+
+        refiner.residual = residual
+        refiner.refine("scale", "radius")
+        assert min(radii) >= 0
+        assert max(scales) <= 2.5
+        assert numpy.isclose(config["scale"], 2.5, atol=1e-3)
+        lower, upper = refiner.parameter_bounds()
+        assert numpy.array_equal(lower, [-numpy.inf, 0])
+        assert numpy.array_equal(upper, [2.5, numpy.inf])
+        return
+
+    def test_bounds_transform(self):
+        """check the transform of bounded parameters"""
+        lower = [-numpy.inf, 0, -numpy.inf, -1]
+        upper = [numpy.inf, numpy.inf, 2, 3]
+        transform = _BoundsTransform(lower, upper)
+        x = numpy.array([-5.0, 1.5, 1.0, 0.5])
+        u = transform.internal(x)
+        assert numpy.allclose(transform.external(u), x)
+        # derivatives against finite differences
+        h = 1e-6
+        dx = (transform.external(u + h) - transform.external(u - h)) / 2 / h
+        assert numpy.allclose(transform.derivative(u), dx)
+        # any internal value maps within the bounds
+        for u in numpy.linspace(-10, 10, 21):
+            x = transform.external(numpy.full(4, u))
+            assert numpy.all(x >= lower) and numpy.all(x <= upper)
+        # values outside or on the bounds start inside
+        x = transform.external(transform.internal([0, -1, 5, 3]))
+        assert numpy.allclose(x, [0, 0, 2, 3], atol=1e-3)
+        assert numpy.all(transform.derivative(transform.internal(x)) != 0)
+        return
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_multistart(self, processes):
+        """multi-start refinement escapes a local minimum"""
+        x = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = 2 * numpy.interp(x / 1.1, x, y_morph)
+        config = {"scale": 1.0, "stretch": -0.05}
+        chain = MorphChain(config, MorphScale(), MorphStretch())
+        refiner = Refiner(chain, x, y_morph, x, y_target)
+        ms = refiner.multistart(
+            8,
+            "scale",
+            "stretch",
+            ranges={"stretch": (-0.2, 0.2)},
+            processes=processes,
+            seed=1,
+        )
+        # the current values are the first start, which is a local minimum
+        assert numpy.allclose(ms.starts[0], [1.0, -0.05])
+        assert ms.starts.shape == (9, 2)
+        assert numpy.all(ms.starts[1:, 1] >= -0.2)
+        assert numpy.all(ms.starts[1:, 1] <= 0.2)
+        assert ms.costs[0] > 1
+        assert ms.cost == ms.costs.min() < 1e-10
+        assert numpy.allclose(ms.x, [2.0, 0.1])
+        assert numpy.allclose([config["scale"], config["stretch"]], ms.x)
+        assert refiner.result is ms.best
+        assert numpy.all(ms.spread > 0)
+        assert numpy.allclose(chain.y_morph_out, chain.y_target_out)
+        return
+
+    def test_multistart_error(self):
+        """a failed serial multi-start releases the refiner"""
+        x = numpy.arange(0.01, 10, 0.01)
+        config = {"scale": 1.0}
+        chain = MorphChain(config, MorphScale())
+        refiner = Refiner(chain, x, x, x, x)
+
+        def residual(pvals):
+            raise RuntimeError("failed start")
+
+        refiner.residual = residual
+        with pytest.raises(RuntimeError):
+            refiner.multistart(2, "scale", processes=1)
+        assert refine._worker_refiner is None
+        return
+
+    def test_pyramid(self):
+        """coarse-to-fine refinement converges to the full grid solution"""
+        x = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = 2 * numpy.interp(x / 1.02, x, y_morph)
+        pars = {}
+        for pyramid in (None, (8, 2)):
+            config = {
+                "rmin": None,
+                "rmax": None,
+                "rstep": None,
+                "scale": 1.0,
+                "stretch": 0.0,
+            }
+            chain = MorphChain(
+                config, MorphRGrid(), MorphScale(), MorphStretch()
+            )
+            refiner = Refiner(chain, x, y_morph, x, y_target)
+            refiner.pyramid = pyramid
+            refiner.refine("scale", "stretch")
+            pars[pyramid] = [config["scale"], config["stretch"]]
+            # the full resolution grid is left in place
+            assert numpy.isclose(config["rstep"], 0.01)
+            assert "rfilter" not in config
+        assert numpy.allclose(pars[None], [2.0, 0.02], atol=1e-6)
+        assert numpy.allclose(pars[(8, 2)], pars[None])
+        return
+
+    @pytest.mark.parametrize("backend", ["leastsq", "lm", "nelder-mead"])
+    def test_pearson(self, backend):
+        """pearson refinement uses a single residual"""
+        x = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = 2 * numpy.interp(x / 1.02, x, y_morph)
+        config = {"scale": 1.0, "stretch": 0.0}
+        chain = MorphChain(config, MorphScale(), MorphStretch())
+        refiner = Refiner(chain, x, y_morph, x, y_target)
+        refiner.residual = refiner._pearson
+        refiner.backend = backend
+        assert refiner._pearson([1.0, 0.0]).shape == (1,)
+        cost = refiner.refine("scale", "stretch")
+        # the correlation does not depend on the scale
+        assert numpy.isclose(config["stretch"], 0.02, atol=1e-4)
+        assert numpy.isclose(cost, numpy.exp(-2), atol=1e-6)
+        if backend != "nelder-mead":
+            assert refiner.result.backend != backend
+        # the added pearson residual is a single weighted term
+        refiner.residual = refiner._add_pearson
+        res = refiner._add_pearson([2.0, 0.02])
+        assert res.shape == (len(x) + 1,)
+        assert numpy.isclose(res[-1], len(x) ** 0.5 * numpy.exp(-1))
+        refiner.refine("scale", "stretch")
+        assert numpy.allclose([config["scale"], config["stretch"]], [2, 0.02])
+        return
+
+    def test_varpro(self):
+        """variable projection solves scale and vshift in closed form"""
+        x = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = 2 * numpy.interp(x / 1.02, x, y_morph) + 0.5
+        config = {"scale": 1.0, "stretch": 0.0, "hshift": 0.0, "vshift": 0.0}
+        chain = MorphChain(config, MorphScale(), MorphStretch(), MorphShift())
+        refiner = Refiner(chain, x, y_morph, x, y_target)
+        refiner.varpro = True
+        refiner.cachesize = 0
+        morph = chain.morph
+        runs = []
+
+        def counted(*args):
+            runs.append(dict(config))
+            return morph(*args)
+
+        chain.morph = counted
+        cost = refiner.refine("scale", "stretch", "vshift")
+        chain.morph = morph
+        # one run of the chain per evaluation, besides the final ones
+        assert len(runs) == refiner._nfev + 2
+        assert all(c["scale"] == 1 and c["vshift"] == 0 for c in runs[:-1])
+        assert numpy.isclose(cost, 0, atol=1e-12)
+        assert numpy.allclose(refiner.result.x, [2, 0.02, 0.5])
+        assert numpy.allclose(
+            [config["scale"], config["stretch"], config["vshift"]],
+            [2, 0.02, 0.5],
+        )
+        assert numpy.allclose(chain.y_morph_out, chain.y_target_out)
+        assert refiner.residual == refiner._residual
+        # only linear parameters need no optimizer
+        config.update(scale=1.0, vshift=0.0)
+        refiner.refine("scale", "vshift")
+        assert refiner.result.backend == "varpro"
+        assert refiner.result.nfev == 1
+        assert numpy.allclose([config["scale"], config["vshift"]], [2, 0.5])
+        return
+
+    def test_cache(self):
+        """evaluations at the same parameter values share one chain run"""
+        x = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = 2 * numpy.interp(x / 1.02, x, y_morph)
+        runs = {}
+        for cachesize in [0, 4]:
+            config = {"scale": 1.0, "stretch": 0.0}
+            chain = MorphChain(config, MorphScale(), MorphStretch())
+            refiner = Refiner(chain, x, y_morph, x, y_target)
+            refiner.cachesize = cachesize
+            refiner.residual = refiner._add_pearson
+            morph = chain.morph
+            runs[cachesize] = 0
+
+            def counted(*args):
+                runs[cachesize] += 1
+                return morph(*args)
+
+            chain.morph = counted
+            refiner.refine("scale", "stretch")
+            # the chain is left at the solution
+            y_out = chain.y_morph_out
+            assert numpy.array_equal(y_out, morph(x, y_morph, x, y_target)[1])
+            assert not refiner._cache
+        # leastsq evaluates the initial values twice
+        assert runs[4] < runs[0]
+        xyallout = refiner._evaluate([2.0, 0.02])
+        assert refiner._evaluate([2.0, 0.02]) is xyallout
+        assert refiner._evaluate([2.0, 0.01]) is not xyallout
+        assert config["stretch"] == 0.01
+        refiner.clear_cache()
+        assert refiner._evaluate([2.0, 0.02]) is not xyallout
+        return
+
+    @pytest.mark.parametrize("backend", ["leastsq", "trf", "nelder-mead"])
+    def test_budgets(self, backend):
+        """refinements stop at budgets with the best values found"""
+        x = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = 2 * numpy.interp(x / 1.02, x, y_morph)
+        config = {"scale": 1.0, "stretch": 0.0}
+        chain = MorphChain(config, MorphScale(), MorphStretch())
+        refiner = Refiner(chain, x, y_morph, x, y_target)
+        refiner.backend = backend
+        refiner.max_nfev = 5
+        cost = refiner.refine("scale", "stretch")
+        result = refiner.result
+        assert result.stopped == result.status == "max_nfev"
+        assert not result.success
+        assert result.nfev == 5
+        assert numpy.allclose([config["scale"], config["stretch"]], result.x)
+        rvec = refiner._residual(result.x)
+        assert numpy.isclose(cost, numpy.dot(rvec, rvec))
+        assert numpy.isclose(cost, result.cost)
+        # stop at the first evaluation after the deadline
+        refiner.max_nfev = None
+        refiner.time_limit = 0
+        refiner.refine("scale", "stretch", scale=1.0, stretch=0.0)
+        assert refiner.result.stopped == "time_limit"
+        assert refiner.result.nfev == 1
+        # stop once Rw is good enough
+        refiner.time_limit = None
+        refiner.rw_target = 0.05
+        refiner.refine("scale", "stretch", scale=1.0, stretch=0.0)
+        assert refiner.result.stopped == "rw_target"
+        assert refiner.result.success
+        assert 0 < getRw(chain) <= 0.05
+        # the budgets cover all stages of a schedule
+        refiner.rw_target = None
+        refiner.max_nfev = 5
+        evaluations = []
+        refiner.callback = lambda *args: evaluations.append(args)
+        schedule = [{"pars": ["scale"]}, {}]
+        refiner.refine_schedule(
+            schedule, "scale", "stretch", scale=1.0, stretch=0.0
+        )
+        assert len(evaluations) == 5
+        assert refiner.result.stopped == "max_nfev"
+        # and a multi-start refinement in the same block
+        refiner.max_nfev = None
+        refiner.refine("scale", scale=1.0, stretch=0.0)
+        refiner.max_nfev = refiner.result.nfev + 10
+        evaluations.clear()
+        with refiner.budget():
+            refiner.refine_schedule(
+                schedule[:1], "scale", "stretch", scale=1.0, stretch=0.0
+            )
+            assert refiner.result.stopped is None
+            refiner.multistart(4, "scale", "stretch", processes=1, seed=0)
+        assert len(evaluations) == refiner.max_nfev
+        refiner.callback = None
+        # Rw of a cached evaluation comes from its own outputs
+        refiner.residual = refiner._add_pearson
+        refiner.pars = ["scale", "stretch"]
+        rvec = refiner.residual([1.0, 0.0])
+        rw = getRw(chain)
+        refiner.residual([2.0, 0.02])
+        assert refiner.residual([1.0, 0.0]) == pytest.approx(rvec)
+        assert refiner._rw(rvec) == pytest.approx(rw)
+        return
+
+    def test_schedule(self):
+        """schedules refine parameter subsets in stages"""
+        x = numpy.arange(0.01, 10, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = 2 * numpy.interp(x / 1.02, x, y_morph)
+        config = {
+            "rmin": None,
+            "rmax": None,
+            "rstep": None,
+            "scale": 1.0,
+            "stretch": 0.0,
+        }
+        chain = MorphChain(config, MorphRGrid(), MorphScale(), MorphStretch())
+        refiner = Refiner(chain, x, y_morph, x, y_target)
+        schedule = [
+            {"pars": ["scale", "smear"], "backend": "nelder-mead"},
+            {"pars": ["stretch"], "coarsen": 4},
+            {"pars": ["smear"]},
+        ]
+        refiner.refine_schedule(schedule, "scale", "stretch")
+        # the last stage refining a given parameter is the second one
+        assert list(refiner.pars) == ["stretch"]
+        assert numpy.isclose(config["stretch"], 0.02, atol=1e-3)
+        assert numpy.isclose(config["rstep"], 0.01)
+        assert "rfilter" not in config
+        assert refiner.backend == "leastsq"
+        refiner.refine_schedule("shape", "scale", "stretch")
+        assert numpy.allclose([config["scale"], config["stretch"]], [2, 0.02])
+        with pytest.raises(ValueError):
+            refiner.refine_schedule("unknown")
+        with pytest.raises(ValueError):
+            refiner.refine_schedule([{"params": ["scale"]}])
+        assert default_schedule(["scale", "stretch"]) == "default"
+        assert default_schedule(["scale", "smear"]) == "smear"
+        assert default_schedule(["smear", "radius"]) == "smear"
+        assert default_schedule(["scale", "radius"]) == "default"
+        assert default_schedule(["scale", "rsmear"]) == "default"
+        return
+
+    def test_broyden(self):
+        """Broyden updates save evaluations of the jacobian"""
+        x = numpy.arange(0.01, 20, 0.01)
+        y_morph = numpy.sin(5 * x) * numpy.exp(-0.1 * x)
+        y_target = (
+            2
+            * numpy.interp(x / 1.005, x, y_morph)
+            * numpy.exp(-0.5 * (0.02 * x) ** 2)
+        )
+        nfev = {}
+        for backend in ["leastsq", "broyden"]:
+            config = {"scale": 1.0, "stretch": 0.0, "qdamp": 0.01}
+            chain = MorphChain(
+                config, MorphScale(), MorphStretch(), MorphResolutionDamping()
+            )
+            refiner = Refiner(chain, x, y_morph, x, y_target)
+            refiner.backend = backend
+            refiner.refine()
+            assert config["scale"] == pytest.approx(2)
+            assert config["stretch"] == pytest.approx(0.005)
+            assert config["qdamp"] == pytest.approx(0.02)
+            nfev[backend] = refiner.result.nfev
+        assert refiner.result.backend == "broyden"
+        assert refiner.result.status in (1, 2, 4)
+        assert nfev["broyden"] < nfev["leastsq"]
+        refiner.backend_options = {"simplex": True}
+        with pytest.raises(ValueError):
+            refiner.refine()
+        return
+
+    def test_backend_unknown(self, setup):
+        """unsupported backends raise ValueError"""
+        mscale = MorphScale({"scale": 1.0})
+        refiner = Refiner(
+            mscale, self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        refiner.backend = "simplex"
+        with pytest.raises(ValueError):
+            refiner.refine()
+        return
+
+    def test_uncertainties(self):
+        """standard errors come from the covariance at the solution"""
+        x = numpy.arange(0.01, 20, 0.01)
+        y_morph = numpy.sin(5 * x)
+        sigma = 0.05
+        rng = numpy.random.default_rng(0)
+        y_target = 2 * y_morph + sigma * rng.normal(size=len(x))
+        # the scale of a linear model has the standard error of the noise
+        # divided by the norm of the model
+        expected = sigma / numpy.linalg.norm(y_morph)
+        for backend in ["leastsq", "trf", "lm", "bfgs", "l-bfgs-b", "broyden"]:
+            refiner = Refiner(
+                MorphScale({"scale": 1.0}), x, y_morph, x, y_target
+            )
+            refiner.backend = backend
+            if backend in ("lm", "broyden"):
+                # refined through the bounds transform
+                refiner.bounds = {"scale": (0, 10)}
+            refiner.refine("scale")
+            stderr, correlation = refiner.uncertainties()
+            assert stderr["scale"] == pytest.approx(expected, rel=0.05)
+            assert correlation == {"scale": {"scale": pytest.approx(1)}}
+            assert refiner.result.stderr == pytest.approx([stderr["scale"]])
+
+        # correlated parameters
+        config = {"scale": 1.0, "vshift": 0.0}
+        chain = MorphChain(config, MorphScale(), MorphShift())
+        refiner = Refiner(chain, x, y_morph + 1, x, y_target + 1)
+        refiner.refine("scale", "vshift")
+        stderr, correlation = refiner.uncertainties()
+        assert set(stderr) == {"scale", "vshift"}
+        assert correlation["scale"]["vshift"] < -0.1
+        assert correlation["scale"]["vshift"] == correlation["vshift"]["scale"]
+
+        # no covariance without a jacobian or with projected parameters
+        refiner.backend = "nelder-mead"
+        refiner.refine("scale", "vshift")
+        assert refiner.result.covariance is None
+        assert refiner.uncertainties() == ({}, {})
+        refiner.backend = "leastsq"
+        refiner.varpro = True
+        refiner.refine("scale", "vshift")
+        assert refiner.uncertainties() == ({}, {})
+        return
+
+    def test_scan(self, tmp_path):
+        """Rw and Pearson landscapes over a parameter grid"""
+
+        def damped_wave(r, y, scale, stretch):
+            return scale * numpy.sin(5 * r * (1 + stretch)) * numpy.exp(-r)
+
+        x = numpy.arange(0.01, 5, 0.01)
+        y_morph = damped_wave(x, None, 1.0, 0.0)
+        y_target = damped_wave(x, None, 1.5, 0.01)
+        config = {"scale": 1.0, "stretch": 0.0}
+        chain = MorphChain(
+            config, MorphFunction(damped_wave, ["scale", "stretch"])
+        )
+        refiner = Refiner(chain, x, y_morph, x, y_target)
+        grid = {
+            "scale": numpy.linspace(1, 2, 11),
+            "stretch": numpy.linspace(-0.02, 0.02, 9),
+        }
+        scan = refiner.scan(grid)
+        assert scan.pars == ["scale", "stretch"]
+        assert scan.rw.shape == scan.pearson.shape == (11, 9)
+        assert scan.best == pytest.approx({"scale": 1.5, "stretch": 0.01})
+        assert scan.rw[5, 6] == pytest.approx(0, abs=1e-10)
+        assert config == {"scale": 1.0, "stretch": 0.0}
+        # compare a grid point with a run of the chain
+        config.update(scale=1.2, stretch=-0.015)
+        chain(x, y_morph, x, y_target)
+        assert scan.rw[2, 1] == pytest.approx(getRw(chain))
+        assert scan.pearson[2, 1] == pytest.approx(get_pearson(chain))
+        # stacked evaluation in chunks of a few points
+        vscan = refiner.scan(grid, vectorized=True, memory=32 * 3 * len(x))
+        assert numpy.allclose(vscan.rw, scan.rw)
+        assert numpy.allclose(vscan.pearson, scan.pearson)
+        assert config == {"scale": 1.2, "stretch": -0.015}
+        # saved grid and landscapes
+        scan.save(tmp_path / "scan.npy")
+        saved = numpy.load(tmp_path / "scan.npy")
+        assert saved.shape == (4, 11, 9)
+        assert numpy.array_equal(saved[0, :, 0], grid["scale"])
+        assert numpy.array_equal(saved[1, 0], grid["stretch"])
+        assert numpy.array_equal(saved[2], scan.rw)
+        assert numpy.array_equal(saved[3], scan.pearson)
+        return
+
+    def test_backend_pdfmorph(self):
+        """pdfmorph passes the backend and its options to the Refiner"""
+        x = numpy.arange(0.01, 5, 0.01)
+        y_target = numpy.sin(10 * x)
+        cfg = morph_default_config(scale=1.0)
+        morph_rv = pdfmorph(
+            x,
+            2 * y_target,
+            x,
+            y_target,
+            backend="least_squares",
+            backend_options={"method": "dogbox"},
+            **cfg,
+        )
+        assert numpy.allclose(0.5, morph_rv["morphed_config"]["scale"])
+        result = morph_rv["result"]
+        assert result.backend == "least_squares"
+        assert result.success
+        morph_rv = pdfmorph(x, 2 * y_target, x, y_target, refine=False, **cfg)
+        assert morph_rv["result"] is None
+        return
+
+    def test_multistart_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph escapes a local minimum with a multi-start refinement"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles(0.1)
+        cfg = morph_default_config(scale=1.0, stretch=-0.05)
+        morph_rv = pdfmorph(
+            x_morph,
+            y_morph,
+            x_target,
+            y_target,
+            multistart=6,
+            multistart_options=dict(
+                ranges={"stretch": (-0.2, 0.2)}, processes=1, seed=0
+            ),
+            **cfg,
+        )
+        assert numpy.isclose(morph_rv["morphed_config"]["stretch"], 0.1)
+        assert numpy.isclose(morph_rv["rw"], 0, atol=1e-6)
+        assert len(morph_rv["multistart"].costs) == 7
+        return
+
+    def test_pyramid_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph refines on a pyramid of grids"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles()
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        morph_rv = pdfmorph(
+            x_morph, y_morph, x_target, y_target, pyramid=[8, 2], **cfg
+        )
+        morphed_cfg = morph_rv["morphed_config"]
+        assert numpy.isclose(morphed_cfg["scale"], 2.0)
+        assert numpy.isclose(morphed_cfg["stretch"], 0.02)
+        assert "rfilter" not in morphed_cfg
+        return
+
+    def test_varpro_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph solves the linear parameters in closed form"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles()
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        morph_rv = pdfmorph(
+            x_morph, y_morph, x_target, y_target, varpro=True, **cfg
+        )
+        morphed_cfg = morph_rv["morphed_config"]
+        assert numpy.isclose(morphed_cfg["scale"], 2.0)
+        assert numpy.isclose(morphed_cfg["stretch"], 0.02)
+        assert numpy.isclose(morph_rv["rw"], 0, atol=1e-6)
+        return
+
+    def test_budgets_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph stops the refinement at a budget"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles()
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        morph_rv = pdfmorph(
+            x_morph, y_morph, x_target, y_target, max_nfev=4, **cfg
+        )
+        result = morph_rv["result"]
+        assert result.stopped == "max_nfev"
+        assert result.nfev == 4
+        assert morph_rv["rw"] > 0.01
+        return
+
+    def test_schedule_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph runs a refinement schedule"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles()
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        schedule = [{"pars": ["stretch"], "coarsen": 4}, {}]
+        morph_rv = pdfmorph(
+            x_morph, y_morph, x_target, y_target, schedule=schedule, **cfg
+        )
+        morphed_cfg = morph_rv["morphed_config"]
+        assert numpy.isclose(morphed_cfg["scale"], 2.0)
+        assert numpy.isclose(morphed_cfg["stretch"], 0.02)
+        with pytest.raises(ValueError):
+            pdfmorph(
+                x_morph, y_morph, x_target, y_target, schedule="unknown", **cfg
+            )
+        return
+
+    def test_uncertainties_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph reports the errors and correlations of the parameters"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles()
+        rng = numpy.random.default_rng(0)
+        y_target += 0.01 * rng.normal(size=len(x_target))
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        morph_rv = pdfmorph(x_morph, y_morph, x_target, y_target, **cfg)
+        stderr = morph_rv["stderr"]
+        assert set(stderr) == {"scale", "stretch"}
+        assert numpy.allclose(stderr["scale"], morph_rv["result"].stderr[0])
+        assert 0 < stderr["stretch"] < 1e-3
+        correlation = morph_rv["correlation"]
+        assert numpy.isclose(correlation["scale"]["scale"], 1)
+        assert -1 < correlation["scale"]["stretch"] < 1
+        return
+
+    def test_scan_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph starts the refinement from the best grid point"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles()
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        scan = {"stretch": numpy.linspace(-0.05, 0.05, 11)}
+        morph_rv = pdfmorph(
+            x_morph, y_morph, x_target, y_target, scan=scan, **cfg
+        )
+        assert morph_rv["scan"].best == pytest.approx({"stretch": 0.02})
+        assert morph_rv["scan"].rw.shape == (11,)
+        assert numpy.isclose(morph_rv["morphed_config"]["scale"], 2.0)
+        assert numpy.isclose(morph_rv["morphed_config"]["stretch"], 0.02)
+        with pytest.raises(ValueError):
+            pdfmorph(
+                x_morph,
+                y_morph,
+                x_target,
+                y_target,
+                scan={"smear": [0]},
+                **cfg,
+            )
+        return
+
 
 # End of class TestRefine
 
@@ -100,7 +758,8 @@ class TestRefineUC:
         self.y_target *= 1.5
         return
 
-    def test_refine(self, setup):
+    @pytest.mark.parametrize("backend", ["leastsq", "least_squares"])
+    def test_refine(self, setup, backend):
         config = {
             "scale": 1.0,
             "stretch": 0,
@@ -120,6 +779,7 @@ class TestRefineUC:
         refiner = Refiner(
             chain, self.x_morph, self.y_morph, self.x_target, self.y_target
         )
+        refiner.backend = backend
 
         # Do this as two-stage fit. First refine amplitude parameters, and then
         # position parameters.
@@ -136,6 +796,92 @@ class TestRefineUC:
         assert rw < 0.01
         return
 
+    def test_broyden(self, setup):
+        """broyden reaches the optimum of leastsq with fewer evaluations"""
+        start = {
+            "scale": 1.0,
+            "stretch": 0.0,
+            "smear": 0.05,
+            "qdamp": 0.01,
+            "baselineslope": -0.5,
+        }
+        costs = {}
+        nfev = {}
+        for backend in ["leastsq", "broyden"]:
+            config = dict(start)
+            chain = MorphChain(
+                config,
+                MorphScale(),
+                MorphStretch(),
+                TransformXtalPDFtoRDF(),
+                MorphSmear(),
+                TransformXtalRDFtoPDF(),
+                MorphResolutionDamping(),
+            )
+            refiner = Refiner(
+                chain, self.x_morph, self.y_morph, self.x_target, self.y_target
+            )
+            refiner.backend = backend
+            costs[backend] = refiner.refine()
+            nfev[backend] = refiner.result.nfev
+            assert refiner.result.success
+        assert costs["broyden"] == pytest.approx(costs["leastsq"], rel=1e-6)
+        assert nfev["broyden"] <= nfev["leastsq"]
+        return
+
+    def test_scan(self, setup):
+        """chains of the built-in morphs are scanned in stacked chunks"""
+        config = {
+            "rmin": 1.0,
+            "rmax": 9.0,
+            "rstep": 0.02,
+            "scale": 1.0,
+            "stretch": 0.0,
+            "hshift": 0.01,
+            "vshift": 0.1,
+            "baselineslope": -4 * numpy.pi * 0.0917132,
+            "smear": 0.0,
+            "qdamp": 0.01,
+            "radius": 15.0,
+        }
+        morphs = [
+            MorphRGrid(),
+            MorphScale(),
+            MorphStretch(),
+            MorphShift(),
+            TransformXtalPDFtoRDF(),
+            MorphSmear(),
+            TransformXtalRDFtoPDF(),
+            MorphResolutionDamping(),
+            MorphSphere(),
+        ]
+        chain = MorphChain(config, *morphs)
+        assert chain.vectorized
+        refiner = Refiner(
+            chain, self.x_morph, self.y_morph, self.x_target, self.y_target
+        )
+        grid = {
+            "scale": numpy.linspace(1.2, 1.8, 4),
+            "stretch": [0.0, 0.002],
+            "smear": [0.0, 0.05, 0.1],
+            "baselineslope": [-1.2, -1.1],
+            "qdamp": [0.0, 0.02],
+            "radius": [10.0, 15.0],
+        }
+        saved = dict(config)
+        scan = refiner.scan(grid, memory=32 * 5 * len(self.x_morph))
+        loop = refiner.scan(grid, vectorized=False)
+        assert config == saved
+        assert numpy.allclose(scan.rw, loop.rw, rtol=1e-10)
+        assert numpy.allclose(scan.pearson, loop.pearson, rtol=1e-10)
+        assert scan.best == loop.best
+        # a morph that does not broadcast runs the chain point by point
+        chain.append(MorphRGrid())
+        chain[-1].vectorized = False
+        assert not chain.vectorized
+        assert numpy.allclose(refiner.scan(grid).rw, loop.rw, rtol=1e-10)
+        return
+
 
 if __name__ == "__main__":
     TestRefine()
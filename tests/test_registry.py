@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+
+import subprocess
+import sys
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph import registry
+from diffpy.pdfmorph.morphs.morph import LABEL_GR, LABEL_RA, Morph
+from diffpy.pdfmorph.morphs.morphsmear import MorphSmear
+from diffpy.pdfmorph.pdfmorph_api import pdfmorph
+
+
+class MorphOffset(Morph):
+    """Add a constant offset to the morph."""
+
+    summary = "Offset morph by a constant"
+    xinlabel = LABEL_RA
+    yinlabel = LABEL_GR
+    xoutlabel = LABEL_RA
+    youtlabel = LABEL_GR
+    parnames = ["offset"]
+
+    def morph(self, x_morph, y_morph, x_target, y_target):
+        Morph.morph(self, x_morph, y_morph, x_target, y_target)
+        self.y_morph_out += self.offset
+        return self.xyallout
+
+
+class TestRegistry:
+    @pytest.fixture
+    def setup(self):
+        self.x = numpy.arange(0.01, 10, 0.01)
+        self.y_morph = numpy.sin(3 * self.x)
+        self.y_target = self.y_morph + 0.3
+        return
+
+    def test_builtins(self):
+        """builtin operations resolve to their morph classes"""
+        names = registry.available_morphs()
+        for name in ["rgrid", "scale", "stretch", "smear", "qdamp"]:
+            assert name in names
+        assert registry.get_morph("smear") is MorphSmear
+        return
+
+    def test_unknown(self):
+        """unknown operations raise ValueError"""
+        with pytest.raises(ValueError):
+            registry.get_morph("nonexistent")
+        return
+
+    def test_register(self, setup):
+        """registered morphs are refined through pdfmorph"""
+        registry.register_morph("offset", MorphOffset)
+        try:
+            assert registry.get_morph("offset") is MorphOffset
+            rv = pdfmorph(
+                self.x,
+                self.y_morph,
+                self.x,
+                self.y_target,
+                offset=0.0,
+                scale=1.0,
+            )
+        finally:
+            registry._registry().pop("offset")
+        assert numpy.isclose(rv["morphed_config"]["offset"], 0.3)
+        assert numpy.isclose(rv["morphed_config"]["scale"], 1.0)
+        assert numpy.isclose(rv["rw"], 0.0, atol=1e-6)
+        return
+
+    def test_lazy_import(self):
+        """importing the api does not import the morph modules"""
+        code = (
+            "import sys\n"
+            "import diffpy.pdfmorph.pdfmorph_api\n"
+            "print('diffpy.pdfmorph.morphs.morphsmear' in sys.modules)\n"
+        )
+        out = subprocess.check_output([sys.executable, "-c", code])
+        assert out.decode().strip() == "False"
+        return
+
+
+# End of class TestRegistry
+
+if __name__ == "__main__":
+    TestRegistry()
+
+# End of file
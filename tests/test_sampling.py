@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph.morph_helpers.transformpdftordf import (
+    TransformXtalPDFtoRDF,
+)
+from diffpy.pdfmorph.morph_helpers.transformrdftopdf import (
+    TransformXtalRDFtoPDF,
+)
+from diffpy.pdfmorph.morphs.morphchain import MorphChain
+from diffpy.pdfmorph.morphs.morphfunction import MorphFunction
+from diffpy.pdfmorph.morphs.morphscale import MorphScale
+from diffpy.pdfmorph.morphs.morphsmear import MorphSmear
+from diffpy.pdfmorph.morphs.morphstretch import MorphStretch
+from diffpy.pdfmorph.refine import Refiner
+from diffpy.pdfmorph.sampling import EnsembleSampler, SamplingResult
+
+
+def damped_wave(r, y, scale, stretch):
+    return scale * numpy.sin(5 * r * (1 + stretch)) * numpy.exp(-0.05 * r)
+
+
+class TestEnsembleSampler:
+    @pytest.fixture
+    def setup(self):
+        self.x = numpy.arange(0.01, 20, 0.02)
+        rng = numpy.random.default_rng(0)
+        self.y_target = damped_wave(self.x, None, 2.0, 0.01)
+        self.y_target += 0.05 * rng.normal(size=len(self.x))
+        self.config = {"scale": 1.0, "stretch": 0.0}
+        chain = MorphChain(
+            self.config, MorphFunction(damped_wave, ["scale", "stretch"])
+        )
+        self.refiner = Refiner(chain, self.x, self.x, self.x, self.y_target)
+        self.refiner.refine("scale", "stretch")
+        return
+
+    def test_sample(self, setup):
+        """the posterior agrees with the covariance of the refinement"""
+        refined = dict(self.config)
+        sampler = EnsembleSampler(self.refiner)
+        sampler.seed = 0
+        result = sampler.sample(400, burn=100, thin=2)
+        assert isinstance(result, SamplingResult)
+        assert result.pars == ["scale", "stretch"]
+        assert result.samples.shape == (150, 16, 2)
+        assert result.logprob.shape == (150, 16)
+        assert result.flat.shape == (2400, 2)
+        assert result.nfev == 16 * 401
+        assert 0.2 < result.acceptance.mean() < 0.9
+        # the config and refined parameters are kept
+        assert self.config == refined
+        assert list(self.refiner.pars) == ["scale", "stretch"]
+        stderr = self.refiner.uncertainties()[0]
+        intervals = result.intervals()
+        for i, p in enumerate(result.pars):
+            assert numpy.std(result.flat[:, i]) == pytest.approx(
+                stderr[p], rel=0.25
+            )
+            lower, median, upper = intervals[p]
+            assert lower < refined[p] < upper
+            assert upper - lower == pytest.approx(2 * stderr[p], rel=0.25)
+        assert result.best == pytest.approx(refined, rel=1e-3)
+        return
+
+    def test_vectorized(self, setup, tmp_path):
+        """batched and parallel evaluations draw the same samples"""
+        samples = []
+        for vectorized, processes in [(False, 1), (True, 1), (True, 2)]:
+            sampler = EnsembleSampler(self.refiner)
+            sampler.seed = 1
+            sampler.nwalkers = 8
+            sampler.vectorized = vectorized
+            sampler.processes = processes
+            result = sampler.sample(20, "scale", "stretch")
+            samples.append(result.samples)
+        assert numpy.allclose(samples[1], samples[0])
+        assert numpy.allclose(samples[2], samples[0])
+        # the batched Pearson residual
+        self.refiner.residual = self.refiner._add_pearson
+        sampler.processes = 1
+        points = result.flat[:5]
+        batched = sampler._costs(points)
+        sampler.vectorized = False
+        assert numpy.allclose(batched, sampler._costs(points))
+        return
+
+    def test_builtin(self, setup, monkeypatch):
+        """chains of the built-in morphs are evaluated in batches"""
+        config = {
+            "scale": 1.0,
+            "stretch": 0.0,
+            "smear": 0.1,
+            "baselineslope": -0.5,
+        }
+        chain = MorphChain(
+            config,
+            MorphScale(),
+            MorphStretch(),
+            TransformXtalPDFtoRDF(),
+            MorphSmear(),
+            TransformXtalRDFtoPDF(),
+        )
+        y_morph = damped_wave(self.x, None, 1.0, 0.0)
+        refiner = Refiner(chain, self.x, y_morph, self.x, self.y_target)
+        refiner.refine("scale", "stretch", "smear")
+        calls = []
+        call = MorphChain.__call__
+
+        def counted(self, *xyall):
+            xyallout = call(self, *xyall)
+            calls.append(numpy.ndim(xyallout[1]))
+            return xyallout
+
+        monkeypatch.setattr(MorphChain, "__call__", counted)
+        samples = []
+        for vectorized in [None, False]:
+            calls.clear()
+            sampler = EnsembleSampler(refiner)
+            sampler.seed = 4
+            sampler.vectorized = vectorized
+            result = sampler.sample(10)
+            samples.append(result.samples)
+            assert result.pars == ["scale", "stretch", "smear"]
+            # stacked walkers or a run of the chain for each
+            assert (2 in calls) == (vectorized is None)
+        assert numpy.allclose(samples[0], samples[1])
+        # residuals without a batched form are evaluated in turn
+        refiner.residual = refiner._projected_residual
+        assert not EnsembleSampler(refiner)._batched()
+        return
+
+    def test_file(self, setup, tmp_path):
+        """samples are stored on disk in chunks"""
+        filename = tmp_path / "samples.npy"
+        sampler = EnsembleSampler(self.refiner)
+        sampler.seed = 2
+        result = sampler.sample(
+            50, "stretch", burn=10, thin=4, filename=filename, chunksize=3
+        )
+        saved = numpy.load(filename)
+        assert saved.shape == (10, 16, 2)
+        assert numpy.array_equal(saved[:, :, 0], result.samples[:, :, 0])
+        assert numpy.array_equal(saved[:, :, 1], result.logprob)
+        return
+
+    def test_bounds(self, setup):
+        """walkers stay within the parameter bounds"""
+        self.refiner.bounds = {"scale": (None, 1.999)}
+        sampler = EnsembleSampler(self.refiner)
+        sampler.seed = 3
+        result = sampler.sample(50, "scale", "stretch")
+        assert result.flat[:, 0].max() <= 1.999
+        assert numpy.isfinite(result.logprob).all()
+        return
+
+    def test_errors(self, setup):
+        """invalid ensembles raise ValueError"""
+        sampler = EnsembleSampler(self.refiner)
+        sampler.nwalkers = 7
+        with pytest.raises(ValueError):
+            sampler.sample(10, "scale", "stretch")
+        sampler.nwalkers = 2
+        with pytest.raises(ValueError):
+            sampler.sample(10, "scale", "stretch")
+        sampler.nwalkers = 8
+        with pytest.raises(ValueError):
+            sampler.sample(10, "scale", "stretch", initial=numpy.ones((4, 2)))
+        assert sampler.variance is None
+        # the Pearson residual cannot estimate its variance
+        self.refiner.residual = self.refiner._pearson
+        with pytest.raises(ValueError):
+            sampler.sample(10, "scale", "stretch")
+        sampler.variance = 1e-4
+        sampler.sample(2, "scale", "stretch")
+        sampler.variance = None
+        self.refiner.residual = self.refiner._residual
+        self.refiner.bounds = {"scale": (5, 10)}
+        with pytest.raises(ValueError):
+            sampler.sample(
+                10, "scale", "stretch", initial=numpy.full((8, 2), 20.0)
+            )
+        return
+
+
+# End of class TestEnsembleSampler
+
+if __name__ == "__main__":
+    TestEnsembleSampler()
+
+# End of file
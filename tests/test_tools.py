@@ -5,12 +5,14 @@
 
 
 import os
+import warnings
 from pathlib import Path
 
 import numpy
 import pytest
 
 import diffpy.pdfmorph.tools as tools
+from diffpy.pdfmorph.pdfmorph_api import morph_default_config, pdfmorph
 
 # useful variables
 thisfile = locals().get("__file__", "file.py")
@@ -44,6 +46,101 @@ class TestTools:
         assert x, scale
         return
 
+    def test_estimateInitial(self, setup):
+        """check the initial parameter estimates on a morphed nickel PDF"""
+        r = self.x_morph
+        y = self.y_morph
+        # stretched, damped and scaled target
+        target = 0.8 * numpy.interp(r / 0.98, r, y)
+        target *= numpy.exp(-0.5 * (0.05 * r) ** 2)
+        est = tools.estimateStretch(r, y, numpy.interp(r / 0.98, r, y))
+        assert est == pytest.approx(-0.02, abs=1e-3)
+        estimates = tools.estimateInitial(
+            r, y, r, target, ["scale", "stretch", "qdamp", "baselineslope"]
+        )
+        assert set(estimates) == {"scale", "stretch", "qdamp"}
+        assert estimates["stretch"] == pytest.approx(-0.02, abs=1e-3)
+        assert estimates["qdamp"] == pytest.approx(0.05, rel=0.05)
+        assert estimates["scale"] == pytest.approx(0.8, rel=0.02)
+        # Gaussian smear of the profile
+        n = 2 * len(r)
+        q = 2 * numpy.pi * numpy.fft.rfftfreq(n, r[1] - r[0])
+        smeared = numpy.fft.rfft(y, n) * numpy.exp(-0.5 * (0.1 * q) ** 2)
+        smeared = numpy.fft.irfft(smeared, n)[: len(r)]
+        assert tools.estimateSmear(r, y, smeared) == pytest.approx(0.1, 0.05)
+        assert tools.estimateSmear(r, y, y) == pytest.approx(0, abs=1e-6)
+        # spherical particle envelope
+        x = r / 24.0
+        sphere = y * (1 - 1.5 * x + 0.5 * x**3)
+        assert tools.estimateRadius(r, y, sphere) == pytest.approx(12, 0.1)
+        return
+
+    def test_estimateInitial_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph starts from the estimates with auto_init"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles(0.06)
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        morph_rv = pdfmorph(
+            x_morph, y_morph, x_target, y_target, auto_init=True, **cfg
+        )
+        assert numpy.isclose(morph_rv["morphed_config"]["scale"], 2.0)
+        assert numpy.isclose(morph_rv["morphed_config"]["stretch"], 0.06)
+        return
+
+    def test_estimateInitial_sphere(self):
+        """check the radius estimate on a nanoparticle PDF"""
+        morph_file = os.path.join(testdata_dir, "ni_qmax25.cgr")
+        target_file = os.path.join(testdata_dir, "ni_qmax25_psize35.cgr")
+        r, y_morph = numpy.loadtxt(morph_file, unpack=True)
+        y_target = numpy.loadtxt(target_file, usecols=1)
+        # the target vanishes beyond its diameter
+        assert numpy.all(y_target[r > 35] == 0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            radius = tools.estimateRadius(r, y_morph, y_target)
+            estimates = tools.estimateInitial(
+                r, y_morph, r, y_target, ["scale", "qdamp", "radius"]
+            )
+        assert radius == pytest.approx(17.5, rel=0.02)
+        assert estimates["radius"] == pytest.approx(17.5, rel=0.02)
+        assert estimates["qdamp"] < 0.01
+        assert estimates["scale"] == pytest.approx(1, rel=0.02)
+        return
+
+    def test_readQmax(self):
+        """check readQmax() on the headers of the test data"""
+        qmax_file = os.path.join(testdata_dir, "ni_qmax25.cgr")
+        assert tools.readQmax(qmax_file) == 25
+        # the qmax entry is not numerical
+        no_qmax_file = os.path.join(testdata_dir, "nickel_ss0.01.cgr")
+        assert tools.readQmax(no_qmax_file) is None
+        sequence_file = os.path.join(testsequence_dir, "a_210K.gr")
+        assert tools.readQmax(sequence_file) > 0
+        return
+
+    def test_readSchedule(self, tmp_path):
+        """check readSchedule()"""
+        fname = tmp_path / "schedule.json"
+        fname.write_text('[{"pars": ["scale"], "coarsen": 4}, {}]')
+        schedule = tools.readSchedule(fname)
+        assert schedule == [{"pars": ["scale"], "coarsen": 4}, {}]
+        fname.write_text('{"pars": ["scale"]}')
+        with pytest.raises(ValueError):
+            tools.readSchedule(fname)
+        return
+
+    def test_pearsonCoefficient(self, setup):
+        """check pearsonCoefficient()"""
+        from scipy.stats import pearsonr
+
+        x = numpy.arange(0.01, 10, 0.01)
+        y1 = numpy.sin(5 * x)
+        y2 = 2 * numpy.sin(5 * x + 0.3) + 1
+        pcc = tools.pearsonCoefficient(y1, y2)
+        assert numpy.isclose(pcc, pearsonr(y1, y2)[0])
+        assert numpy.isclose(tools.pearsonCoefficient(y1, 1 - 3 * y1), -1)
+        assert numpy.isnan(tools.pearsonCoefficient(y1, numpy.ones_like(x)))
+        return
+
     def test_nn_value(self, setup):
         import random
 
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+
+import json
+
+import numpy
+import pytest
+
+from diffpy.pdfmorph.morphs.morphchain import MorphChain
+from diffpy.pdfmorph.morphs.morphscale import MorphScale
+from diffpy.pdfmorph.morphs.morphstretch import MorphStretch
+from diffpy.pdfmorph.pdfmorph_api import morph_default_config, pdfmorph
+from diffpy.pdfmorph.refine import Refiner
+from diffpy.pdfmorph.trace import TraceRecorder
+
+
+class TestTraceRecorder:
+    @pytest.fixture
+    def setup(self):
+        self.x = numpy.arange(0.01, 10, 0.01)
+        self.y_morph = numpy.sin(5 * self.x) * numpy.exp(-0.1 * self.x)
+        self.y_target = 2 * numpy.interp(self.x / 1.02, self.x, self.y_morph)
+        config = {"scale": 1.0, "stretch": 0.0}
+        self.chain = MorphChain(config, MorphScale(), MorphStretch())
+        self.refiner = Refiner(
+            self.chain, self.x, self.y_morph, self.x, self.y_target
+        )
+        return
+
+    def test_probes(self, setup):
+        """jacobian probes are told apart from steps"""
+        for backend in ["leastsq", "trf", "lm"]:
+            self.chain.config.update(scale=1.0, stretch=0.0)
+            recorder = TraceRecorder()
+            self.refiner.callback = recorder
+            self.refiner.backend = backend
+            self.refiner.refine("scale", "stretch")
+            records = list(recorder.records)
+            assert recorder.nfev == len(records)
+            assert records[-1]["nfev"] == len(records)
+            assert recorder.nprobes == sum(r["probe"] for r in records)
+            # two probes for each finite difference jacobian
+            assert recorder.nprobes % 2 == 0
+            assert recorder.nfev - recorder.nprobes >= recorder.nprobes / 2
+            if backend != "leastsq":
+                assert recorder.nfev == self.refiner.result.nfev * 3
+            assert not records[0]["probe"]
+            assert set(records[0]["pars"]) == {"scale", "stretch"}
+            times = [r["time"] for r in records]
+            assert times == sorted(times)
+            costs = [r["cost"] for r in records if not r["probe"]]
+            assert min(costs) == pytest.approx(0, abs=1e-10)
+        return
+
+    def test_bounds(self, setup):
+        """parameters are recorded outside of the bounds transform"""
+        recorder = TraceRecorder()
+        self.refiner.callback = recorder
+        self.refiner.bounds = {"scale": (0, 10)}
+        self.refiner.refine("scale", "stretch")
+        assert recorder.records[0]["pars"]["scale"] == pytest.approx(1)
+        assert recorder.records[-1]["pars"]["scale"] == pytest.approx(2)
+        return
+
+    def test_file(self, setup, tmp_path):
+        """records are kept in a ring buffer and appended to a file"""
+        filename = tmp_path / "trace.jsonl"
+        recorder = TraceRecorder(maxlen=3, filename=filename, label="a")
+        self.refiner.callback = recorder
+        self.refiner.refine("scale", "stretch")
+        assert len(recorder.records) == 3
+        with open(filename) as infile:
+            records = [json.loads(line) for line in infile]
+        assert len(records) == recorder.nfev
+        assert records[-3:] == list(recorder.records)
+        assert all(r["label"] == "a" for r in records)
+        return
+
+    def test_pdfmorph(self, sin_exp_profiles):
+        """pdfmorph passes the callback to the Refiner"""
+        x_morph, y_morph, x_target, y_target = sin_exp_profiles()
+        cfg = morph_default_config(scale=1.0, stretch=0.0)
+        recorder = TraceRecorder()
+        pdfmorph(
+            x_morph, y_morph, x_target, y_target, callback=recorder, **cfg
+        )
+        assert recorder.nfev > recorder.nprobes > 0
+        assert recorder.records[-1]["pars"]["stretch"] == pytest.approx(0.02)
+        return
+
+
+# End of class TestTraceRecorder
+
+if __name__ == "__main__":
+    TestTraceRecorder()
+
+# End of file